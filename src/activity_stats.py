@@ -0,0 +1,195 @@
+"""
+Per-user activity counters.
+
+UserStats holds one row per user with the numbers shown on profiles. Mapper
+events on Message, Reaction and Thread adjust the row in the same
+transaction as the write that changed them, so reading the stats is a
+primary-key lookup. Bulk Query.delete() and raw SQL skip the events, so
+the counters drift until `flask rebuild-activity-stats` recomputes them.
+
+The distinct counters (channels_joined, threads_participated) cannot be
+decided row by row: one flush may insert or delete several rows for the
+same user and channel, and each row's event would see its siblings. The
+mapper events only record which (user, channel) and (user, thread) keys
+changed, and an after_flush hook applies one 0 <-> 1 transition per key.
+"""
+import logging
+from sqlalchemy import event, orm, text
+
+COUNTERS = ('message_count', 'reaction_count', 'thread_count', 'channels_joined', 'threads_participated')
+
+class ActivityStats:
+    def __init__(self):
+        self.db = None
+
+    def init_app(self, app, db):
+        from models import User, Message, Reaction, Thread, UserStats
+
+        self.db = db
+        # Users who were active before user_stats existed would otherwise count from zero
+        if UserStats.query.first() is None and User.query.first() is not None:
+            logging.info(f"Backfilled activity stats for {self.rebuild()} users")
+
+        event.listen(User, 'after_insert', self._on_user_insert)
+        event.listen(Message, 'after_insert', self._on_message_insert)
+        event.listen(Message, 'after_delete', self._on_message_delete)
+        event.listen(Reaction, 'after_insert', self._on_reaction_insert)
+        event.listen(Reaction, 'after_delete', self._on_reaction_delete)
+        event.listen(Thread, 'after_insert', self._on_thread_insert)
+        event.listen(Thread, 'after_delete', self._on_thread_delete)
+        event.listen(orm.Session, 'before_flush', self._on_before_flush)
+        event.listen(orm.Session, 'after_flush', self._on_after_flush)
+
+        @app.cli.command('rebuild-activity-stats')
+        def rebuild_activity_stats_command():
+            """Recompute every user's activity counters from the message, reaction and thread tables."""
+            count = self.rebuild()
+            print(f"Rebuilt activity stats for {count} users")
+
+    def get(self, user_id):
+        from models import UserStats
+
+        stats = self.db.session.get(UserStats, user_id)
+        return {counter: getattr(stats, counter) if stats else 0 for counter in COUNTERS}
+
+    def _ensure_row(self, connection, user_id):
+        # Users created before this table existed get their row on first activity
+        from models import UserStats
+
+        insert_ignore(connection, UserStats.__table__, {'user_id': user_id, **dict.fromkeys(COUNTERS, 0)}, ['user_id'])
+
+    def _adjust(self, connection, user_id, **deltas):
+        if user_id is None:
+            return
+        deltas = {counter: delta for counter, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        self._ensure_row(connection, user_id)
+        assignments = ', '.join(f"{counter} = {counter} + :{counter}" for counter in deltas)
+        connection.execute(
+            text(f"UPDATE user_stats SET {assignments} WHERE user_id = :user_id"),
+            {'user_id': user_id, **deltas}
+        )
+
+    def _on_user_insert(self, mapper, connection, target):
+        self._ensure_row(connection, target.id)
+
+    def _on_message_insert(self, mapper, connection, target):
+        self._adjust(connection, target.user_id, message_count=1)
+        record_distinct_change(target, DISTINCT_CHANGES_KEY, 'channels_joined', (target.user_id, target.channel_id), 1)
+
+    def _on_message_delete(self, mapper, connection, target):
+        self._adjust(connection, target.user_id, message_count=-1)
+        record_distinct_change(target, DISTINCT_CHANGES_KEY, 'channels_joined', (target.user_id, target.channel_id), -1)
+
+    def record_reaction(self, connection, user_id, delta):
+        """Count a reaction added (+1) or removed (-1) with Core statements, which skip the mapper events"""
+        self._adjust(connection, user_id, reaction_count=delta)
+
+    def _on_reaction_insert(self, mapper, connection, target):
+        self.record_reaction(connection, target.user_id, 1)
+
+    def _on_reaction_delete(self, mapper, connection, target):
+        self.record_reaction(connection, target.user_id, -1)
+
+    def _on_thread_insert(self, mapper, connection, target):
+        self._adjust(connection, target.user_id, thread_count=1)
+        record_distinct_change(target, DISTINCT_CHANGES_KEY, 'threads_participated', (target.user_id, target.message_id), 1)
+
+    def _on_thread_delete(self, mapper, connection, target):
+        self._adjust(connection, target.user_id, thread_count=-1)
+        record_distinct_change(target, DISTINCT_CHANGES_KEY, 'threads_participated', (target.user_id, target.message_id), -1)
+
+    def _on_before_flush(self, session, flush_context, instances):
+        # Changes recorded by a flush that failed were rolled back with it
+        session.info.pop(DISTINCT_CHANGES_KEY, None)
+
+    def _on_after_flush(self, session, flush_context):
+        changes = session.info.pop(DISTINCT_CHANGES_KEY, None)
+        if not changes:
+            return
+        connection = session.connection()
+        queries = {
+            'channels_joined': "message WHERE user_id = :a AND channel_id = :b",
+            'threads_participated': "thread WHERE user_id = :a AND message_id = :b",
+        }
+        for (counter, (user_id, other_id)), (inserted, deleted) in changes.items():
+            delta = distinct_delta(connection, queries[counter], {'a': user_id, 'b': other_id}, inserted, deleted)
+            self._adjust(connection, user_id, **{counter: delta})
+
+    def rebuild(self):
+        """Recompute all rows from scratch; returns the number of users"""
+        try:
+            self.db.session.execute(text("DELETE FROM user_stats"))
+            result = self.db.session.execute(text(
+                'INSERT INTO user_stats (user_id, message_count, reaction_count, thread_count, '
+                'channels_joined, threads_participated) '
+                'SELECT u.id, '
+                '(SELECT COUNT(*) FROM message m WHERE m.user_id = u.id), '
+                '(SELECT COUNT(*) FROM reaction r WHERE r.user_id = u.id), '
+                '(SELECT COUNT(*) FROM thread t WHERE t.user_id = u.id), '
+                '(SELECT COUNT(DISTINCT m.channel_id) FROM message m WHERE m.user_id = u.id), '
+                '(SELECT COUNT(DISTINCT t.message_id) FROM thread t WHERE t.user_id = u.id) '
+                'FROM "user" u'
+            ))
+            self.db.session.commit()
+            return result.rowcount
+        except Exception as e:
+            logging.error(f"Error rebuilding activity stats: {str(e)}")
+            self.db.session.rollback()
+            raise
+
+DISTINCT_CHANGES_KEY = 'activity_stats_distinct_changes'
+
+def dialect_insert(connection):
+    """The dialect's insert() with ON CONFLICT support, or None where there is none"""
+    dialect = connection.dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        return insert
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+        return insert
+    return None
+
+def insert_ignore(connection, table, values, conflict_columns):
+    """INSERT ... ON CONFLICT DO NOTHING; returns the number of rows inserted"""
+    insert = dialect_insert(connection)
+    if insert is not None:
+        statement = insert(table).values(**values).on_conflict_do_nothing(index_elements=conflict_columns)
+        return connection.execute(statement).rowcount
+    # Other databases: rely on the unique constraint
+    try:
+        with connection.begin_nested():
+            return connection.execute(table.insert().values(**values)).rowcount
+    except Exception:
+        return 0
+
+def record_distinct_change(target, info_key, counter, key, delta):
+    """
+    Note a row of ``key`` inserted (+1) or deleted (-1) in the flush under
+    way, under ``info_key`` of the session's info so each consumer's
+    after_flush hook only sees its own changes.
+    """
+    session = orm.object_session(target)
+    if session is None:
+        return
+    counts = session.info.setdefault(info_key, {}).setdefault((counter, key), [0, 0])
+    counts[0 if delta > 0 else 1] += 1
+
+def distinct_delta(connection, rows_sql, params, inserted, deleted):
+    """
+    Change in "does ``rows_sql`` match any row" caused by a flush that
+    inserted ``inserted`` and deleted ``deleted`` of those rows: 1, -1 or 0.
+    Called after the flush, so the rows counted are the new state. The count
+    stops at inserted + 1, which is enough to tell whether rows existed before.
+    """
+    cap = inserted + 1
+    after = connection.execute(
+        text(f"SELECT COUNT(*) FROM (SELECT 1 FROM {rows_sql} LIMIT :cap) AS matched"),
+        {**params, 'cap': cap}
+    ).scalar()
+    before = after - inserted + deleted
+    return int(after > 0) - int(before > 0)
+
+activity_stats = ActivityStats()
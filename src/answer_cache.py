@@ -0,0 +1,117 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+def normalize_question(question: str) -> str:
+    """Case-fold, collapse whitespace and drop trailing punctuation"""
+    return re.sub(r"\s+", " ", question).strip().rstrip("?!. ").lower()
+
+class AnswerCache:
+    """
+    TTL + LRU cache of RAG answers.
+
+    Lookups first try an exact match on the normalized question. If a
+    similarity threshold is configured and the caller supplies the question's
+    embedding, a miss then falls back to the cached question with the highest
+    cosine similarity at or above the threshold.
+
+    invalidate() also advances a generation counter. Callers read
+    `generation` before computing an answer and pass it to put(), which
+    drops answers computed before the latest invalidation.
+    """
+
+    def __init__(self, ttl: float = 3600, max_entries: int = 512, similarity_threshold: Optional[float] = None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._metrics = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    @property
+    def semantic(self) -> bool:
+        return self.similarity_threshold is not None
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, question: str, embedding: Optional[List[float]] = None) -> Optional[Dict]:
+        key = normalize_question(question)
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._metrics["exact_hits"] += 1
+                return entry["result"]
+
+            if self.semantic and embedding is not None:
+                match = self._nearest(embedding)
+                if match is not None:
+                    self._entries.move_to_end(match)
+                    self._metrics["semantic_hits"] += 1
+                    return self._entries[match]["result"]
+
+            self._metrics["misses"] += 1
+            return None
+
+    def put(self, question: str, result: Dict, embedding: Optional[List[float]] = None,
+            generation: Optional[int] = None):
+        key = normalize_question(question)
+        vector = None
+        if embedding is not None:
+            vector = np.asarray(embedding, dtype=np.float32)
+            vector = vector / (np.linalg.norm(vector) or 1)
+
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return  # Computed against documents that have since changed
+            self._entries[key] = {
+                "result": result,
+                "embedding": vector,
+                "expires_at": time.monotonic() + self.ttl
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._metrics["evictions"] += 1
+
+    def invalidate(self):
+        """Drop every cached answer, e.g. after new documents are ingested"""
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+            self._metrics["invalidations"] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            hits = self._metrics["exact_hits"] + self._metrics["semantic_hits"]
+            lookups = hits + self._metrics["misses"]
+            return {
+                **self._metrics,
+                "entries": len(self._entries),
+                "hit_rate": hits / lookups if lookups else 0.0
+            }
+
+    def _expire(self, now: float):
+        expired = [key for key, entry in self._entries.items() if entry["expires_at"] <= now]
+        for key in expired:
+            del self._entries[key]
+
+    def _nearest(self, embedding: List[float]) -> Optional[str]:
+        keys = [key for key, entry in self._entries.items() if entry["embedding"] is not None]
+        if not keys:
+            return None
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1)
+        scores = np.stack([self._entries[key]["embedding"] for key in keys]) @ query
+        best = int(np.argmax(scores))
+        return keys[best] if scores[best] >= self.similarity_threshold else None
@@ -1,23 +1,34 @@
 import os
 import logging
-from flask import Flask, render_template, redirect, url_for, send_from_directory, request, flash, jsonify
+from flask import Flask, render_template, redirect, url_for, send_file, send_from_directory, request, flash, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from flask_socketio import SocketIO, join_room, leave_room
 from flask_login import LoginManager, login_required, current_user
 from flask_migrate import Migrate
 from sqlalchemy.orm import DeclarativeBase
 from werkzeug.utils import secure_filename
-from src.rag_utils import rag_manager
+from rag_utils import rag_manager, RAGUnavailableError
+from cooperative import ASYNC_MODE
+from fanout import socketio_queue_options
 from datetime import datetime
 
 logging.basicConfig(level=logging.DEBUG)
 
-def extract_text_from_file(file_path, file_type):
-    """Extract text content from uploaded file based on its type."""
+TEXT_FILE_EXTENSIONS = ['.txt', '.md', '.py', '.js', '.html', '.css']
+
+def is_text_file(file_name, file_type):
+    """Whether an uploaded file is text we can embed into the RAG system."""
+    return bool(file_type and file_type.startswith('text/')) or any(file_name.endswith(ext) for ext in TEXT_FILE_EXTENSIONS)
+
+def extract_text_from_file(file_path, file_type, file_name=None):
+    """Extract text content from uploaded file based on its type.
+
+    ``file_name`` is the original upload name, for stored files whose path has no extension.
+    """
     try:
         logging.info(f"Attempting to extract text from file: {file_path} (type: {file_type})")
         
-        if file_type.startswith('text/') or any(file_path.endswith(ext) for ext in ['.txt', '.md', '.py', '.js', '.html', '.css']):
+        if is_text_file(file_name or file_path, file_type):
             try:
                 with open(file_path, 'r', encoding='utf-8') as f:
                     content = f.read()
@@ -44,7 +55,7 @@ class Base(DeclarativeBase):
     pass
 
 db = SQLAlchemy(model_class=Base)
-socketio = SocketIO(cors_allowed_origins="*", async_mode='threading')
+socketio = SocketIO(cors_allowed_origins="*", async_mode=ASYNC_MODE)
 login_manager = LoginManager()
 migrate = Migrate()
 
@@ -61,14 +72,27 @@ app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
 }
 app.config["MAX_CONTENT_LENGTH"] = 16 * 1024 * 1024  # 16MB max file size
 app.config['UPLOAD_FOLDER'] = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
+app.config['HISTORY_PAGE_SIZE'] = int(os.environ.get("HISTORY_PAGE_SIZE", 50))  # Messages sent on join / per load_history page
+app.config['HISTORY_MAX_PAGE_SIZE'] = 200
+app.config['EMBEDDING_WORKERS'] = int(os.environ.get("EMBEDDING_WORKERS", 2))
+app.config['RAG_WARMUP'] = os.environ.get("RAG_WARMUP", "true").lower() == "true"  # Otherwise RAG starts on first use
+app.config['PRESENCE_BACKEND'] = os.environ.get("PRESENCE_BACKEND", "memory")  # "redis" to share presence between processes
+app.config['PRESENCE_REDIS_URL'] = os.environ.get("PRESENCE_REDIS_URL", os.environ.get("REDIS_URL", "redis://localhost:6379/0"))
+app.config['SOCKETIO_MESSAGE_QUEUE'] = os.environ.get("SOCKETIO_MESSAGE_QUEUE")  # e.g. redis://localhost:6379/0 to share rooms between workers
+app.config['MESSAGE_GROUP_COMMIT'] = os.environ.get("MESSAGE_GROUP_COMMIT", "false").lower() == "true"  # Batch socket message commits
+app.config['UPLOAD_CHUNK_SIZE'] = int(os.environ.get("UPLOAD_CHUNK_SIZE", 256 * 1024))  # Largest upload_chunk payload
 
 # Ensure upload directory exists
 if not os.path.exists(app.config['UPLOAD_FOLDER']):
     os.makedirs(app.config['UPLOAD_FOLDER'])
 
+# Resumable socket uploads keep their partial files under UPLOAD_FOLDER/.partial
+from chunked_upload import chunked_uploads
+chunked_uploads.init_app(app)
+
 db.init_app(app)
 migrate.init_app(app, db)
-socketio.init_app(app)
+socketio.init_app(app, **socketio_queue_options(app.config['SOCKETIO_MESSAGE_QUEUE']))
 login_manager.init_app(app)
 login_manager.login_view = "auth.login"
 
@@ -79,6 +103,40 @@ with app.app_context():
     # Only create tables if they don't exist
     db.create_all()
 
+    # Set up the full-text index used by message search
+    from search_index import search_index
+    search_index.init_app(app, db)
+
+    # Uploads are stored once per distinct content, keyed by SHA-256
+    from blob_store import blob_store
+    blob_store.init_app(app, db)
+
+    # Profile counters maintained alongside message, reaction and thread writes
+    from activity_stats import activity_stats
+    activity_stats.init_app(app, db)
+    from channel_stats import channel_stats
+    channel_stats.init_app(app, db)
+
+    # Reaction toggles, per-emoji counts and coalesced count broadcasts
+    from reactions import reactions
+    reactions.init_app(app, db, socketio)
+
+    # `flask check-query-plans`: EXPLAIN the hot handler queries and fail on full scans
+    import query_plans
+    query_plans.init_app(app, db)
+
+    # Queue that embeds uploaded files in the background (workers start with the server)
+    from embedding_worker import embedding_queue
+    embedding_queue.init_app(app, socketio)
+
+    # Track who is online and broadcast changes in batches (started with the server)
+    from presence import presence
+    presence.init_app(app, socketio)
+
+    # Optional single writer that commits socket messages in batches
+    from group_commit import message_writer
+    message_writer.init_app(app, socketio)
+
     # Create default channel if it doesn't exist
     default_channel = Channel.query.filter_by(name="General").first()
     if not default_channel:
@@ -93,6 +151,23 @@ with app.app_context():
     from auth import auth_bp
     app.register_blueprint(auth_bp)
 
+def start_background_services():
+    """Start the work that only a serving process should do
+
+    Called from main.py and serve.py; importing app (as every `flask` CLI
+    command does) leaves the job queue and the online flags alone.
+    """
+    # Bring the RAG system up in the background so startup never waits on it
+    if app.config['RAG_WARMUP']:
+        rag_manager.warm_up()
+
+    from embedding_worker import embedding_queue
+    embedding_queue.start()
+
+    from presence import presence
+    with app.app_context():
+        presence.start()
+
 @login_manager.user_loader
 def load_user(user_id):
     from models import User
@@ -113,11 +188,18 @@ def chat():
     return render_template('chat.html', channels=channels)
 
 # Add this route to serve uploaded files
+@app.route('/uploads/<digest>/<path:filename>')
 @app.route('/uploads/<path:filename>')
 @login_required
-def uploaded_file(filename):
+def uploaded_file(filename, digest=None):
     try:
-        return send_from_directory(app.config['UPLOAD_FOLDER'], filename, as_attachment=True)
+        if digest is not None and blob_store.exists(digest):
+            # Blobs never change, so clients may cache them for as long as they like
+            return send_file(blob_store.path(digest), download_name=filename, as_attachment=True,
+                             etag=digest, max_age=365 * 24 * 3600)
+        # Files uploaded before the blob store kept their own name in UPLOAD_FOLDER
+        legacy_name = f'{digest}/{filename}' if digest is not None else filename
+        return send_from_directory(app.config['UPLOAD_FOLDER'], legacy_name, as_attachment=True)
     except FileNotFoundError:
         flash('File not found')
         return redirect(url_for('files'))
@@ -162,49 +244,16 @@ def upload_file():
             return redirect(url_for('files'))
         
         if file:
-            # Secure the filename and ensure it's unique
-            original_filename = secure_filename(file.filename)
-            file_name = original_filename
-            counter = 1
-            
-            while os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], file_name)):
-                name, ext = os.path.splitext(original_filename)
-                file_name = f"{name}_{counter}{ext}"
-                counter += 1
-            
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], file_name)
-            
+            file_name = secure_filename(file.filename)
+
             try:
-                # Save the file
-                file.save(file_path)
-                logging.info(f"File saved successfully: {file_path}")
-                
-                # Extract text and add to RAG system if it's a text file
-                embedding_status = 'pending'
-                if file.content_type.startswith('text/') or any(file_name.endswith(ext) for ext in ['.txt', '.md', '.py', '.js', '.html', '.css']):
-                    logging.info(f"Processing text file for RAG: {file_name}")
-                    text_content = extract_text_from_file(file_path, file.content_type)
-                    if text_content:
-                        metadata = {
-                            "source": file_name,
-                            "channel": channel.name,
-                            "uploader": current_user.username,
-                            "content_type": file.content_type
-                        }
-                        logging.info(f"Attempting to add document to RAG system: {file_name}")
-                        success = rag_manager.add_documents([text_content], [metadata])
-                        embedding_status = 'success' if success else 'failed'
-                        logging.info(f"RAG processing result for {file_name}: {embedding_status}")
-                    else:
-                        embedding_status = 'failed'
-                        logging.error(f"Failed to extract text content from {file_name}")
-                else:
-                    logging.info(f"Skipping RAG processing for non-text file: {file_name}")
-                
+                # Hash while saving; identical content is only stored once
+                digest, size = blob_store.save_stream(file.stream)
+                file_path = f'/uploads/{digest}/{file_name}'
+                logging.info(f"File stored successfully: {file_name} ({digest})")
             except Exception as e:
                 logging.error(f"Error processing file {file_name}: {str(e)}", exc_info=True)
                 flash('Error saving file')
-                embedding_status = 'failed'
                 return redirect(url_for('files'))
             
             # Create a message to track the file
@@ -216,21 +265,28 @@ def upload_file():
                 channel_id=int(channel_id),
                 file_name=file_name,
                 file_path=file_path,
+                file_digest=digest,
                 file_type=file.content_type,
-                embedding_status=embedding_status
+                embedding_status='pending'
             )
             
             try:
+                blob_store.register(digest, size)
                 db.session.add(message)
+                # Text files are embedded into the RAG system by a background worker
+                if is_text_file(file_name, file.content_type):
+                    embedding_queue.enqueue(message)
+                    logging.info(f"Queued text file for RAG processing: {file_name}")
+                else:
+                    logging.info(f"Skipping RAG processing for non-text file: {file_name}")
                 db.session.commit()
-                logging.info(f"File record created successfully: {file_name} (status: {embedding_status})")
+                embedding_queue.notify()
+                logging.info(f"File record created successfully: {file_name}")
                 flash('File uploaded successfully')
             except Exception as e:
                 db.session.rollback()
                 logging.error(f"Database error: {str(e)}")
-                # Clean up the file if database operation fails
-                if os.path.exists(file_path):
-                    os.remove(file_path)
+                # The stored blob may be shared, so an unreferenced one is left for `flask gc-blobs`
                 flash('Error uploading file')
                 
             return redirect(url_for('files'))
@@ -260,13 +316,17 @@ def delete_file():
         return redirect(url_for('files'))
     
     try:
-        # Delete the physical file
-        if message.file_path and os.path.exists(message.file_path):
+        # Files uploaded before the blob store are removed directly
+        if not message.file_digest and message.file_path and os.path.exists(message.file_path):
             os.remove(message.file_path)
         
         # Delete the database record
         db.session.delete(message)
         db.session.commit()
+
+        # Drop the blob if no other message shares it
+        if message.file_digest:
+            blob_store.collect_garbage()
         
         flash('File deleted successfully')
     except Exception as e:
@@ -294,49 +354,21 @@ def send_message():
         file = request.files.get('file')
         file_name = None
         file_path = None
+        file_digest = None
         file_type = None
         embedding_status = None
         
         if file and file.filename:
-            # Secure the filename and ensure it's unique
-            original_filename = secure_filename(file.filename)
-            file_name = original_filename
-            counter = 1
-            
-            while os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], file_name)):
-                name, ext = os.path.splitext(original_filename)
-                file_name = f"{name}_{counter}{ext}"
-                counter += 1
-            
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], file_name)
+            file_name = secure_filename(file.filename)
             file_type = file.content_type
             
             try:
-                # Save the file
-                file.save(file_path)
-                logging.info(f"File saved successfully in message: {file_path}")
-                
-                # Extract text and add to RAG system if it's a text file
+                # Hash while saving; identical content is only stored once
+                file_digest, size = blob_store.save_stream(file.stream)
+                file_path = f'/uploads/{file_digest}/{file_name}'
+                blob_store.register(file_digest, size)
+                logging.info(f"File stored successfully in message: {file_name} ({file_digest})")
                 embedding_status = 'pending'
-                if file_type.startswith('text/') or any(file_name.endswith(ext) for ext in ['.txt', '.md', '.py', '.js', '.html', '.css']):
-                    logging.info(f"Processing text file for RAG in message: {file_name}")
-                    text_content = extract_text_from_file(file_path, file_type)
-                    if text_content:
-                        metadata = {
-                            "source": file_name,
-                            "channel": channel.name,
-                            "uploader": current_user.username,
-                            "content_type": file_type
-                        }
-                        logging.info(f"Attempting to add document to RAG system from message: {file_name}")
-                        success = rag_manager.add_documents([text_content], [metadata])
-                        embedding_status = 'success' if success else 'failed'
-                        logging.info(f"RAG processing result for message file {file_name}: {embedding_status}")
-                    else:
-                        embedding_status = 'failed'
-                        logging.error(f"Failed to extract text content from message file {file_name}")
-                else:
-                    logging.info(f"Skipping RAG processing for non-text message file: {file_name}")
             except Exception as e:
                 logging.error(f"Error processing message file {file_name}: {str(e)}", exc_info=True)
                 return 'Error saving file', 500
@@ -348,12 +380,18 @@ def send_message():
             channel_id=channel_id,
             file_name=file_name,
             file_path=file_path,
+            file_digest=file_digest,
             file_type=file_type,
             embedding_status=embedding_status
         )
         
         db.session.add(message)
+        # Text files are embedded into the RAG system by a background worker
+        if file_name and is_text_file(file_name, file_type):
+            embedding_queue.enqueue(message)
+            logging.info(f"Queued message file for RAG processing: {file_name}")
         db.session.commit()
+        embedding_queue.notify()
         logging.info(f"Message created successfully{' with file: ' + file_name if file_name else ''}")
         
         # Emit the message through socket.io
@@ -393,7 +431,20 @@ def on_leave(data):
         room = f'channel_{channel}'
         socketio.leave_room(room)
 
-from rag_utils import rag_manager
+RAG_UNAVAILABLE_MESSAGE = 'The knowledge base is not available right now. Please try again shortly.'
+
+@app.errorhandler(RAGUnavailableError)
+def rag_unavailable(e):
+    return jsonify({
+        'error': str(e),
+        'status': rag_manager.status,
+        'message': RAG_UNAVAILABLE_MESSAGE
+    }), 503
+
+@app.route('/rag/status')
+@login_required
+def rag_status():
+    return jsonify({'status': rag_manager.status, 'ready': rag_manager.ready})
 
 @app.route('/rag')
 @login_required
@@ -415,7 +466,7 @@ def process_rag_query():
             }), 400
             
         # Process the query
-        result = rag_manager.query(query)
+        result = rag_manager.query(query, session_id=current_user.id)
         
         # Format the response based on query type
         if query_type == 'documentation':
@@ -432,12 +483,22 @@ def process_rag_query():
             'raw_result': result
         })
         
+    except RAGUnavailableError as e:
+        return jsonify({
+            'error': str(e),
+            'response': RAG_UNAVAILABLE_MESSAGE
+        }), 503
     except Exception as e:
         return jsonify({
             'error': str(e),
             'response': 'An error occurred while processing your query.'
         }), 500
 
+@app.route('/rag/cache/stats')
+@login_required
+def rag_cache_stats():
+    return jsonify(rag_manager.answer_cache.stats())
+
 @app.route('/rag/ingest', methods=['POST'])
 @login_required
 def ingest_documents():
@@ -449,11 +510,20 @@ def ingest_documents():
                 'message': 'Please provide files to ingest.'
             }), 400
             
+        # Fail fast while the RAG system is starting or down
+        rag_manager.get()
+        
         files = request.files.getlist('files')
-        successful_files = []
-        failed_files = []
+        # [file name, error message] in upload order; a None error means the file was ingested
+        file_results = []
+        contents = []
+        metadatas = []
+        ingested_results = []
         
+        # Decode every file first so all of them can share embedding batches
         for file in files:
+            file_result = [file.filename, None]
+            file_results.append(file_result)
             try:
                 logging.info(f"Processing file: {file.filename}")
                 
@@ -462,15 +532,10 @@ def ingest_documents():
                 ext = ext.lower()
                 
                 # Check if it's a supported text-based file
-                is_text_file = (
-                    file.content_type.startswith('text/') or
-                    ext in ['.txt', '.md', '.py', '.js', '.html', '.css']
-                )
-                
-                if not is_text_file:
+                if not is_text_file(file.filename.lower(), file.content_type):
                     error_msg = f"Unsupported file type: {file.content_type}"
                     logging.warning(f"{file.filename}: {error_msg}")
-                    failed_files.append(f"{file.filename} ({error_msg})")
+                    file_result[1] = error_msg
                     continue
                 
                 try:
@@ -486,31 +551,33 @@ def ingest_documents():
                 # Log content length for debugging
                 logging.info(f"Content length for {file.filename}: {len(content)} characters")
                 
-                metadata = {
+                contents.append(content)
+                metadatas.append({
                     'source': file.filename,
                     'type': 'text/markdown' if ext == '.md' else file.content_type,
                     'uploader': current_user.username,
                     'upload_time': datetime.utcnow().isoformat()
-                }
-                
-                logging.info(f"Attempting to add {file.filename} to vector store")
-                # Add to vector store
-                success = rag_manager.add_documents(
-                    texts=[content],
-                    metadatas=[metadata]
-                )
-                
-                if success:
-                    logging.info(f"Successfully processed {file.filename}")
-                    successful_files.append(file.filename)
-                else:
-                    error_msg = "Failed to add to vector store"
-                    logging.error(f"{file.filename}: {error_msg}")
-                    failed_files.append(f"{file.filename} ({error_msg})")
+                })
+                ingested_results.append(file_result)
                     
             except Exception as e:
                 logging.error(f"Error processing {file.filename}: {str(e)}", exc_info=True)
-                failed_files.append(f"{file.filename} ({str(e)})")
+                file_result[1] = str(e)
+        
+        if contents:
+            logging.info(f"Attempting to add {len(contents)} files to vector store")
+            # Add to vector store
+            outcomes = rag_manager.ingest_documents(contents, metadatas)
+            for file_result, success in zip(ingested_results, outcomes):
+                if success:
+                    logging.info(f"Successfully processed {file_result[0]}")
+                else:
+                    error_msg = "Failed to add to vector store"
+                    logging.error(f"{file_result[0]}: {error_msg}")
+                    file_result[1] = error_msg
+        
+        successful_files = [name for name, error in file_results if error is None]
+        failed_files = [f"{name} ({error})" for name, error in file_results if error is not None]
         
         result = {
             'message': 'Document ingestion complete',
@@ -520,6 +587,11 @@ def ingest_documents():
         logging.info(f"Ingestion result: {result}")
         return jsonify(result)
         
+    except RAGUnavailableError as e:
+        return jsonify({
+            'error': str(e),
+            'message': RAG_UNAVAILABLE_MESSAGE
+        }), 503
     except Exception as e:
         error_msg = f"An error occurred during document ingestion: {str(e)}"
         logging.error(error_msg, exc_info=True)
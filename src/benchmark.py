@@ -0,0 +1,469 @@
+"""
+Socket.IO load benchmark.
+
+    python benchmark.py --channels 10 --messages-per-channel 100000 --clients 50 --duration 30
+    python benchmark.py --database-url postgresql://localhost/teamflow_bench --output results.json
+
+Seeds a dedicated database with users, channels, messages, thread replies
+and reactions, then drives --clients simulated users against the app. Each
+one logs in, connects, joins a channel and sends a weighted mix of message,
+reaction, thread_reply, search_messages and join events until --duration
+runs out.
+
+Clients are Flask-SocketIO test clients in this process, each on its own
+thread. Handlers run synchronously in the calling thread, so a latency is
+the time the server spends in the handler (no network), and every SQL
+statement it runs is counted against its event. Work done on background
+threads (presence flushes, reaction_counts broadcasts, the group commit
+writer) is not counted.
+
+The database given with --database-url (never DATABASE_URL, so a benchmark
+cannot seed into a real database by accident) is seeded once and reused on
+later runs; pass --reseed to start over. The default is an SQLite file in
+the temp directory, named after the dataset size.
+
+Results are printed as a table, and with --output written as JSON:
+p50/p95/p99/max latency, throughput, errors and queries per event.
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+PASSWORD = 'bench-password'
+EMOJIS = ['👍', '❤️', '😂', '🎉', '👀', '🚀']
+WORDS = [
+    'deploy', 'release', 'review', 'database', 'migration', 'latency', 'socket', 'channel',
+    'thread', 'upload', 'search', 'index', 'cache', 'worker', 'queue', 'commit', 'rollback',
+    'dashboard', 'customer', 'incident', 'meeting', 'roadmap', 'design', 'feedback', 'bug',
+    'feature', 'test', 'staging', 'production', 'metrics', 'alert', 'backup', 'schema',
+]
+DEFAULT_MIX = 'message=40,reaction=30,thread_reply=10,search_messages=10,join=10'
+EVENTS = ('message', 'reaction', 'thread_reply', 'search_messages', 'join')
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Drive simulated Socket.IO clients against a seeded TeamFlow database.')
+    dataset = parser.add_argument_group('dataset')
+    dataset.add_argument('--database-url', help='Database to seed and run against (default: an SQLite file in the temp directory)')
+    dataset.add_argument('--reseed', action='store_true', help='Drop and recreate all tables before seeding')
+    dataset.add_argument('--users', type=int, default=200)
+    dataset.add_argument('--channels', type=int, default=10)
+    dataset.add_argument('--messages-per-channel', type=int, default=1000)
+    dataset.add_argument('--thread-fraction', type=float, default=0.05, help='Share of messages with thread replies')
+    dataset.add_argument('--max-thread-replies', type=int, default=5)
+    dataset.add_argument('--reactions-per-message', type=float, default=0.5, help='Average reactions per message')
+
+    load = parser.add_argument_group('load')
+    load.add_argument('--clients', type=int, default=20)
+    load.add_argument('--duration', type=float, default=30, help='Seconds of measured load')
+    load.add_argument('--warmup', type=float, default=5, help='Seconds of load before measuring starts')
+    load.add_argument('--think-time', type=float, default=0, help='Seconds each client waits between events')
+    load.add_argument('--mix', default=DEFAULT_MIX, help=f'Event weights (default: {DEFAULT_MIX})')
+    load.add_argument('--history-limit', type=int, help='Page size each join asks for')
+    load.add_argument('--seed', type=int, default=1, help='Random seed for the dataset and the clients')
+
+    parser.add_argument('--output', help='Write results as JSON to this file ("-" for stdout)')
+    parser.add_argument('--log-level', default='WARNING', help='Log level while the benchmark runs')
+    args = parser.parse_args(argv)
+
+    try:
+        args.mix = {
+            name.strip(): float(weight)
+            for name, weight in (item.split('=', 1) for item in args.mix.split(',') if item.strip())
+        }
+    except ValueError:
+        parser.error(f'--mix must look like {DEFAULT_MIX}')
+    unknown = set(args.mix) - set(EVENTS)
+    if unknown:
+        parser.error(f"Unknown events in --mix: {', '.join(sorted(unknown))}")
+    if not args.database_url:
+        name = f'teamflow-bench-{args.users}u-{args.channels}c-{args.messages_per_channel}m.db'
+        args.database_url = f'sqlite:///{os.path.join(tempfile.gettempdir(), name)}'
+    return args
+
+def _sentence(rng, words=8):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+def _insert(db, table, rows, chunk_size=10000):
+    """Core executemany in chunks; returns the number of rows inserted"""
+    total = 0
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            db.session.execute(table.insert(), chunk)
+            total += len(chunk)
+            chunk = []
+    if chunk:
+        db.session.execute(table.insert(), chunk)
+        total += len(chunk)
+    db.session.commit()
+    return total
+
+def is_seeded(db):
+    from models import Channel
+    return Channel.query.filter(Channel.name == 'bench-0').first() is not None
+
+def seed(db, args, rng):
+    """
+    Fill the database with the benchmark dataset. Rows go in through Core
+    bulk inserts, which skip the mapper events, so every derived table is
+    rebuilt afterwards exactly as its rebuild CLI command would.
+    """
+    from werkzeug.security import generate_password_hash
+    from activity_stats import activity_stats
+    from channel_stats import channel_stats
+    from models import Channel, Message, Reaction, Thread, User
+    from reactions import reactions
+    from search_index import search_index
+
+    started = time.perf_counter()
+    password_hash = generate_password_hash(PASSWORD)
+    _insert(db, User.__table__, ({
+        'username': f'bench_user_{i}',
+        'email': f'bench_user_{i}@example.com',
+        'password_hash': password_hash,
+    } for i in range(args.users)))
+    user_ids = [user_id for (user_id,) in db.session.query(User.id).filter(User.username.like('bench_user_%'))]
+
+    _insert(db, Channel.__table__, ({
+        'name': f'bench-{i}',
+        'description': 'Benchmark channel',
+        'created_by_id': user_ids[0],
+    } for i in range(args.channels)))
+    channel_ids = [channel_id for (channel_id,) in db.session.query(Channel.id).filter(Channel.name.like('bench-%'))]
+
+    # Oldest first, a few seconds apart, so ids and timestamps grow together like real traffic
+    start = datetime.utcnow() - timedelta(seconds=5 * args.messages_per_channel)
+    for channel_id in channel_ids:
+        _insert(db, Message.__table__, ({
+            'content': _sentence(rng),
+            'timestamp': start + timedelta(seconds=5 * i),
+            'user_id': rng.choice(user_ids),
+            'channel_id': channel_id,
+            'embedding_status': 'success',
+        } for i in range(args.messages_per_channel)))
+
+    low, high = db.session.query(db.func.min(Message.id), db.func.max(Message.id))\
+        .filter(Message.channel_id.in_(channel_ids)).one()
+    message_count = high - low + 1
+
+    def threads():
+        for message_id in rng.sample(range(low, high + 1), int(message_count * args.thread_fraction)):
+            for _ in range(rng.randint(1, args.max_thread_replies)):
+                yield {
+                    'message_id': message_id,
+                    'content': _sentence(rng, 6),
+                    'timestamp': datetime.utcnow(),
+                    'user_id': rng.choice(user_ids),
+                }
+    thread_count = _insert(db, Thread.__table__, threads())
+
+    def reaction_rows():
+        seen = set()
+        for _ in range(int(message_count * args.reactions_per_message)):
+            key = (rng.randint(low, high), rng.choice(user_ids), rng.choice(EMOJIS))
+            if key not in seen:
+                seen.add(key)
+                yield {'message_id': key[0], 'user_id': key[1], 'emoji': key[2], 'timestamp': datetime.utcnow()}
+    reaction_count = _insert(db, Reaction.__table__, reaction_rows())
+
+    search_index.rebuild()
+    activity_stats.rebuild()
+    channel_stats.rebuild()
+    reactions.rebuild_counts()
+
+    return {
+        'users': len(user_ids),
+        'channels': len(channel_ids),
+        'messages': message_count,
+        'threads': thread_count,
+        'reactions': reaction_count,
+        'seed_seconds': round(time.perf_counter() - started, 2),
+    }
+
+def load_dataset(db):
+    """Bench users and each bench channel's message id range, from an already seeded database"""
+    from models import Channel, Message, User
+
+    users = [username for (username,) in db.session.query(User.username).filter(User.username.like('bench_user_%'))]
+    ranges = db.session.query(Message.channel_id, db.func.min(Message.id), db.func.max(Message.id))\
+        .join(Channel, Channel.id == Message.channel_id)\
+        .filter(Channel.name.like('bench-%'))\
+        .group_by(Message.channel_id).all()
+    return users, {channel_id: (low, high) for channel_id, low, high in ranges}
+
+class Probe(logging.Handler):
+    """
+    Per-thread counters for the event being measured: SQL statements run
+    and errors logged. The socket handlers log and swallow their exceptions,
+    so an ERROR record is how a failed event shows up.
+    """
+
+    def __init__(self, engine):
+        super().__init__(level=logging.ERROR)
+        from sqlalchemy import event
+        self._local = threading.local()
+        event.listen(engine, 'before_cursor_execute', self._on_execute)
+        logging.getLogger().addHandler(self)
+
+    def _on_execute(self, *args):
+        counters = getattr(self._local, 'counters', None)
+        if counters is not None:
+            counters[0] += 1
+
+    def emit(self, record):
+        counters = getattr(self._local, 'counters', None)
+        if counters is not None:
+            counters[1] += 1
+
+    def begin(self):
+        self._local.counters = [0, 0]
+
+    def end(self):
+        queries, errors = self._local.counters
+        self._local.counters = None
+        return queries, errors
+
+class Recorder:
+    """One client's samples; merged into the report once the run is over"""
+
+    def __init__(self):
+        self.samples = {}  # event -> list of (seconds, queries, failed)
+        self.frames = 0
+        self.recording = False
+
+    def add(self, name, seconds, queries, failed):
+        if self.recording:
+            self.samples.setdefault(name, []).append((seconds, queries, failed))
+
+def _percentile(ordered, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    index = max(0, min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+def summarize(recorders, duration):
+    events = {}
+    names = sorted({name for recorder in recorders for name in recorder.samples})
+    for name in names:
+        samples = [sample for recorder in recorders for sample in recorder.samples.get(name, [])]
+        latencies = sorted(seconds * 1000 for seconds, _, _ in samples)
+        queries = [count for _, count, _ in samples]
+        events[name] = {
+            'count': len(samples),
+            'errors': sum(1 for _, _, failed in samples if failed),
+            'throughput': round(len(samples) / duration, 2),
+            'latency_ms': {
+                'mean': round(sum(latencies) / len(latencies), 3),
+                'p50': round(_percentile(latencies, 0.50), 3),
+                'p95': round(_percentile(latencies, 0.95), 3),
+                'p99': round(_percentile(latencies, 0.99), 3),
+                'max': round(latencies[-1], 3),
+            },
+            'queries': {
+                'mean': round(sum(queries) / len(queries), 2),
+                'max': max(queries),
+                'total': sum(queries),
+            },
+        }
+    total = sum(event['count'] for event in events.values())
+    return {
+        'duration_seconds': round(duration, 2),
+        'events_total': total,
+        'errors_total': sum(event['errors'] for event in events.values()),
+        'throughput': round(total / duration, 2) if duration else 0,
+        'frames_received': sum(recorder.frames for recorder in recorders),
+        'events': events,
+    }
+
+class SimulatedClient:
+    def __init__(self, app, socketio, probe, username, channel_ranges, args, rng):
+        self.app = app
+        self.socketio = socketio
+        self.probe = probe
+        self.username = username
+        self.channel_ranges = channel_ranges
+        self.channel_ids = list(channel_ranges)
+        self.args = args
+        self.rng = rng
+        self.recorder = Recorder()
+        self.sio = None
+        self.channel_id = None
+        self.events, self.weights = zip(*[(name, weight) for name, weight in args.mix.items() if weight > 0])
+
+    def _measure(self, name, action):
+        """Run ``action`` as one event; it returns whether the event succeeded"""
+        self.probe.begin()
+        started = time.perf_counter()
+        try:
+            ok = action()
+        except Exception as e:
+            logging.getLogger(__name__).debug(f"{name} raised: {str(e)}")
+            ok = False
+        elapsed = time.perf_counter() - started
+        queries, errors = self.probe.end()
+        self.recorder.add(name, elapsed, queries, errors > 0 or not ok)
+        if self.sio is not None:
+            self.recorder.frames += len(self.sio.get_received())
+
+    def connect(self):
+        flask_client = self.app.test_client()
+        response = flask_client.post('/login', data={'email': f'{self.username}@example.com', 'password': PASSWORD})
+        if response.status_code != 302:
+            raise RuntimeError(f"Login failed for {self.username}: HTTP {response.status_code}")
+
+        def connect():
+            self.sio = self.socketio.test_client(self.app, flask_test_client=flask_client)
+            return self.sio.is_connected()
+        # Connects happen one at a time before the load starts, but are still worth reporting
+        self.recorder.recording = True
+        self._measure('connect', connect)
+        self.recorder.recording = False
+        self.join(self.rng.choice(self.channel_ids))
+
+    def join(self, channel_id):
+        self.channel_id = channel_id
+        data = {'channel': channel_id, 'supports_batch': True}
+        if self.args.history_limit:
+            data['limit'] = self.args.history_limit
+        self._measure('join', lambda: self.sio.emit('join', data) is None)
+
+    def _message_id(self):
+        low, high = self.channel_ranges[self.channel_id]
+        return self.rng.randint(low, high)
+
+    def step(self):
+        name = self.rng.choices(self.events, weights=self.weights)[0]
+        if name == 'join':
+            self.join(self.rng.choice(self.channel_ids))
+        elif name == 'message':
+            data = {'content': _sentence(self.rng), 'channel_id': self.channel_id}
+            self._measure(name, lambda: 'message_id' in (self.sio.emit('message', data, callback=True) or {}))
+        elif name == 'reaction':
+            data = {'message_id': self._message_id(), 'emoji': self.rng.choice(EMOJIS)}
+            self._measure(name, lambda: 'reacted' in (self.sio.emit('reaction', data, callback=True) or {}))
+        elif name == 'thread_reply':
+            data = {'parent_id': self._message_id(), 'content': _sentence(self.rng, 6), 'channel_id': self.channel_id}
+            self._measure(name, lambda: self.sio.emit('thread_reply', data) is None)
+        elif name == 'search_messages':
+            data = {'keyword': self.rng.choice(WORDS), 'channel_id': self.channel_id}
+            self._measure(name, lambda: self.sio.emit('search_messages', data) is None)
+
+    def run(self, start_barrier, measure_at, stop_at):
+        start_barrier.wait()
+        while True:
+            now = time.monotonic()
+            if now >= stop_at:
+                break
+            self.recorder.recording = now >= measure_at
+            self.step()
+            if self.args.think_time:
+                time.sleep(self.args.think_time)
+
+    def disconnect(self):
+        if self.sio is not None and self.sio.is_connected():
+            self.sio.disconnect()
+
+def _print_table(results):
+    print(f"\n{'event':<18}{'count':>9}{'errors':>8}{'ev/s':>10}{'p50 ms':>10}{'p95 ms':>10}"
+          f"{'p99 ms':>10}{'max ms':>10}{'q/event':>9}")
+    for name, event in results['events'].items():
+        latency = event['latency_ms']
+        print(f"{name:<18}{event['count']:>9}{event['errors']:>8}{event['throughput']:>10}"
+              f"{latency['p50']:>10}{latency['p95']:>10}{latency['p99']:>10}{latency['max']:>10}"
+              f"{event['queries']['mean']:>9}")
+    print(f"\n{results['events_total']} events in {results['duration_seconds']}s "
+          f"({results['throughput']} ev/s), {results['errors_total']} errors, "
+          f"{results['frames_received']} frames received")
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    # app reads its configuration from the environment at import time
+    os.environ['DATABASE_URL'] = args.database_url
+    os.environ['SOCKETIO_ASYNC_MODE'] = 'threading'  # test clients call handlers on their own threads
+
+    from app import app, db, socketio
+    from presence import presence
+    import socket_events  # noqa: F401  Register socket events
+
+    logging.getLogger().setLevel(args.log_level.upper())
+    rng = random.Random(args.seed)
+
+    with app.app_context():
+        if args.reseed:
+            db.drop_all()
+            db.create_all()
+        dataset = None
+        if not is_seeded(db):
+            print(f"Seeding {args.channels} channels x {args.messages_per_channel} messages into {db.engine.url!r}",
+                  file=sys.stderr)
+            dataset = seed(db, args, rng)
+        usernames, channel_ranges = load_dataset(db)
+        probe = Probe(db.engine)
+        # Connects go through presence; the RAG system and embedding workers are not exercised
+        presence.start()
+
+    if not usernames or not channel_ranges:
+        sys.exit(f"{args.database_url} has no benchmark data; run with --reseed")
+
+    clients = [
+        SimulatedClient(app, socketio, probe, usernames[i % len(usernames)], channel_ranges, args,
+                        random.Random(args.seed * 100003 + i))
+        for i in range(args.clients)
+    ]
+    print(f"Connecting {len(clients)} clients", file=sys.stderr)
+    for client in clients:
+        client.connect()
+
+    start_barrier = threading.Barrier(len(clients) + 1)
+    measure_at = time.monotonic() + args.warmup
+    stop_at = measure_at + args.duration
+    threads = [threading.Thread(target=client.run, args=(start_barrier, measure_at, stop_at),
+                                name=f'bench-client-{i}', daemon=True)
+               for i, client in enumerate(clients)]
+    for thread in threads:
+        thread.start()
+    print(f"Running for {args.warmup + args.duration:g}s ({args.warmup:g}s warm-up)", file=sys.stderr)
+    start_barrier.wait()
+    for thread in threads:
+        thread.join()
+    for client in clients:
+        client.disconnect()
+
+    with app.app_context():
+        results = {
+            'config': {
+                'database': db.engine.dialect.name,
+                'clients': args.clients,
+                'duration': args.duration,
+                'warmup': args.warmup,
+                'think_time': args.think_time,
+                'mix': args.mix,
+                'group_commit': app.config['MESSAGE_GROUP_COMMIT'],
+                'message_queue': bool(app.config['SOCKETIO_MESSAGE_QUEUE']),
+                'seed': args.seed,
+            },
+            'dataset': dataset or {'users': len(usernames), 'channels': len(channel_ranges), 'reused': True},
+            **summarize([client.recorder for client in clients], args.duration),
+        }
+
+    _print_table(results)
+    if args.output == '-':
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    elif args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}", file=sys.stderr)
+    return results
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+"""
+Content-addressed storage for uploaded files.
+
+Every upload is hashed with SHA-256 while it streams to a temporary file,
+which is staged until register() is called for its digest in the
+transaction that adds the referring message. register() first locks the
+blob row with a no-op UPDATE, creating the row if it is missing. Only then
+does it move the staged file to UPLOAD_FOLDER/blobs/<first two hex
+digits>/<digest>, or drop it if that blob is already stored, so identical
+uploads are stored once.
+
+Each blob row's ref_count follows the Message rows pointing at it through
+mapper events. collect_garbage() deletes zero-count rows with a
+conditional DELETE and removes the file before committing. A concurrent
+upload therefore either waits for the collection and re-creates the row
+and file, or holds the row lock first, after which the blob is referenced
+and survives.
+"""
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from sqlalchemy import event, inspect, text
+from sqlalchemy.exc import IntegrityError
+
+DIGEST_RE = re.compile(r'^[0-9a-f]{64}$')
+COPY_BUFFER_SIZE = 1024 * 1024
+
+class BlobStore:
+    def __init__(self):
+        self.directory = None
+        self.db = None
+        self._staged = {}  # digest -> temporary files waiting for register()
+        self._staged_lock = threading.Lock()
+
+    def init_app(self, app, db):
+        from models import Message
+
+        self.db = db
+        self.directory = os.path.join(app.config['UPLOAD_FOLDER'], 'blobs')
+        os.makedirs(os.path.join(self.directory, 'tmp'), exist_ok=True)
+
+        event.listen(Message, 'after_insert', self._on_message_insert)
+        event.listen(Message, 'after_update', self._on_message_update)
+        event.listen(Message, 'after_delete', self._on_message_delete)
+
+        @app.cli.command('gc-blobs')
+        def gc_blobs_command():
+            """Delete stored files that no message refers to any more."""
+            removed = self.collect_garbage(sweep_orphans=True)
+            print(f"Removed {removed} unreferenced blobs")
+
+    def path(self, digest):
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def exists(self, digest):
+        return bool(DIGEST_RE.match(digest)) and os.path.exists(self.path(digest))
+
+    def save_stream(self, stream):
+        """Store a file-like object and return ``(digest, size)``"""
+        hasher = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.join(self.directory, 'tmp'))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for block in iter(lambda: stream.read(COPY_BUFFER_SIZE), b''):
+                    hasher.update(block)
+                    f.write(block)
+                    size += len(block)
+            digest = hasher.hexdigest()
+            self._stage(tmp_path, digest)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return digest, size
+
+    def save_bytes(self, data):
+        """Store an in-memory payload and return ``(digest, size)``"""
+        digest = hashlib.sha256(data).hexdigest()
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.join(self.directory, 'tmp'))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        self._stage(tmp_path, digest)
+        return digest, len(data)
+
+    def adopt(self, path, digest):
+        """Take over an already hashed file (e.g. a finished chunked upload)"""
+        size = os.path.getsize(path)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.join(self.directory, 'tmp'))
+        os.close(fd)
+        os.replace(path, tmp_path)
+        self._stage(tmp_path, digest)
+        return digest, size
+
+    def _stage(self, tmp_path, digest):
+        # Kept until register(); staged files never registered are swept as orphans
+        with self._staged_lock:
+            self._staged.setdefault(digest, []).append(tmp_path)
+
+    def _place(self, tmp_path, digest):
+        target = self.path(digest)
+        if os.path.exists(target):
+            # Same content is already stored; skip the write
+            os.remove(tmp_path)
+            return
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(tmp_path, target)
+
+    def register(self, digest, size):
+        """
+        Make sure the blob row and file for ``digest`` exist in the current
+        session, re-creating either if garbage collection removed it. The
+        row's ref_count is raised when a Message referring to it is flushed.
+        """
+        from models import Blob
+
+        session = self.db.session
+        lock = text("UPDATE blob SET ref_count = ref_count WHERE digest = :digest")
+        if not session.execute(lock, {'digest': digest}).rowcount:
+            try:
+                # Flushed now so the row exists before any message insert that refers to it
+                with session.begin_nested():
+                    session.add(Blob(digest=digest, size=size, ref_count=0))
+            except IntegrityError:
+                # A concurrent upload of the same content created it first
+                session.execute(lock, {'digest': digest})
+
+        # The row is locked by this transaction, so the file cannot be collected from under us
+        with self._staged_lock:
+            staged = self._staged.pop(digest, [])
+        for tmp_path in staged:
+            if os.path.exists(tmp_path):
+                self._place(tmp_path, digest)
+        if not os.path.exists(self.path(digest)):
+            raise FileNotFoundError(f"No stored file for blob {digest}")
+        return digest
+
+    def _adjust(self, connection, digest, delta):
+        connection.execute(
+            text("UPDATE blob SET ref_count = ref_count + :delta WHERE digest = :digest"),
+            {'delta': delta, 'digest': digest}
+        )
+
+    def _on_message_insert(self, mapper, connection, target):
+        if target.file_digest:
+            self._adjust(connection, target.file_digest, 1)
+
+    def _on_message_update(self, mapper, connection, target):
+        history = inspect(target).attrs.file_digest.history
+        if not history.has_changes():
+            return
+        for digest in history.deleted:
+            if digest:
+                self._adjust(connection, digest, -1)
+        for digest in history.added:
+            if digest:
+                self._adjust(connection, digest, 1)
+
+    def _on_message_delete(self, mapper, connection, target):
+        if target.file_digest:
+            self._adjust(connection, target.file_digest, -1)
+
+    def collect_garbage(self, sweep_orphans=False, orphan_age=3600):
+        """
+        Delete blobs no message refers to. With ``sweep_orphans``, also remove
+        files older than ``orphan_age`` seconds that never got a blob row (left
+        behind when a request failed after writing its file).
+        """
+        from models import Blob
+
+        removed = 0
+        unreferenced = [digest for digest, in self.db.session.query(Blob.digest).filter(Blob.ref_count <= 0)]
+        for digest in unreferenced:
+            # Re-check in the DELETE so a message inserted meanwhile keeps the blob
+            try:
+                deleted = self.db.session.execute(
+                    text("DELETE FROM blob WHERE digest = :digest AND ref_count <= 0"),
+                    {'digest': digest}
+                ).rowcount
+                # Remove the file while the row is still locked; register() waits for the commit
+                if deleted and os.path.exists(self.path(digest)):
+                    os.remove(self.path(digest))
+                    removed += 1
+                self.db.session.commit()
+            except Exception as e:
+                logging.error(f"Error collecting blob {digest}: {str(e)}")
+                self.db.session.rollback()
+
+        if sweep_orphans:
+            known = {digest for digest, in self.db.session.query(Blob.digest)}
+            cutoff = time.time() - orphan_age
+            for root, _, files in os.walk(self.directory):
+                for name in files:
+                    path = os.path.join(root, name)
+                    if name not in known and os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                        removed += 1
+
+        if removed:
+            logging.info(f"Removed {removed} unreferenced blobs")
+        return removed
+
+blob_store = BlobStore()
@@ -0,0 +1,196 @@
+"""
+Per-channel aggregates for the channel info panel.
+
+ChannelStats holds message and reply counts, distinct posters and the time
+of the last post for each channel. Mapper events keep them current in the
+same transaction as the message insert or delete. Every change, including
+edits to the channel itself and a rename of its creator, bumps the row's
+version. get_info() keeps the
+rendered payload in a process cache and rebuilds it only when the stored
+version differs, so a call costs a single primary-key read.
+
+distinct_posters is applied once per flush, like the distinct counters in
+activity_stats, since a flush may carry several messages from one poster.
+"""
+import logging
+import threading
+from sqlalchemy import event, inspect, orm, text
+
+from activity_stats import distinct_delta, insert_ignore, record_distinct_change
+
+DISTINCT_CHANGES_KEY = 'channel_stats_distinct_changes'
+
+class ChannelStatsCache:
+    def __init__(self):
+        self.db = None
+        self._cache = {}  # channel_id -> (version, payload)
+        self._lock = threading.Lock()
+
+    def init_app(self, app, db):
+        from models import Channel, ChannelStats, Message, User
+
+        self.db = db
+        # Channels that already have messages need real totals before the events add to them
+        if ChannelStats.query.first() is None and Channel.query.first() is not None:
+            logging.info(f"Backfilled stats for {self.rebuild()} channels")
+
+        event.listen(Channel, 'after_insert', self._on_channel_insert)
+        event.listen(Channel, 'after_update', self._on_channel_update)
+        event.listen(User, 'after_update', self._on_user_update)
+        event.listen(Message, 'after_insert', self._on_message_insert)
+        event.listen(Message, 'after_delete', self._on_message_delete)
+        event.listen(orm.Session, 'before_flush', self._on_before_flush)
+        event.listen(orm.Session, 'after_flush', self._on_after_flush)
+
+        @app.cli.command('rebuild-channel-stats')
+        def rebuild_channel_stats_command():
+            """Recompute every channel's message counts, posters and last activity."""
+            count = self.rebuild()
+            print(f"Rebuilt stats for {count} channels")
+
+    def get_info(self, channel_id):
+        """Channel info payload, or None if the channel does not exist"""
+        version = self.db.session.execute(
+            text("SELECT version FROM channel_stats WHERE channel_id = :channel_id"),
+            {'channel_id': channel_id}
+        ).scalar()
+
+        with self._lock:
+            cached = self._cache.get(channel_id)
+        if cached is not None and version is not None and cached[0] == version:
+            return cached[1]
+
+        payload = self._load(channel_id)
+        if payload is not None:
+            with self._lock:
+                self._cache[channel_id] = (payload.pop('version'), payload)
+        return payload
+
+    def _load(self, channel_id):
+        from models import Channel, ChannelStats, User
+
+        row = self.db.session.query(Channel, ChannelStats, User.username)\
+            .outerjoin(ChannelStats, ChannelStats.channel_id == Channel.id)\
+            .outerjoin(User, User.id == Channel.created_by_id)\
+            .filter(Channel.id == channel_id)\
+            .first()
+        if row is None:
+            return None
+
+        channel, stats, creator = row
+        return {
+            'name': channel.name,
+            'description': channel.description,
+            'creator': creator or 'Unknown',
+            'created_at': channel.created_at.isoformat(),
+            'message_count': stats.message_count if stats else 0,
+            'reply_count': stats.reply_count if stats else 0,
+            'distinct_posters': stats.distinct_posters if stats else 0,
+            'last_activity': stats.last_activity.isoformat() if stats and stats.last_activity else None,
+            'version': stats.version if stats else None
+        }
+
+    def _ensure_row(self, connection, channel_id):
+        from models import ChannelStats
+
+        insert_ignore(connection, ChannelStats.__table__,
+                      {'channel_id': channel_id, 'message_count': 0, 'reply_count': 0, 'distinct_posters': 0,
+                       'version': 1},
+                      ['channel_id'])
+
+    def _on_channel_insert(self, mapper, connection, target):
+        self._ensure_row(connection, target.id)
+
+    def _on_channel_update(self, mapper, connection, target):
+        state = inspect(target)
+        if any(state.attrs[name].history.has_changes() for name in ('name', 'description', 'created_by_id')):
+            self._ensure_row(connection, target.id)
+            connection.execute(
+                text("UPDATE channel_stats SET version = version + 1 WHERE channel_id = :channel_id"),
+                {'channel_id': target.id}
+            )
+
+    def _on_user_update(self, mapper, connection, target):
+        # The payload shows the creator's username
+        if inspect(target).attrs.username.history.has_changes():
+            connection.execute(
+                text("UPDATE channel_stats SET version = version + 1 "
+                     "WHERE channel_id IN (SELECT id FROM channel WHERE created_by_id = :user_id)"),
+                {'user_id': target.id}
+            )
+
+    def _on_message_insert(self, mapper, connection, target):
+        self._ensure_row(connection, target.channel_id)
+        counter = 'reply_count' if target.parent_id is not None else 'message_count'
+        connection.execute(
+            text(f"UPDATE channel_stats SET {counter} = {counter} + 1, "
+                 "last_activity = CASE WHEN last_activity IS NULL OR last_activity < :timestamp "
+                 "THEN :timestamp ELSE last_activity END, "
+                 "version = version + 1 "
+                 "WHERE channel_id = :channel_id"),
+            {'channel_id': target.channel_id, 'timestamp': target.timestamp}
+        )
+        record_distinct_change(target, DISTINCT_CHANGES_KEY, 'distinct_posters', (target.channel_id, target.user_id), 1)
+
+    def _on_message_delete(self, mapper, connection, target):
+        self._ensure_row(connection, target.channel_id)
+        counter = 'reply_count' if target.parent_id is not None else 'message_count'
+        # Only the newest message moves last_activity; find the next one back
+        connection.execute(
+            text(f"UPDATE channel_stats SET {counter} = {counter} - 1, "
+                 "last_activity = CASE WHEN last_activity = :timestamp "
+                 "THEN (SELECT MAX(timestamp) FROM message WHERE channel_id = :channel_id) "
+                 "ELSE last_activity END, "
+                 "version = version + 1 "
+                 "WHERE channel_id = :channel_id"),
+            {'channel_id': target.channel_id, 'timestamp': target.timestamp}
+        )
+        record_distinct_change(target, DISTINCT_CHANGES_KEY, 'distinct_posters', (target.channel_id, target.user_id), -1)
+
+    def _on_before_flush(self, session, flush_context, instances):
+        # Changes recorded by a flush that failed were rolled back with it
+        session.info.pop(DISTINCT_CHANGES_KEY, None)
+
+    def _on_after_flush(self, session, flush_context):
+        changes = session.info.pop(DISTINCT_CHANGES_KEY, None)
+        if not changes:
+            return
+        connection = session.connection()
+        for (_, (channel_id, user_id)), (inserted, deleted) in changes.items():
+            delta = distinct_delta(connection, "message WHERE channel_id = :channel_id AND user_id = :user_id",
+                                   {'channel_id': channel_id, 'user_id': user_id}, inserted, deleted)
+            if delta:
+                # The message events already bumped the version in this flush
+                connection.execute(
+                    text("UPDATE channel_stats SET distinct_posters = distinct_posters + :delta "
+                         "WHERE channel_id = :channel_id"),
+                    {'channel_id': channel_id, 'delta': delta}
+                )
+
+    def rebuild(self):
+        """Recompute all rows from scratch; returns the number of channels"""
+        try:
+            # Keep versions increasing so no process cache mistakes a rebuilt row for its old one
+            version = self.db.session.execute(text("SELECT COALESCE(MAX(version), 0) + 1 FROM channel_stats")).scalar()
+            self.db.session.execute(text("DELETE FROM channel_stats"))
+            result = self.db.session.execute(text(
+                "INSERT INTO channel_stats (channel_id, message_count, reply_count, distinct_posters, "
+                "last_activity, version) "
+                "SELECT c.id, "
+                "(SELECT COUNT(*) FROM message m WHERE m.channel_id = c.id AND m.parent_id IS NULL), "
+                "(SELECT COUNT(*) FROM message m WHERE m.channel_id = c.id AND m.parent_id IS NOT NULL), "
+                "(SELECT COUNT(DISTINCT m.user_id) FROM message m WHERE m.channel_id = c.id), "
+                "(SELECT MAX(m.timestamp) FROM message m WHERE m.channel_id = c.id), "
+                ":version "
+                "FROM channel c"
+            ), {'version': version})
+            self.db.session.commit()
+            with self._lock:
+                self._cache.clear()
+            return result.rowcount
+        except Exception as e:
+            logging.error(f"Error rebuilding channel stats: {str(e)}")
+            self.db.session.rollback()
+            raise
+
+channel_stats = ChannelStatsCache()
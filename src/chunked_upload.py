@@ -0,0 +1,223 @@
+"""
+Resumable chunked file uploads over Socket.IO.
+
+A client opens a session with upload_init, sends the file as binary
+upload_chunk events at increasing offsets, then finishes with upload_commit.
+Each chunk is appended to a partial file on disk and fed to a running SHA-256,
+so memory use does not depend on file size. Every chunk is acknowledged with
+the next expected offset and clients wait for that ack before sending more.
+The server enforces the same backpressure itself: it takes at most
+UPLOAD_WINDOW_CHUNKS chunks of a session at a time and rejects chunks that
+start more than one window past the last byte written. Session state is also written next to
+the partial file. After a reconnect, or a server restart, upload_init with the
+same upload_id resumes from the last byte written.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+class UploadError(Exception):
+    """Raised for invalid upload requests; the message is safe to show to the client"""
+
+class UploadSession:
+    def __init__(self, upload_id, user_id, name, size, part_path):
+        self.upload_id = upload_id
+        self.user_id = user_id
+        self.name = name
+        self.size = size
+        self.part_path = part_path
+        self.received = 0
+        self.in_flight = 0  # upload_chunk calls currently handling this session
+        self.hasher = hashlib.sha256()
+        self.updated_at = time.time()
+        self.lock = threading.Lock()
+
+    def to_dict(self):
+        return {
+            'upload_id': self.upload_id,
+            'user_id': self.user_id,
+            'name': self.name,
+            'size': self.size
+        }
+
+class ChunkedUploadManager:
+    def __init__(self):
+        self.directory = None
+        self.chunk_size = None
+        self.session_ttl = None
+        self.max_sessions_per_user = None
+        self.window_chunks = None
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        app.config.setdefault('UPLOAD_CHUNK_SIZE', 256 * 1024)  # Largest chunk accepted per event
+        app.config.setdefault('UPLOAD_SESSION_TTL', 24 * 3600)  # Seconds an idle upload can be resumed
+        app.config.setdefault('UPLOAD_MAX_SESSIONS_PER_USER', 4)
+        app.config.setdefault('UPLOAD_WINDOW_CHUNKS', 4)  # Chunks a session may have in flight
+        self.chunk_size = app.config['UPLOAD_CHUNK_SIZE']
+        self.session_ttl = app.config['UPLOAD_SESSION_TTL']
+        self.max_sessions_per_user = app.config['UPLOAD_MAX_SESSIONS_PER_USER']
+        self.window_chunks = app.config['UPLOAD_WINDOW_CHUNKS']
+        self.max_size = app.config['MAX_CONTENT_LENGTH']
+        self.directory = os.path.join(app.config['UPLOAD_FOLDER'], '.partial')
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _state_path(self, upload_id):
+        return os.path.join(self.directory, f'{upload_id}.json')
+
+    def _part_path(self, upload_id):
+        return os.path.join(self.directory, f'{upload_id}.part')
+
+    def start(self, user_id, name, size, upload_id=None):
+        """Open a new upload session, or resume ``upload_id`` if it still exists"""
+        self.expire_sessions()
+
+        if upload_id:
+            session = self._get(user_id, upload_id)
+            if session.name != name or session.size != size:
+                raise UploadError('Upload does not match the original file')
+            return session
+
+        if not isinstance(size, int) or size < 0:
+            raise UploadError('Invalid file size')
+        if size > self.max_size:
+            raise UploadError(f'File is larger than {self.max_size // (1024 * 1024)}MB')
+
+        with self._lock:
+            active = sum(1 for session in self._sessions.values() if session.user_id == user_id)
+            if active >= self.max_sessions_per_user:
+                raise UploadError('Too many uploads in progress')
+
+            upload_id = uuid.uuid4().hex
+            session = UploadSession(upload_id, user_id, name, size, self._part_path(upload_id))
+            open(session.part_path, 'wb').close()
+            with open(self._state_path(upload_id), 'w') as f:
+                json.dump(session.to_dict(), f)
+            self._sessions[upload_id] = session
+        logging.info(f"Started chunked upload {upload_id} for {name} ({size} bytes)")
+        return session
+
+    def get(self, user_id, upload_id):
+        """The open session ``upload_id`` of ``user_id``; raises UploadError if there is none"""
+        return self._get(user_id, upload_id)
+
+    def _get(self, user_id, upload_id):
+        with self._lock:
+            session = self._sessions.get(upload_id)
+            if session is None:
+                session = self._restore(upload_id)
+        if session is None or session.user_id != user_id:
+            raise UploadError('Unknown or expired upload')
+        return session
+
+    def _restore(self, upload_id):
+        """Rebuild a session left on disk by a previous process, rehashing what was received"""
+        if not all(c in '0123456789abcdef' for c in upload_id):
+            return None
+        try:
+            with open(self._state_path(upload_id)) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        session = UploadSession(state['upload_id'], state['user_id'], state['name'], state['size'],
+                                self._part_path(upload_id))
+        try:
+            with open(session.part_path, 'rb') as f:
+                for block in iter(lambda: f.read(1024 * 1024), b''):
+                    session.hasher.update(block)
+                    session.received += len(block)
+        except OSError as e:
+            # The partial file is gone (swept, or lost with the disk); the session cannot resume
+            logging.info(f"Treating chunked upload {upload_id} as expired: {str(e)}")
+            self._discard(session, locked=True)
+            return None
+        self._sessions[upload_id] = session
+        logging.info(f"Restored chunked upload {upload_id} at offset {session.received}")
+        return session
+
+    def write_chunk(self, user_id, upload_id, offset, data):
+        """Append one chunk at ``offset`` and return the next expected offset"""
+        session = self._get(user_id, upload_id)
+        if not isinstance(data, (bytes, bytearray)):
+            raise UploadError('Chunk data must be binary')
+        if len(data) > self.chunk_size:
+            raise UploadError(f'Chunks may be at most {self.chunk_size} bytes')
+
+        with self._lock:
+            if session.in_flight >= self.window_chunks:
+                raise UploadError('Too many chunks in flight; wait for an ack before sending more')
+            session.in_flight += 1
+        try:
+            with session.lock:
+                if not isinstance(offset, int) or offset < 0:
+                    raise UploadError('Invalid chunk offset')
+                if offset > session.received + self.window_chunks * self.chunk_size:
+                    raise UploadError('Chunk is beyond the upload window')
+                if offset != session.received:
+                    # Out of order or a resend; tell the client where to continue from
+                    return session.received
+                if session.received + len(data) > session.size:
+                    raise UploadError('Chunk extends past the declared file size')
+
+                with open(session.part_path, 'ab') as f:
+                    f.write(data)
+                session.hasher.update(data)
+                session.received += len(data)
+                session.updated_at = time.time()
+                return session.received
+        finally:
+            with self._lock:
+                session.in_flight -= 1
+
+    def commit(self, user_id, upload_id, expected_sha256=None):
+        """Finish an upload. Returns ``(part_path, name, sha256)``; the caller must move the file."""
+        session = self._get(user_id, upload_id)
+        with session.lock:
+            if session.received != session.size:
+                raise UploadError(f'Upload incomplete: {session.received} of {session.size} bytes received')
+            digest = session.hasher.hexdigest()
+            if expected_sha256 and expected_sha256.lower() != digest:
+                self.abort(user_id, upload_id)
+                raise UploadError('Checksum mismatch')
+
+        with self._lock:
+            self._sessions.pop(upload_id, None)
+        os.remove(self._state_path(upload_id))
+        return session.part_path, session.name, digest
+
+    def abort(self, user_id, upload_id):
+        session = self._get(user_id, upload_id)
+        self._discard(session)
+
+    def _discard(self, session, locked=False):
+        if locked:
+            self._sessions.pop(session.upload_id, None)
+        else:
+            with self._lock:
+                self._sessions.pop(session.upload_id, None)
+        for path in (session.part_path, self._state_path(session.upload_id)):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def expire_sessions(self):
+        """Delete sessions that have been idle for longer than the TTL"""
+        cutoff = time.time() - self.session_ttl
+        with self._lock:
+            expired = [session for session in self._sessions.values() if session.updated_at < cutoff]
+        for session in expired:
+            logging.info(f"Expiring idle upload {session.upload_id}")
+            self._discard(session)
+
+        # Sessions left on disk by a previous process that were never resumed
+        for entry in os.scandir(self.directory):
+            upload_id = entry.name.split('.', 1)[0]
+            if upload_id not in self._sessions and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+
+chunked_uploads = ChunkedUploadManager()
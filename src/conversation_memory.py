@@ -0,0 +1,77 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Hashable, List, Optional
+
+from langchain.memory import ConversationBufferWindowMemory, ConversationTokenBufferMemory
+
+class ConversationMemoryStore:
+    """
+    Per-session conversation memory for the RAG chain.
+
+    Each session (normally a user) gets its own memory, bounded either to
+    the last max_turns exchanges or, when max_tokens is set, to a token
+    budget. Sessions idle for longer than idle_ttl seconds are dropped. So
+    are the least recently used sessions once there are more than
+    max_sessions.
+    """
+
+    def __init__(self, llm, max_turns: int = 5, max_tokens: Optional[int] = None,
+                 idle_ttl: float = 1800, max_sessions: int = 1000):
+        self.llm = llm
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[Hashable, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _new_memory(self):
+        options = dict(
+            memory_key="chat_history",
+            return_messages=True,
+            input_key="question",
+            output_key="answer"
+        )
+        if self.max_tokens:
+            return ConversationTokenBufferMemory(llm=self.llm, max_token_limit=self.max_tokens, **options)
+        return ConversationBufferWindowMemory(k=self.max_turns, **options)
+
+    def _session(self, session_id: Hashable, create: bool):
+        now = time.monotonic()
+        idle = [key for key, session in self._sessions.items() if now - session["last_used"] > self.idle_ttl]
+        for key in idle:
+            del self._sessions[key]
+
+        session = self._sessions.get(session_id)
+        if session is None:
+            if not create:
+                return None
+            session = {"memory": self._new_memory()}
+            self._sessions[session_id] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        session["last_used"] = now
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def history(self, session_id: Hashable) -> List:
+        """Chat history messages to send with the next question"""
+        with self._lock:
+            session = self._session(session_id, create=False)
+            if session is None:
+                return []
+            return session["memory"].load_memory_variables({})["chat_history"]
+
+    def record(self, session_id: Hashable, question: str, answer: str):
+        """Append one exchange, trimming the session back within its bound"""
+        with self._lock:
+            memory = self._session(session_id, create=True)["memory"]
+            memory.save_context({"question": question}, {"answer": answer})
+            if not self.max_tokens:
+                # The window memory only limits what it returns; drop older turns for real
+                memory.chat_memory.messages = memory.chat_memory.messages[-2 * self.max_turns:]
+
+    def clear(self, session_id: Hashable):
+        with self._lock:
+            self._sessions.pop(session_id, None)
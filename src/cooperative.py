@@ -0,0 +1,59 @@
+"""
+Async mode selection for Socket.IO serving.
+
+SOCKETIO_ASYNC_MODE picks how sockets are served:
+
+- threading: one OS thread per connection (Werkzeug dev server, the default)
+- gevent:    greenlets; thousands of idle sockets cost little memory
+- eventlet:  greenlets via eventlet
+
+In the greenlet modes, monkey_patch() must run before anything else is
+imported. It makes sockets, time.sleep and threading cooperative, and also
+psycopg2 when psycogreen is installed. Work that holds the CPU without doing
+I/O goes through run_blocking() so it runs on a native thread pool and does
+not stall every connection on the process.
+"""
+import logging
+import os
+
+ASYNC_MODE = os.environ.get("SOCKETIO_ASYNC_MODE", "threading")
+
+def monkey_patch():
+    """Patch the standard library for the configured greenlet mode. Call before other imports."""
+    if ASYNC_MODE == "gevent":
+        from gevent import monkey
+        monkey.patch_all()
+        try:
+            from psycogreen.gevent import patch_psycopg
+            patch_psycopg()
+        except ImportError:
+            logging.warning("psycogreen is not installed; Postgres queries will block the gevent hub")
+    elif ASYNC_MODE == "eventlet":
+        import eventlet
+        eventlet.monkey_patch()
+        try:
+            from psycogreen.eventlet import patch_psycopg
+            patch_psycopg()
+        except ImportError:
+            logging.warning("psycogreen is not installed; Postgres queries will block the eventlet hub")
+
+def run_blocking(fn, *args, **kwargs):
+    """
+    Run CPU-bound ``fn`` off the event loop and return its result.
+
+    ``fn`` runs on a real OS thread, so it must not touch sockets, locks or
+    anything else that was monkey-patched. Plain NumPy, tiktoken or file
+    parsing calls are fine. In threading mode this is a direct call.
+    """
+    if ASYNC_MODE == "gevent":
+        import gevent
+        return gevent.get_hub().threadpool.apply(fn, args, kwargs)
+    if ASYNC_MODE == "eventlet":
+        from eventlet import tpool
+        return tpool.execute(fn, *args, **kwargs)
+    return fn(*args, **kwargs)
+
+def cooperative_yield():
+    """Let other greenlets run during a long loop; a no-op cost under threading"""
+    import time
+    time.sleep(0)
@@ -0,0 +1,103 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Dict, Iterable, List
+
+logger = logging.getLogger(__name__)
+
+def content_hash(text: str) -> str:
+    """Stable hex digest of a chunk's text, used as the embedding cache key"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def chunk_id(text: str, metadata: Dict) -> str:
+    """
+    Vector ID of a chunk: its content hash scoped to the channel and source
+    document it came from, so identical text in two documents stays two
+    vectors while re-ingesting the same document overwrites its own.
+    """
+    scope = "\0".join([str(metadata.get("channel", "")), str(metadata.get("source", "")), content_hash(text)])
+    return hashlib.sha256(scope.encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    """
+    Persistent embedding cache keyed by (model, content hash).
+
+    Entries live in a local SQLite file so they survive restarts. When the
+    cache holds more than max_entries rows, the least recently used ones are
+    evicted.
+    """
+
+    def __init__(self, path: str, max_entries: int = 10000):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embedding_cache ("
+            "model TEXT NOT NULL, content_hash TEXT NOT NULL, vector BLOB NOT NULL, "
+            "last_used REAL NOT NULL, PRIMARY KEY (model, content_hash))"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_embedding_cache_last_used ON embedding_cache (last_used)"
+        )
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COUNT(*) FROM embedding_cache").fetchone()[0]
+        logger.info(f"Embedding cache at {path} holds {self._size} entries")
+
+    def get_many(self, model: str, hashes: Iterable[str]) -> Dict[str, List[float]]:
+        """Return the cached vectors for whichever of hashes are present"""
+        hashes = list(set(hashes))
+        if not hashes:
+            return {}
+
+        found = {}
+        with self._lock:
+            # Stay under SQLite's bound parameter limit
+            for i in range(0, len(hashes), 500):
+                part = hashes[i:i + 500]
+                placeholders = ", ".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT content_hash, vector FROM embedding_cache "
+                    f"WHERE model = ? AND content_hash IN ({placeholders})",
+                    [model, *part]
+                ).fetchall()
+                for digest, blob in rows:
+                    found[digest] = array("f", blob).tolist()
+
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embedding_cache SET last_used = ? WHERE model = ? AND content_hash = ?",
+                    [(now, model, digest) for digest in found]
+                )
+                self._conn.commit()
+        return found
+
+    def put_many(self, model: str, vectors: Dict[str, List[float]]):
+        """Store vectors by content hash, evicting least recently used entries if over capacity"""
+        if not vectors:
+            return
+
+        now = time.time()
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embedding_cache (model, content_hash, vector, last_used) "
+                "VALUES (?, ?, ?, ?)",
+                [(model, digest, array("f", vector).tobytes(), now) for digest, vector in vectors.items()]
+            )
+            self._size += self._conn.total_changes - before
+
+            overflow = self._size - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM embedding_cache WHERE rowid IN ("
+                    "SELECT rowid FROM embedding_cache ORDER BY last_used LIMIT ?)",
+                    (overflow,)
+                )
+                self._size -= overflow
+                logger.info(f"Evicted {overflow} entries from the embedding cache")
+            self._conn.commit()
@@ -0,0 +1,216 @@
+"""
+Background embedding of uploaded files.
+
+Upload routes commit the Message together with an EmbeddingJob row and return
+immediately. A small pool of worker threads claims queued jobs, extracts the
+text, adds it to the RAG index and records the outcome on
+Message.embedding_status, pushing each change to the channel over Socket.IO.
+Jobs live in the database, so anything queued survives a restart. A job
+that fails with a retryable error waits out a jittered exponential backoff
+(EmbeddingJob.not_before) before any worker claims it again, so an outage
+of the embedding API does not turn into a hot retry loop.
+"""
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import or_
+
+class EmbeddingQueue:
+    def __init__(self):
+        self.app = None
+        self.socketio = None
+        self._wakeup = threading.Event()
+        self._workers = []
+
+    def init_app(self, app, socketio):
+        """Configure the queue; workers only run once start() is called"""
+        self.app = app
+        self.socketio = socketio
+        app.config.setdefault('EMBEDDING_WORKERS', 2)
+        app.config.setdefault('EMBEDDING_MAX_ATTEMPTS', 3)
+        app.config.setdefault('EMBEDDING_POLL_INTERVAL', 5)  # seconds
+        app.config.setdefault('EMBEDDING_JOB_TIMEOUT', 600)  # seconds before a running job counts as abandoned
+        app.config.setdefault('EMBEDDING_RETRY_BACKOFF_BASE', 5)  # seconds; doubles with every attempt
+        app.config.setdefault('EMBEDDING_RETRY_BACKOFF_MAX', 300)  # seconds
+
+    def start(self):
+        """Requeue jobs abandoned by a previous process and start the worker pool
+
+        Called by the server entry points only, so `flask` CLI commands and
+        other processes importing the app never claim jobs.
+        """
+        if self._workers:
+            return
+        with self.app.app_context():
+            self._requeue_stale_jobs()
+
+        for i in range(self.app.config['EMBEDDING_WORKERS']):
+            worker = threading.Thread(target=self._worker_loop, name=f'embedding-worker-{i}', daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        logging.info(f"Started {len(self._workers)} embedding workers")
+
+    def enqueue(self, message):
+        """Queue ``message`` for embedding. The job is committed with the caller's session."""
+        from app import db
+        from models import EmbeddingJob
+
+        job = EmbeddingJob(message=message)
+        db.session.add(job)
+        return job
+
+    def notify(self):
+        """Wake idle workers after committing new jobs"""
+        self._wakeup.set()
+
+    def _requeue_stale_jobs(self):
+        from app import db
+        from models import EmbeddingJob
+
+        cutoff = datetime.utcnow() - timedelta(seconds=self.app.config['EMBEDDING_JOB_TIMEOUT'])
+        try:
+            requeued = EmbeddingJob.query\
+                .filter(EmbeddingJob.status == 'running', EmbeddingJob.updated_at < cutoff)\
+                .update({'status': 'queued', 'updated_at': datetime.utcnow()}, synchronize_session=False)
+            db.session.commit()
+            if requeued:
+                logging.info(f"Requeued {requeued} abandoned embedding jobs")
+        except Exception as e:
+            logging.error(f"Error requeueing embedding jobs: {str(e)}")
+            db.session.rollback()
+
+    def _claim_next(self):
+        """Atomically move the oldest queued job that is not backing off to running and return its id"""
+        from app import db
+        from models import EmbeddingJob
+
+        job = EmbeddingJob.query\
+            .filter(EmbeddingJob.status == 'queued', or_(
+                EmbeddingJob.not_before.is_(None),
+                EmbeddingJob.not_before <= datetime.utcnow()
+            ))\
+            .order_by(EmbeddingJob.id).first()
+        if not job:
+            return None
+
+        # Another worker (or process) may claim the same row; only one UPDATE wins
+        claimed = EmbeddingJob.query\
+            .filter_by(id=job.id, status='queued')\
+            .update({
+                'status': 'running',
+                'attempts': EmbeddingJob.attempts + 1,
+                'updated_at': datetime.utcnow()
+            }, synchronize_session=False)
+        db.session.commit()
+        return job.id if claimed else self._claim_next()
+
+    def _release(self, job_id):
+        """Put a claimed job back without spending the attempt"""
+        from app import db
+        from models import EmbeddingJob
+
+        EmbeddingJob.query\
+            .filter_by(id=job_id, status='running')\
+            .update({
+                'status': 'queued',
+                'attempts': EmbeddingJob.attempts - 1,
+                'updated_at': datetime.utcnow()
+            }, synchronize_session=False)
+        db.session.commit()
+
+    def _worker_loop(self):
+        from app import db
+        from rag_utils import rag_manager, RAGUnavailableError
+
+        while True:
+            with self.app.app_context():
+                try:
+                    job_id = self._claim_next()
+                    if job_id is not None:
+                        # Only work to do starts the RAG system, so RAG_WARMUP=false stays lazy
+                        try:
+                            rag_manager.get(timeout=self.app.config['EMBEDDING_POLL_INTERVAL'])
+                        except RAGUnavailableError as e:
+                            logging.info(f"Leaving embedding job {job_id} queued: {str(e)}")
+                            self._release(job_id)
+                            job_id = None
+                    if job_id is not None:
+                        self._process(job_id)
+                except Exception as e:
+                    logging.error(f"Error in embedding worker: {str(e)}", exc_info=True)
+                    db.session.rollback()
+                    job_id = None
+
+            if job_id is None:
+                self._wakeup.wait(timeout=self.app.config['EMBEDDING_POLL_INTERVAL'])
+                self._wakeup.clear()
+
+    def _process(self, job_id):
+        from app import db, extract_text_from_file
+        from blob_store import blob_store
+        from models import EmbeddingJob
+        from rag_utils import rag_manager
+
+        job = EmbeddingJob.query.get(job_id)
+        message = job.message
+        logging.info(f"Processing embedding job {job.id} for {message.file_name} (attempt {job.attempts})")
+
+        retry = False
+        try:
+            if message.file_digest:
+                file_path = blob_store.path(message.file_digest)
+            else:
+                file_path = message.file_path
+            text_content = extract_text_from_file(file_path, message.file_type, message.file_name)
+            if text_content:
+                metadata = {
+                    "source": message.file_name,
+                    "channel": message.channel.name,
+                    "uploader": message.user.username,
+                    "content_type": message.file_type
+                }
+                success = rag_manager.add_documents([text_content], [metadata])
+                error = None if success else 'Failed to add to vector store'
+                retry = not success
+            else:
+                success = False
+                error = 'Failed to extract text content'
+        except Exception as e:
+            logging.error(f"Error embedding {message.file_name}: {str(e)}", exc_info=True)
+            success = False
+            error = str(e)
+            retry = True
+
+        if success:
+            job.status = 'done'
+            message.embedding_status = 'success'
+        elif retry and job.attempts < self.app.config['EMBEDDING_MAX_ATTEMPTS']:
+            job.status = 'queued'
+            job.not_before = datetime.utcnow() + timedelta(seconds=self._retry_delay(job.attempts))
+        else:
+            job.status = 'failed'
+            message.embedding_status = 'failed'
+        job.last_error = error[:500] if error else None
+        job.updated_at = datetime.utcnow()
+        db.session.commit()
+        if job.status == 'queued':
+            logging.info(f"Embedding job {job.id} for {message.file_name}: retrying after {job.not_before.isoformat()}")
+        else:
+            logging.info(f"Embedding job {job.id} for {message.file_name}: {job.status}")
+
+        if job.status != 'queued':
+            self.socketio.emit('embedding_status', {
+                'message_id': message.id,
+                'file_name': message.file_name,
+                'status': message.embedding_status
+            }, room=message.channel_id)
+
+    def _retry_delay(self, attempts):
+        # Full jitter, as in RAGManager._upsert_with_retry, so failed jobs do not retry in lockstep
+        cap = min(self.app.config['EMBEDDING_RETRY_BACKOFF_MAX'],
+                  self.app.config['EMBEDDING_RETRY_BACKOFF_BASE'] * 2 ** attempts)
+        return random.uniform(0, cap)
+
+embedding_queue = EmbeddingQueue()
@@ -0,0 +1,57 @@
+"""
+Cross-process Socket.IO fan-out.
+
+By default every emit only reaches clients connected to the same process.
+With SOCKETIO_MESSAGE_QUEUE set, emits are published to a shared queue.
+Every worker, whether a web process or a background job, then delivers them
+to its own clients in the target room:
+
+- redis://host:6379/0 (or rediss://, or any other URL python-socketio
+  accepts, e.g. kafka:// or amqp://): the production backend, shared by
+  processes on any node
+- local://<name>: an in-process broker. Several Socket.IO servers created
+  in one process (tests, benchmarks) share rooms as if they were separate
+  workers
+"""
+import logging
+import pickle
+import queue
+import threading
+
+from socketio import PubSubManager
+
+class LocalPubSubManager(PubSubManager):
+    """PubSubManager whose 'broker' is a set of queues shared within the process"""
+
+    name = 'local'
+    _subscribers = {}  # channel -> list of queues, one per manager
+    _subscribers_lock = threading.Lock()
+
+    def __init__(self, channel='socketio', write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self._queue = queue.Queue()
+        if not write_only:
+            with self._subscribers_lock:
+                self._subscribers.setdefault(channel, []).append(self._queue)
+
+    def _publish(self, data):
+        # Pickle like a real broker would, so no subscriber shares objects with the publisher
+        message = pickle.dumps(data)
+        with self._subscribers_lock:
+            subscribers = list(self._subscribers.get(self.channel, []))
+        for subscriber in subscribers:
+            subscriber.put(message)
+
+    def _listen(self):
+        while True:
+            yield self._queue.get()
+
+def socketio_queue_options(url, channel='teamflow'):
+    """Keyword arguments for SocketIO.init_app() that select the fan-out backend"""
+    if not url:
+        return {}
+    if url.startswith('local://'):
+        logging.info(f"Socket.IO fan-out through the in-process broker '{url[len('local://'):] or channel}'")
+        return {'client_manager': LocalPubSubManager(channel=url[len('local://'):] or channel)}
+    logging.info(f"Socket.IO fan-out through {url.split('://', 1)[0]}")
+    return {'message_queue': url, 'channel': channel}
@@ -0,0 +1,160 @@
+"""
+Group commit for chat messages sent over Socket.IO.
+
+With MESSAGE_GROUP_COMMIT enabled, socket handlers do not commit each
+message themselves. They hand it to a single writer thread and wait for the
+result. The writer gathers whatever arrives within MESSAGE_BATCH_MAX_DELAY
+seconds, up to MESSAGE_BATCH_MAX_SIZE messages, inserts the batch and
+commits once. One commit (and one fsync) then covers the whole batch.
+
+The writer takes messages in arrival order, inserts them in that order and
+broadcasts them after the commit in that order too. So messages in a
+channel get increasing ids and reach clients in the order they were sent.
+Each sender's Future resolves to the broadcast payload, including the new id.
+A sender that times out cancels its Future. If the writer has not taken
+the message yet, it is dropped. Otherwise the sender waits up to one more
+MESSAGE_COMMIT_TIMEOUT for the commit under way, so a reported failure
+means the message was not saved unless that second wait runs out too.
+Futures are resolved before the broadcast, and a failed emit is only
+logged, so a broken message queue cannot block senders or stop the writer.
+"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+
+class MessageWriter:
+    def __init__(self):
+        self.app = None
+        self.socketio = None
+        self.enabled = False
+        self._queue = queue.Queue()
+        self._thread = None
+
+    def init_app(self, app, socketio):
+        self.app = app
+        self.socketio = socketio
+        app.config.setdefault('MESSAGE_GROUP_COMMIT', False)
+        app.config.setdefault('MESSAGE_BATCH_MAX_SIZE', 100)
+        app.config.setdefault('MESSAGE_BATCH_MAX_DELAY', 0.01)  # seconds to wait for more messages
+        app.config.setdefault('MESSAGE_COMMIT_TIMEOUT', 10)  # seconds a sender waits for its batch
+
+        self.enabled = app.config['MESSAGE_GROUP_COMMIT']
+        if self.enabled:
+            self._thread = threading.Thread(target=self._run, name='message-writer', daemon=True)
+            self._thread.start()
+            logging.info("Group commit enabled for socket messages")
+
+    def submit(self, fields, username, file_data=None):
+        """
+        Queue a message (``fields`` are Message column values) for the next batch.
+        Returns a Future resolving to the broadcast payload once it is committed.
+        """
+        future = Future()
+        self._queue.put((fields, username, file_data, future))
+        return future
+
+    def write(self, fields, username, file_data=None):
+        """Submit and wait for the commit; returns the broadcast payload"""
+        future = self.submit(fields, username, file_data)
+        try:
+            return future.result(timeout=self.app.config['MESSAGE_COMMIT_TIMEOUT'])
+        except TimeoutError:
+            if future.cancel():
+                # Still queued; the writer will skip it
+                raise
+            # Already in a batch being committed; its outcome is about to be known
+            try:
+                return future.result(timeout=self.app.config['MESSAGE_COMMIT_TIMEOUT'])
+            except TimeoutError:
+                logging.error("Message writer did not finish a batch in time; the message may still be saved")
+                raise
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.app.config['MESSAGE_BATCH_MAX_DELAY']
+        while len(batch) < self.app.config['MESSAGE_BATCH_MAX_SIZE']:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            # Senders that gave up before their turn are dropped; the rest can no longer cancel
+            batch = [item for item in self._collect() if item[3].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            with self.app.app_context():
+                try:
+                    results = self._commit(batch)
+                except Exception as e:
+                    # One bad row should not fail everyone else in the batch
+                    logging.warning(f"Group commit of {len(batch)} messages failed, retrying one by one: {str(e)}")
+                    results = []
+                    for item in batch:
+                        try:
+                            results.extend(self._commit([item]))
+                        except Exception as item_error:
+                            logging.error(f"Error saving message: {str(item_error)}")
+                            results.append((item, None, item_error))
+
+            for (_, _, _, future), payload, error in results:
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(payload)
+
+            # Broadcast in commit order so each channel sees messages in id order
+            for _, payload, error in results:
+                if error is not None:
+                    continue
+                try:
+                    self.socketio.emit('message', payload, to=payload['channel_id'])
+                except Exception as e:
+                    logging.error(f"Error broadcasting message {payload['id']}: {str(e)}")
+
+    def _commit(self, batch):
+        from app import db
+        from blob_store import blob_store
+        from models import Message
+
+        try:
+            messages = []
+            for fields, _, file_data, _ in batch:
+                if file_data:
+                    blob_store.register(file_data['digest'], file_data['size'])
+                message = Message(**fields)
+                db.session.add(message)
+                messages.append(message)
+            db.session.commit()
+            return [
+                (item, message_payload(message, item[1]), None)
+                for item, message in zip(batch, messages)
+            ]
+        except Exception:
+            db.session.rollback()
+            raise
+
+def message_payload(message, username):
+    """The 'message' event payload for a newly created message"""
+    return {
+        'id': message.id,
+        'content': message.content,
+        'user': username,
+        'timestamp': message.timestamp.isoformat(),
+        'channel_id': message.channel_id,
+        'parent_id': message.parent_id,
+        'file': {
+            'name': message.file_name,
+            'path': message.file_path,
+            'type': message.file_type
+        } if message.file_name else None
+    }
+
+message_writer = MessageWriter()
@@ -0,0 +1,34 @@
+"""
+Gunicorn settings for serving TeamFlow with cooperative workers.
+
+    gunicorn -c gunicorn.conf.py serve:app
+
+Every setting can be overridden from the environment. With more than one
+worker, Socket.IO needs sticky sessions at the load balancer and
+SOCKETIO_MESSAGE_QUEUE set (see fanout.py), plus PRESENCE_BACKEND=redis.
+Without them, long-polling clients and room broadcasts break across processes.
+"""
+import os
+
+os.environ.setdefault("SOCKETIO_ASYNC_MODE", "gevent")
+
+# Patch before anything else imports the standard library's blocking modules
+from cooperative import ASYNC_MODE, monkey_patch
+monkey_patch()
+
+bind = os.environ.get("GUNICORN_BIND", f"0.0.0.0:{os.environ.get('PORT', 5001)}")
+workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+worker_class = {
+    "gevent": "gevent",
+    "eventlet": "eventlet",
+}.get(ASYNC_MODE, "gthread")
+threads = int(os.environ.get("GUNICORN_THREADS", 100))  # Only used by gthread
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", 20000))  # Sockets per greenlet worker
+# Never preload: importing serve opens DB connections and starts background threads
+# (embedding workers, presence, reaction broadcasts, group commit) that do not
+# survive fork, so every worker has to import it itself
+preload_app = False
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = 75  # Longer than typical load balancer idle timeouts
+accesslog = "-"
@@ -1,5 +1,11 @@
-from app import app, socketio
+import os
+from app import app, socketio, start_background_services
+from cooperative import ASYNC_MODE
 from socket_events import *  # Register socket events
 
 if __name__ == "__main__":
-    socketio.run(app, host="0.0.0.0", port=5001, debug=True, allow_unsafe_werkzeug=True)
\ No newline at end of file
+    # Development server; use serve.py or gunicorn.conf.py in production
+    start_background_services()
+    socketio.run(app, host="0.0.0.0", port=int(os.environ.get("PORT", 5001)),
+                 debug=os.environ.get("FLASK_DEBUG", "true").lower() == "true",
+                 allow_unsafe_werkzeug=ASYNC_MODE == "threading")
@@ -0,0 +1,36 @@
+"""EmbeddingJob.not_before for retry backoff
+
+Revision ID: 3f7b9d21c6a4
+Revises: a1c4e2f09b31
+Create Date: 2026-10-18 15:00:00.000000
+
+Like the previous revision, checks what already exists so it is safe on a
+database db.create_all() has already brought up to date.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f7b9d21c6a4'
+down_revision = 'a1c4e2f09b31'
+branch_labels = None
+depends_on = None
+
+
+def _columns(inspector, table):
+    return {column['name'] for column in inspector.get_columns(table)}
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if 'embedding_job' in inspector.get_table_names() and 'not_before' not in _columns(inspector, 'embedding_job'):
+        with op.batch_alter_table('embedding_job') as batch_op:
+            batch_op.add_column(sa.Column('not_before', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    inspector = sa.inspect(op.get_bind())
+    if 'embedding_job' in inspector.get_table_names() and 'not_before' in _columns(inspector, 'embedding_job'):
+        with op.batch_alter_table('embedding_job') as batch_op:
+            batch_op.drop_column('not_before')
@@ -0,0 +1,54 @@
+"""Blob table and message.file_digest for the content-addressed upload store
+
+Revision ID: 8c5f3a1d2b47
+Revises:
+Create Date: 2026-10-18 10:00:00.000000
+
+Databases so far were created with db.create_all(), which makes the new
+blob table but never adds the column to an existing message table. Every
+step checks what already exists, so this is also safe on a database
+create_all() just built from scratch.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c5f3a1d2b47'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+FILE_DIGEST_FK = 'fk_message_file_digest_blob'
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+
+    if 'blob' not in inspector.get_table_names():
+        op.create_table(
+            'blob',
+            sa.Column('digest', sa.String(length=64), primary_key=True),
+            sa.Column('size', sa.BigInteger(), nullable=False),
+            sa.Column('ref_count', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+        )
+
+    if 'file_digest' not in {column['name'] for column in inspector.get_columns('message')}:
+        with op.batch_alter_table('message') as batch_op:
+            batch_op.add_column(sa.Column('file_digest', sa.String(length=64), nullable=True))
+            batch_op.create_foreign_key(FILE_DIGEST_FK, 'blob', ['file_digest'], ['digest'])
+
+
+def downgrade():
+    inspector = sa.inspect(op.get_bind())
+
+    if 'file_digest' in {column['name'] for column in inspector.get_columns('message')}:
+        foreign_keys = {fk['name'] for fk in inspector.get_foreign_keys('message')}
+        with op.batch_alter_table('message') as batch_op:
+            if FILE_DIGEST_FK in foreign_keys:
+                batch_op.drop_constraint(FILE_DIGEST_FK, type_='foreignkey')
+            batch_op.drop_column('file_digest')
+
+    if 'blob' in inspector.get_table_names():
+        op.drop_table('blob')
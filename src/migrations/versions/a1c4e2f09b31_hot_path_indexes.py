@@ -0,0 +1,78 @@
+"""Hot-path indexes and reaction uniqueness
+
+Revision ID: a1c4e2f09b31
+Revises: 8c5f3a1d2b47
+Create Date: 2026-10-18 12:00:00.000000
+
+Databases so far were created with db.create_all(), which makes missing
+tables but never alters existing ones. This revision brings any such
+database up to the current models. Every step checks what already exists,
+so it is also safe on a database create_all() just built from scratch.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a1c4e2f09b31'
+down_revision = '8c5f3a1d2b47'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('message', 'ix_message_channel_timestamp', ['channel_id', 'timestamp', 'id']),
+    ('message', 'ix_message_parent_timestamp', ['parent_id', 'timestamp']),
+    ('message', 'ix_message_user_timestamp', ['user_id', 'timestamp']),
+    ('message', 'ix_message_channel_user', ['channel_id', 'user_id']),
+    ('thread', 'ix_thread_message_timestamp', ['message_id', 'timestamp']),
+    ('thread', 'ix_thread_user_message', ['user_id', 'message_id']),
+    ('user_bookmark', 'ix_user_bookmark_user', ['user_id']),
+    ('embedding_job', 'ix_embedding_job_status_id', ['status', 'id']),
+]
+
+REACTION_UNIQUE = 'uq_reaction_message_user_emoji'
+
+
+def _existing_indexes(inspector, table):
+    names = {index['name'] for index in inspector.get_indexes(table)}
+    names.update(constraint['name'] for constraint in inspector.get_unique_constraints(table))
+    return names
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    tables = set(inspector.get_table_names())
+
+    if REACTION_UNIQUE not in _existing_indexes(inspector, 'reaction'):
+        # Keep the oldest of any duplicate reactions before enforcing uniqueness
+        op.execute(
+            "DELETE FROM reaction WHERE id NOT IN ("
+            "SELECT MIN(id) FROM reaction GROUP BY message_id, user_id, emoji)"
+        )
+        with op.batch_alter_table('reaction') as batch_op:
+            batch_op.create_unique_constraint(REACTION_UNIQUE, ['message_id', 'user_id', 'emoji'])
+        if 'reaction_count' in tables:
+            # Counts may have included the duplicates just removed
+            op.execute("DELETE FROM reaction_count")
+            op.execute(
+                "INSERT INTO reaction_count (message_id, emoji, count) "
+                "SELECT message_id, emoji, COUNT(*) FROM reaction "
+                "WHERE message_id IS NOT NULL GROUP BY message_id, emoji"
+            )
+
+    for table, name, columns in INDEXES:
+        if table in tables and name not in _existing_indexes(inspector, table):
+            op.create_index(name, table, columns)
+
+
+def downgrade():
+    inspector = sa.inspect(op.get_bind())
+    tables = set(inspector.get_table_names())
+
+    for table, name, _ in reversed(INDEXES):
+        if table in tables and name in _existing_indexes(inspector, table):
+            op.drop_index(name, table_name=table)
+
+    if REACTION_UNIQUE in _existing_indexes(inspector, 'reaction'):
+        with op.batch_alter_table('reaction') as batch_op:
+            batch_op.drop_constraint(REACTION_UNIQUE, type_='unique')
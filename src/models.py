@@ -28,17 +28,14 @@ class User(UserMixin, db.Model):
 
     def get_activity_stats(self):
         """Get user activity statistics"""
-        # Get distinct channels the user has posted in
-        channels_joined = db.session.query(Message.channel_id)\
-            .filter(Message.user_id == self.id)\
-            .distinct()\
-            .count()
-            
+        from activity_stats import activity_stats
+
+        stats = activity_stats.get(self.id)
         return {
-            'total_messages': len(self.messages),
-            'reactions_given': len(self.reactions),
-            'channels_joined': channels_joined,
-            'threads_participated': len(set(thread.message_id for thread in self.thread_messages))
+            'total_messages': stats['message_count'],
+            'reactions_given': stats['reaction_count'],
+            'channels_joined': stats['channels_joined'],
+            'threads_participated': stats['threads_participated']
         }
 
     def get_recent_activity(self, limit=5):
@@ -59,6 +56,13 @@ class Channel(db.Model):
     messages = db.relationship('Message', backref='channel', lazy=True)
 
 class Message(db.Model):
+    __table_args__ = (
+        db.Index('ix_message_channel_timestamp', 'channel_id', 'timestamp', 'id'),  # Channel history keyset
+        db.Index('ix_message_parent_timestamp', 'parent_id', 'timestamp'),  # Replies
+        db.Index('ix_message_user_timestamp', 'user_id', 'timestamp'),  # Recent activity
+        db.Index('ix_message_channel_user', 'channel_id', 'user_id'),  # Distinct-poster checks
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text, nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
@@ -68,6 +72,7 @@ class Message(db.Model):
     file_name = db.Column(db.String(255), nullable=True)
     file_path = db.Column(db.String(255), nullable=True)
     file_type = db.Column(db.String(50), nullable=True)
+    file_digest = db.Column(db.String(64), db.ForeignKey('blob.digest'), nullable=True)  # SHA-256 of the stored file
     embedding_status = db.Column(db.String(20), default='pending')  # Values: pending, success, failed
     is_pinned = db.Column(db.Boolean, default=False)
     pinned_at = db.Column(db.DateTime)
@@ -104,6 +109,11 @@ class Message(db.Model):
         return depth
 
 class Thread(db.Model):
+    __table_args__ = (
+        db.Index('ix_thread_message_timestamp', 'message_id', 'timestamp'),
+        db.Index('ix_thread_user_message', 'user_id', 'message_id'),  # Thread participation checks
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     message_id = db.Column(db.Integer, db.ForeignKey('message.id', ondelete='CASCADE'), nullable=False)
     content = db.Column(db.Text, nullable=False)
@@ -112,6 +122,10 @@ class Thread(db.Model):
     user = db.relationship('User', backref=db.backref('thread_messages', lazy=True))
 
 class Reaction(db.Model):
+    __table_args__ = (
+        db.UniqueConstraint('message_id', 'user_id', 'emoji', name='uq_reaction_message_user_emoji'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     emoji = db.Column(db.String(32), nullable=False)
     message_id = db.Column(db.Integer, db.ForeignKey('message.id', ondelete='CASCADE'))
@@ -120,8 +134,59 @@ class Reaction(db.Model):
     user = db.relationship('User', backref=db.backref('reactions', lazy=True))
 
 class UserBookmark(db.Model):
+    __table_args__ = (
+        db.Index('ix_user_bookmark_user', 'user_id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     message_id = db.Column(db.Integer, db.ForeignKey('message.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    note = db.Column(db.String(256))
\ No newline at end of file
+    note = db.Column(db.String(256))
+
+class EmbeddingJob(db.Model):
+    """Durable queue entry for embedding an uploaded file into the RAG index"""
+    __table_args__ = (
+        db.Index('ix_embedding_job_status_id', 'status', 'id'),  # Claiming the oldest queued job
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    message_id = db.Column(db.Integer, db.ForeignKey('message.id', ondelete='CASCADE'), nullable=False)
+    status = db.Column(db.String(20), default='queued')  # Values: queued, running, done, failed
+    attempts = db.Column(db.Integer, default=0)
+    not_before = db.Column(db.DateTime)  # Retry backoff: not claimed again until then
+    last_error = db.Column(db.String(500))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    message = db.relationship('Message', backref=db.backref('embedding_jobs', lazy=True, cascade='all, delete-orphan'))
+
+class Blob(db.Model):
+    """A stored upload, shared by every message attaching the same content"""
+    digest = db.Column(db.String(64), primary_key=True)  # SHA-256 hex
+    size = db.Column(db.BigInteger, nullable=False)
+    ref_count = db.Column(db.Integer, default=0, nullable=False)  # Messages with file_digest == digest
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class UserStats(db.Model):
+    """Activity counters per user, kept current by activity_stats"""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    message_count = db.Column(db.Integer, default=0, nullable=False)
+    reaction_count = db.Column(db.Integer, default=0, nullable=False)
+    thread_count = db.Column(db.Integer, default=0, nullable=False)
+    channels_joined = db.Column(db.Integer, default=0, nullable=False)  # Distinct channels posted in
+    threads_participated = db.Column(db.Integer, default=0, nullable=False)  # Distinct messages replied to
+
+class ChannelStats(db.Model):
+    """Aggregates per channel, kept current by channel_stats"""
+    channel_id = db.Column(db.Integer, db.ForeignKey('channel.id', ondelete='CASCADE'), primary_key=True)
+    message_count = db.Column(db.Integer, default=0, nullable=False)  # Top-level messages
+    reply_count = db.Column(db.Integer, default=0, nullable=False)
+    distinct_posters = db.Column(db.Integer, default=0, nullable=False)
+    last_activity = db.Column(db.DateTime)
+    version = db.Column(db.Integer, default=1, nullable=False)  # Bumped on every change
+
+class ReactionCount(db.Model):
+    """How many users reacted to a message with each emoji, kept current by reactions"""
+    message_id = db.Column(db.Integer, db.ForeignKey('message.id', ondelete='CASCADE'), primary_key=True)
+    emoji = db.Column(db.String(32), primary_key=True)
+    count = db.Column(db.Integer, default=0, nullable=False)
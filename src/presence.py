@@ -0,0 +1,353 @@
+"""
+Online presence for connected users.
+
+Socket connects and disconnects only touch an in-memory map of user id to
+open socket ids, so several tabs count as one user. A user goes offline
+when their last socket closes. Changes are not broadcast one by one. A
+background thread collects them and sends one status_changes diff per
+PRESENCE_BROADCAST_INTERVAL. A user who reconnects within
+PRESENCE_OFFLINE_GRACE seconds (a page reload, a network blip) never
+appears offline at all. User.is_online and last_seen are written to the
+database in batches every PRESENCE_FLUSH_INTERVAL.
+
+Set PRESENCE_BACKEND=redis (with PRESENCE_REDIS_URL) to share the socket
+map between several server processes. Each process then refreshes a
+heartbeat key that expires after PRESENCE_HEARTBEAT_TTL seconds, and
+reaps the sockets of any process whose heartbeat has lapsed, so users of a
+crashed worker go offline instead of staying online forever. Every
+process marks its own users offline when it shuts down. The memory backend
+only sees its own process, so it resets everyone's is_online at startup
+only when no message queue is configured, i.e. when it is the only process.
+"""
+import atexit
+import logging
+import threading
+import time
+import uuid
+from datetime import datetime
+from sqlalchemy import update
+
+class MemoryPresenceBackend:
+    """Socket ids per user, for a single server process"""
+
+    def __init__(self):
+        self._sockets = {}
+        self._lock = threading.Lock()
+
+    def add(self, user_id, sid):
+        """Record a socket; returns True if it is the user's first"""
+        with self._lock:
+            sids = self._sockets.setdefault(user_id, set())
+            sids.add(sid)
+            return len(sids) == 1
+
+    def remove(self, user_id, sid):
+        """Forget a socket; returns True if the user has none left"""
+        with self._lock:
+            sids = self._sockets.get(user_id)
+            if not sids:
+                return False
+            sids.discard(sid)
+            if sids:
+                return False
+            del self._sockets[user_id]
+            return True
+
+    def is_online(self, user_id):
+        with self._lock:
+            return user_id in self._sockets
+
+    def online_user_ids(self):
+        with self._lock:
+            return set(self._sockets)
+
+    def heartbeat(self):
+        """Nothing to refresh; returns the users back online after being reaped (never)"""
+        return []
+
+    def reap(self):
+        """Users left without sockets by dead processes; a single process has none"""
+        return []
+
+    def close(self):
+        """Forget this process's sockets; returns the users that are now offline"""
+        with self._lock:
+            user_ids, self._sockets = list(self._sockets), {}
+        return user_ids
+
+class RedisPresenceBackend:
+    """
+    Socket ids per user in Redis, shared by every server process.
+
+    Socket set members are "<process id>:<sid>". Each process also keeps
+    the set of "<user id>:<sid>" it owns and a heartbeat key with a TTL,
+    so the sockets of a process that died without cleaning up can be found
+    and removed by the survivors.
+    """
+
+    ONLINE_KEY = 'presence:online'
+    PROCESSES_KEY = 'presence:processes'
+
+    def __init__(self, url, ttl):
+        import redis
+
+        self.redis = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.process_id = uuid.uuid4().hex
+        self._local = {}  # user_id -> sids on this process, to re-register after being reaped
+        self._lock = threading.Lock()
+        self.heartbeat()
+
+    def _key(self, user_id):
+        return f'presence:user:{user_id}'
+
+    def _process_key(self, process_id):
+        return f'presence:process:{process_id}'
+
+    def _heartbeat_key(self, process_id):
+        return f'presence:heartbeat:{process_id}'
+
+    def add(self, user_id, sid):
+        with self._lock:
+            self._local.setdefault(user_id, set()).add(sid)
+        pipe = self.redis.pipeline()
+        pipe.sadd(self._key(user_id), f'{self.process_id}:{sid}')
+        pipe.scard(self._key(user_id))
+        pipe.sadd(self.ONLINE_KEY, user_id)
+        pipe.sadd(self._process_key(self.process_id), f'{user_id}:{sid}')
+        _, count, _, _ = pipe.execute()
+        return count == 1
+
+    def remove(self, user_id, sid):
+        with self._lock:
+            sids = self._local.get(user_id, set())
+            sids.discard(sid)
+            if not sids:
+                self._local.pop(user_id, None)
+        return self._remove(self.process_id, user_id, sid)
+
+    def _remove(self, process_id, user_id, sid):
+        pipe = self.redis.pipeline()
+        pipe.srem(self._key(user_id), f'{process_id}:{sid}')
+        pipe.scard(self._key(user_id))
+        pipe.srem(self._process_key(process_id), f'{user_id}:{sid}')
+        removed, count, _ = pipe.execute()
+        if removed and count == 0:
+            self.redis.srem(self.ONLINE_KEY, user_id)
+            return True
+        return False
+
+    def is_online(self, user_id):
+        return bool(self.redis.sismember(self.ONLINE_KEY, user_id))
+
+    def online_user_ids(self):
+        return {int(user_id) for user_id in self.redis.smembers(self.ONLINE_KEY)}
+
+    def heartbeat(self):
+        """
+        Refresh this process's heartbeat. If another process reaped it (after
+        a stall longer than the TTL), re-register its sockets and return the
+        users that are back online.
+        """
+        self.redis.set(self._heartbeat_key(self.process_id), 1, ex=self.ttl)
+        if not self.redis.sadd(self.PROCESSES_KEY, self.process_id):
+            return []
+        with self._lock:
+            local = [(user_id, sid) for user_id, sids in self._local.items() for sid in sids]
+        return [user_id for user_id, sid in local if self.add(user_id, sid)]
+
+    def reap(self):
+        """Remove the sockets of processes whose heartbeat expired; returns the users now offline"""
+        offline = []
+        for process_id in self.redis.smembers(self.PROCESSES_KEY):
+            process_id = process_id.decode()
+            if process_id == self.process_id or self.redis.exists(self._heartbeat_key(process_id)):
+                continue
+            if not self.redis.srem(self.PROCESSES_KEY, process_id):
+                continue  # Another process is reaping it
+            entries = self.redis.smembers(self._process_key(process_id))
+            logging.warning(f"Presence heartbeat of process {process_id} expired, removing {len(entries)} sockets")
+            for entry in entries:
+                user_id, sid = entry.decode().split(':', 1)
+                if self._remove(process_id, int(user_id), sid):
+                    offline.append(int(user_id))
+            self.redis.delete(self._process_key(process_id))
+        return offline
+
+    def close(self):
+        """Remove this process's sockets and heartbeat; returns the users now offline"""
+        with self._lock:
+            local, self._local = self._local, {}
+        offline = [user_id for user_id, sids in local.items() for sid in list(sids)
+                   if self._remove(self.process_id, user_id, sid)]
+        self.redis.srem(self.PROCESSES_KEY, self.process_id)
+        self.redis.delete(self._heartbeat_key(self.process_id), self._process_key(self.process_id))
+        return offline
+
+class PresenceTracker:
+    def __init__(self):
+        self.app = None
+        self.socketio = None
+        self.backend = None
+        self._lock = threading.Lock()
+        self._pending_online = set()   # Came online since the last broadcast
+        self._pending_offline = {}     # user_id -> monotonic time the last socket closed
+        self._dirty = {}               # user_id -> (is_online, last_seen) awaiting a DB flush
+        self._thread = None
+
+    def init_app(self, app, socketio):
+        """Configure presence; nothing is tracked until start() is called"""
+        self.app = app
+        self.socketio = socketio
+        app.config.setdefault('PRESENCE_BACKEND', 'memory')
+        app.config.setdefault('PRESENCE_BROADCAST_INTERVAL', 1.0)  # seconds between status_changes diffs
+        app.config.setdefault('PRESENCE_OFFLINE_GRACE', 5.0)  # seconds before a disconnect is reported
+        app.config.setdefault('PRESENCE_FLUSH_INTERVAL', 30.0)  # seconds between last_seen DB writes
+        app.config.setdefault('PRESENCE_HEARTBEAT_TTL', 30.0)  # seconds before a silent process's sockets are reaped
+
+    def start(self):
+        """
+        Pick the backend and start the broadcast/flush thread. Call inside an
+        app context, from a process that serves sockets: a `flask` CLI command
+        resetting the online flags would mark the running server's users offline.
+        """
+        if self._thread is not None:
+            return
+        app = self.app
+        if app.config['PRESENCE_BACKEND'] == 'redis':
+            self.backend = RedisPresenceBackend(app.config['PRESENCE_REDIS_URL'], app.config['PRESENCE_HEARTBEAT_TTL'])
+            # Users of processes that died while this one was down
+            self._mark_offline(self.backend.reap())
+            self.flush()
+        else:
+            self.backend = MemoryPresenceBackend()
+            if app.config.get('SOCKETIO_MESSAGE_QUEUE'):
+                logging.warning("Memory presence backend with several processes: each one only sees its "
+                                "own sockets; set PRESENCE_BACKEND=redis")
+            else:
+                # The only process just started, so nobody can be connected
+                self._reset_online_flags()
+        logging.info(f"Presence backend: {app.config['PRESENCE_BACKEND']}")
+
+        atexit.register(self.shutdown)
+        self._thread = threading.Thread(target=self._run, name='presence', daemon=True)
+        self._thread.start()
+
+    def _reset_online_flags(self):
+        from app import db
+        from models import User
+
+        try:
+            User.query.filter(User.is_online.is_(True)).update({'is_online': False}, synchronize_session=False)
+            db.session.commit()
+        except Exception as e:
+            logging.error(f"Error resetting online flags: {str(e)}")
+            db.session.rollback()
+
+    def _mark_online(self, user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                if self._pending_offline.pop(user_id, None) is None:
+                    self._pending_online.add(user_id)
+                self._dirty[user_id] = (True, datetime.utcnow())
+
+    def _mark_offline(self, user_ids):
+        now = time.monotonic()
+        with self._lock:
+            for user_id in user_ids:
+                self._pending_online.discard(user_id)
+                self._pending_offline[user_id] = now
+                self._dirty[user_id] = (False, datetime.utcnow())
+
+    def shutdown(self):
+        """Take this process's sockets out of the backend and record their users as offline"""
+        try:
+            self._mark_offline(self.backend.close())
+            with self.app.app_context():
+                self.flush()
+        except Exception as e:
+            logging.error(f"Error shutting down presence: {str(e)}")
+
+    def connect(self, user_id, sid):
+        if not self.backend.add(user_id, sid):
+            return
+        with self._lock:
+            # Back within the grace period: the others never saw this user leave
+            if self._pending_offline.pop(user_id, None) is None:
+                self._pending_online.add(user_id)
+            self._dirty[user_id] = (True, datetime.utcnow())
+
+    def disconnect(self, user_id, sid):
+        if not self.backend.remove(user_id, sid):
+            return
+        with self._lock:
+            if user_id in self._pending_online:
+                # Never announced, so there is nothing to take back
+                self._pending_online.discard(user_id)
+            else:
+                self._pending_offline[user_id] = time.monotonic()
+            self._dirty[user_id] = (False, datetime.utcnow())
+
+    def is_online(self, user_id):
+        return self.backend.is_online(user_id)
+
+    def online_user_ids(self):
+        return self.backend.online_user_ids()
+
+    def _run(self):
+        last_flush = time.monotonic()
+        last_heartbeat = time.monotonic()
+        while True:
+            time.sleep(self.app.config['PRESENCE_BROADCAST_INTERVAL'])
+            try:
+                if time.monotonic() - last_heartbeat >= self.app.config['PRESENCE_HEARTBEAT_TTL'] / 3:
+                    last_heartbeat = time.monotonic()
+                    self._mark_online(self.backend.heartbeat())
+                    self._mark_offline(self.backend.reap())
+                self.broadcast_changes()
+                if time.monotonic() - last_flush >= self.app.config['PRESENCE_FLUSH_INTERVAL']:
+                    last_flush = time.monotonic()
+                    with self.app.app_context():
+                        self.flush()
+            except Exception as e:
+                logging.error(f"Error in presence thread: {str(e)}", exc_info=True)
+
+    def broadcast_changes(self):
+        """Send everyone one diff of who came online and who left since the last call"""
+        cutoff = time.monotonic() - self.app.config['PRESENCE_OFFLINE_GRACE']
+        with self._lock:
+            online = sorted(self._pending_online)
+            self._pending_online.clear()
+            offline = sorted(user_id for user_id, since in self._pending_offline.items() if since <= cutoff)
+            for user_id in offline:
+                del self._pending_offline[user_id]
+
+        # With a shared backend another process may hold a socket for this user
+        offline = [user_id for user_id in offline if not self.backend.is_online(user_id)]
+        if online or offline:
+            self.socketio.emit('status_changes', {'online': online, 'offline': offline})
+
+    def flush(self):
+        """Write pending is_online / last_seen values in one batch"""
+        from app import db
+        from models import User
+
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+        if not dirty:
+            return
+        try:
+            db.session.execute(update(User), [
+                {'id': user_id, 'is_online': is_online, 'last_seen': last_seen}
+                for user_id, (is_online, last_seen) in dirty.items()
+            ])
+            db.session.commit()
+        except Exception as e:
+            logging.error(f"Error flushing presence: {str(e)}")
+            db.session.rollback()
+            with self._lock:
+                # Keep the values for the next flush unless newer ones arrived
+                for user_id, value in dirty.items():
+                    self._dirty.setdefault(user_id, value)
+
+presence = PresenceTracker()
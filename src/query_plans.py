@@ -0,0 +1,132 @@
+"""
+Query-plan regression checks for the hot socket handler queries.
+
+Each check builds the same statement a handler runs, then asks the
+database for its plan:
+
+- SQLite: EXPLAIN QUERY PLAN. The check fails on a bare "SCAN <table>"
+  ("SCAN TABLE <table>" before SQLite 3.36), i.e. a full table scan that
+  uses no index.
+- PostgreSQL: EXPLAIN (FORMAT JSON) with enable_seqscan off. This makes the
+  planner use any index that can serve the query, even on small tables, so
+  a remaining Seq Scan on the table means no usable index exists.
+
+Run with `flask check-query-plans`; the exit status is non-zero if any
+query falls back to a sequential scan, so it can gate CI. The tests in
+tests/test_query_plans.py run the same checks.
+"""
+import json
+import re
+import sys
+from datetime import datetime
+
+import click
+from sqlalchemy import and_, func, or_, select, text
+
+def _checks():
+    """(name, table that must not be scanned, statement) for each hot query"""
+    from models import EmbeddingJob, Message, Reaction, Thread
+
+    page_ids = [1, 2, 3]
+    now = datetime.utcnow()
+    return [
+        ('history page (join / load_history)', 'message',
+         select(Message).where(Message.channel_id == 1)
+         .order_by(Message.timestamp.desc(), Message.id.desc()).limit(51)),
+        ('history page after cursor', 'message',
+         select(Message).where(Message.channel_id == 1, or_(
+             Message.timestamp < now,
+             and_(Message.timestamp == now, Message.id < 100)
+         )).order_by(Message.timestamp.desc(), Message.id.desc()).limit(51)),
+        ('reactions for a page', 'reaction',
+         select(Reaction.message_id, Reaction.emoji, Reaction.user_id)
+         .where(Reaction.message_id.in_(page_ids)).order_by(Reaction.id)),
+        ('threads for a page', 'thread',
+         select(Thread.id, Thread.message_id, Thread.content, Thread.user_id, Thread.timestamp)
+         .where(Thread.message_id.in_(page_ids)).order_by(Thread.timestamp, Thread.id)),
+        ('replies for a page', 'message',
+         select(Message.id, Message.parent_id, Message.content, Message.user_id, Message.timestamp)
+         .where(Message.parent_id.in_(page_ids)).order_by(Message.timestamp, Message.id)),
+        ('recent activity (get_user_status)', 'message',
+         select(Message).where(Message.user_id == 1).order_by(Message.timestamp.desc()).limit(5)),
+        ('reaction toggle', 'reaction',
+         select(Reaction.id).where(Reaction.message_id == 1, Reaction.user_id == 1, Reaction.emoji == 'x')),
+        ('distinct poster count (stats)', 'message',
+         select(Message.id).where(Message.channel_id == 1, Message.user_id == 1).limit(2)),
+        ('thread participation count (stats)', 'thread',
+         select(Thread.id).where(Thread.user_id == 1, Thread.message_id == 1).limit(2)),
+        ('channel last activity (stats)', 'message',
+         select(func.max(Message.timestamp)).where(Message.channel_id == 1)),
+        ('claim embedding job', 'embedding_job',
+         select(EmbeddingJob).where(EmbeddingJob.status == 'queued', or_(
+             EmbeddingJob.not_before.is_(None), EmbeddingJob.not_before <= now
+         )).order_by(EmbeddingJob.id).limit(1)),
+    ]
+
+def _compile(statement, dialect):
+    """SQL string and driver-level parameters, ready to be prefixed with EXPLAIN"""
+    # Render expanding IN parameters; the driver would get the placeholder verbatim otherwise
+    compiled = statement.compile(dialect=dialect, compile_kwargs={'render_postcompile': True})
+    params = compiled.construct_params()
+    if compiled.positional:
+        params = tuple(params[name] for name in compiled.positiontup)
+    return str(compiled), params
+
+def _is_full_scan(detail, table):
+    """Whether an EXPLAIN QUERY PLAN line reads all of ``table`` without an index"""
+    # "SCAN message USING INDEX ..." walks an index; a bare "SCAN message" reads the whole table
+    return re.match(rf'SCAN (TABLE )?{re.escape(table)}\b', detail) is not None and 'INDEX' not in detail
+
+def _sqlite_scans(connection, sql, params, table):
+    rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+    details = [row[-1] for row in rows]
+    return [detail for detail in details if _is_full_scan(detail, table)], details
+
+def _postgres_scans(connection, sql, params, table):
+    connection.execute(text("SET LOCAL enable_seqscan = off"))
+    plan = connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {sql}", params).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+
+    scans = []
+    nodes = [plan[0]['Plan']]
+    while nodes:
+        node = nodes.pop()
+        if node.get('Node Type') == 'Seq Scan' and node.get('Relation Name') == table:
+            scans.append(f"Seq Scan on {table}")
+        nodes.extend(node.get('Plans', []))
+    return scans, [json.dumps(plan[0]['Plan'])]
+
+def check_query_plans(engine, verbose=False):
+    """Explain every hot query on ``engine``; returns a list of (name, offending plan lines)"""
+    dialect = engine.dialect
+    if dialect.name == 'sqlite':
+        explain = _sqlite_scans
+    elif dialect.name == 'postgresql':
+        explain = _postgres_scans
+    else:
+        raise RuntimeError(f"Query plan checks are not implemented for {dialect.name}")
+
+    failures = []
+    with engine.connect() as connection:
+        for name, table, statement in _checks():
+            sql, params = _compile(statement, dialect)
+            with connection.begin():
+                scans, plan = explain(connection, sql, params, table)
+            if verbose:
+                print(f"{name}:\n    " + "\n    ".join(plan))
+            if scans:
+                failures.append((name, scans))
+    return failures
+
+def init_app(app, db):
+    @app.cli.command('check-query-plans')
+    @click.option('--verbose', '-v', is_flag=True, help='Print every plan.')
+    def check_query_plans_command(verbose):
+        """Fail if a hot socket handler query needs a full table scan."""
+        failures = check_query_plans(db.engine, verbose=verbose)
+        for name, scans in failures:
+            print(f"FAIL {name}: {'; '.join(scans)}")
+        if failures:
+            sys.exit(1)
+        print(f"All {len(_checks())} hot queries use an index ({db.engine.dialect.name})")
@@ -1,15 +1,24 @@
 import os
-from typing import List, Dict
+import io
+import itertools
+import json
+import random
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 from langchain_openai import OpenAIEmbeddings
 from langchain_openai import ChatOpenAI
-from langchain_community.vectorstores import Pinecone
 from langchain.chains import ConversationalRetrievalChain
-from langchain.memory import ConversationBufferMemory
 from langchain.prompts import PromptTemplate
-from pinecone import Pinecone as PineconeClient, ServerlessSpec
+from langchain_core.callbacks import BaseCallbackHandler
 from dotenv import load_dotenv
+from answer_cache import AnswerCache
+from conversation_memory import ConversationMemoryStore
+from cooperative import cooperative_yield
+from embedding_cache import EmbeddingCache, chunk_id, content_hash
+from vector_store import create_vector_store
 import logging
-import uuid
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+import tiktoken
 import time
 
 # Configure logging
@@ -19,104 +28,183 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
-# Configure LangSmith
-os.environ["LANGCHAIN_TRACING_V2"] = "true"
-os.environ["LANGCHAIN_ENDPOINT"] = os.getenv("LANGSMITH_ENDPOINT")
-os.environ["LANGCHAIN_API_KEY"] = os.getenv("LANGCHAIN_API_KEY")
-os.environ["LANGCHAIN_PROJECT"] = os.getenv("LANGSMITH_PROJECT")
+# Configure LangSmith (only when credentials are present)
+if os.getenv("LANGCHAIN_API_KEY"):
+    os.environ["LANGCHAIN_TRACING_V2"] = "true"
+    if os.getenv("LANGSMITH_ENDPOINT"):
+        os.environ["LANGCHAIN_ENDPOINT"] = os.getenv("LANGSMITH_ENDPOINT")
+    if os.getenv("LANGSMITH_PROJECT"):
+        os.environ["LANGCHAIN_PROJECT"] = os.getenv("LANGSMITH_PROJECT")
 
-# Initialize Pinecone
-PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
-if not PINECONE_API_KEY:
-    raise ValueError("PINECONE_API_KEY environment variable is not set")
-
-pc = PineconeClient(api_key=PINECONE_API_KEY)
-
-# Initialize OpenAI
+# OpenAI credentials; checked when the RAGManager is built, not at import
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-if not OPENAI_API_KEY:
-    raise ValueError("OPENAI_API_KEY environment variable is not set")
 
 # Constants
 INDEX_NAME = os.getenv("PINECONE_INDEX")
 NAMESPACE = "default"
+EMBEDDING_MODEL = "text-embedding-3-large"
+CHUNK_TOKENS = int(os.getenv("RAG_CHUNK_TOKENS", 512))  # Max tokens per embedded chunk
+CHUNK_OVERLAP = int(os.getenv("RAG_CHUNK_OVERLAP", 64))  # Tokens shared by consecutive chunks
+EMBED_BATCH_SIZE = int(os.getenv("RAG_EMBED_BATCH_SIZE", 64))  # Chunks per embedding request
+EMBED_CONCURRENCY = int(os.getenv("RAG_EMBED_CONCURRENCY", 4))  # Embedding batches processed at once
+UPSERT_BATCH_SIZE = 100  # Max vectors per upsert request
+UPSERT_MAX_BYTES = int(os.getenv("RAG_UPSERT_MAX_BYTES", 2 * 1024 * 1024))  # Pinecone's request size limit
+UPSERT_CONCURRENCY = int(os.getenv("RAG_UPSERT_CONCURRENCY", 8))  # Upsert requests in flight at once
+UPSERT_MAX_ATTEMPTS = int(os.getenv("RAG_UPSERT_MAX_ATTEMPTS", 5))
+UPSERT_BACKOFF_BASE = 0.5  # Seconds; doubled on each retry
+UPSERT_BACKOFF_MAX = 30
+EMBEDDING_CACHE_PATH = os.getenv(
+    "EMBEDDING_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "embedding_cache.db")
+)
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", 10000))
+ANSWER_CACHE_TTL = int(os.getenv("RAG_ANSWER_CACHE_TTL", 3600))  # Seconds
+ANSWER_CACHE_SIZE = int(os.getenv("RAG_ANSWER_CACHE_SIZE", 512))
+# Cosine similarity at which a different question reuses a cached answer; unset disables the semantic tier
+ANSWER_CACHE_SIMILARITY = float(os.getenv("RAG_ANSWER_CACHE_SIMILARITY")) if os.getenv("RAG_ANSWER_CACHE_SIMILARITY") else None
+MEMORY_TURNS = int(os.getenv("RAG_MEMORY_TURNS", 5))  # Exchanges kept per conversation
+# Token budget for a conversation's history; when set it replaces the turn window
+MEMORY_MAX_TOKENS = int(os.getenv("RAG_MEMORY_MAX_TOKENS")) if os.getenv("RAG_MEMORY_MAX_TOKENS") else None
+MEMORY_IDLE_TTL = int(os.getenv("RAG_MEMORY_IDLE_TTL", 1800))  # Seconds before an idle conversation is dropped
+MEMORY_MAX_SESSIONS = int(os.getenv("RAG_MEMORY_MAX_SESSIONS", 1000))
+WARMUP_RETRY_INTERVAL = int(os.getenv("RAG_WARMUP_RETRY_INTERVAL", 60))  # Seconds before retrying a failed start
+
+def iter_chunks(text: str, encoding, chunk_tokens: int = CHUNK_TOKENS, overlap: int = CHUNK_OVERLAP) -> Iterator[str]:
+    """
+    Split text into windows of at most chunk_tokens tokens, each sharing
+    overlap tokens with the previous one. The text is tokenized line by line,
+    so only the current window is held in token form.
+    """
+    if overlap >= chunk_tokens:
+        raise ValueError("Chunk overlap must be smaller than the chunk size")
+
+    window = []
+    carried = 0  # Tokens at the start of window that were already emitted
+    for line in io.StringIO(text):
+        window.extend(encoding.encode(line, disallowed_special=()))
+        while len(window) >= chunk_tokens:
+            yield encoding.decode(window[:chunk_tokens])
+            window = window[chunk_tokens - overlap:]
+            carried = overlap
+    if len(window) > carried:
+        yield encoding.decode(window)
+
+class TokenStreamHandler(BaseCallbackHandler):
+    """Forward each token the answering LLM generates to a callback"""
+
+    def __init__(self, on_token: Callable[[str], None]):
+        self.on_token = on_token
+
+    def on_llm_new_token(self, token: str, **kwargs) -> None:
+        if token:
+            self.on_token(token)
+
+class RAGUnavailableError(RuntimeError):
+    """Raised when the RAG system is used before it is ready or after it failed to start"""
 
 class RAGManager:
     def __init__(self):
+        if not OPENAI_API_KEY:
+            raise ValueError("OPENAI_API_KEY environment variable is not set")
+
         self.embeddings = OpenAIEmbeddings(
             openai_api_key=OPENAI_API_KEY,
-            model="text-embedding-3-large"  # This model produces 3072-dimensional embeddings
+            model=EMBEDDING_MODEL  # This model produces 3072-dimensional embeddings
+        )
+        try:
+            self.encoding = tiktoken.encoding_for_model(EMBEDDING_MODEL)
+        except KeyError:
+            # tiktoken releases older than the text-embedding-3 models do not know
+            # their names; every OpenAI embedding model uses cl100k_base
+            self.encoding = tiktoken.get_encoding("cl100k_base")
+        self.embedding_cache = EmbeddingCache(EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_ENTRIES)
+        self.answer_cache = AnswerCache(ANSWER_CACHE_TTL, ANSWER_CACHE_SIZE, ANSWER_CACHE_SIMILARITY)
+        self.llm = self._create_llm()
+        
+        # Initialize the vector store selected by VECTOR_STORE (Pinecone or local)
+        self.vector_store = create_vector_store(self.embeddings, INDEX_NAME, NAMESPACE)
+        
+        # Set up bounded per-user conversation memory
+        self.memory_store = ConversationMemoryStore(
+            self.llm,
+            max_turns=MEMORY_TURNS,
+            max_tokens=MEMORY_MAX_TOKENS,
+            idle_ttl=MEMORY_IDLE_TTL,
+            max_sessions=MEMORY_MAX_SESSIONS
+        )
+        
+        # Initialize the RAG chain; history is passed in per query rather than held by the chain
+        self.retriever = self.vector_store.as_retriever(
+            search_kwargs={"k": 3}
         )
-        self.llm = ChatOpenAI(
+        self.qa_chain = self._create_chain(self.llm)
+
+        # Shared by all ingests so total upsert concurrency stays bounded
+        self.upsert_executor = ThreadPoolExecutor(max_workers=UPSERT_CONCURRENCY, thread_name_prefix="rag-upsert")
+
+    def _create_llm(self, **kwargs) -> ChatOpenAI:
+        return ChatOpenAI(
             temperature=0.7,
             model_name="gpt-4o-mini",
             openai_api_key=OPENAI_API_KEY,
-            tags=["teamflow", "chat", "slacker"]  # Add tags for LangSmith
+            tags=["teamflow", "chat", "slacker"],  # Add tags for LangSmith
+            **kwargs
         )
-        
-        # Initialize Pinecone vector store
-        try:
-            # Get list of existing indexes
-            existing_indexes = [index_info['name'] for index_info in pc.list_indexes()]
-            logger.info(f"Existing Pinecone indexes: {existing_indexes}")
-
-            # Create index if it doesn't exist
-            if INDEX_NAME not in existing_indexes:
-                logger.info(f"Creating new Pinecone index: {INDEX_NAME}")
-                pc.create_index(
-                    name=INDEX_NAME,
-                    dimension=1536,  # OpenAI embedding dimension
-                    metric='cosine',
-                    spec=ServerlessSpec(
-                        cloud='aws',
-                        region='us-west-2'
-                    )
-                )
-                # Wait for index to be ready
-                while not pc.describe_index(INDEX_NAME).status['ready']:
-                    time.sleep(1)
 
-            self.index = pc.Index(INDEX_NAME)
-            logger.info(f"Successfully connected to Pinecone index: {INDEX_NAME}")
-            
-            self.vectorstore = Pinecone.from_existing_index(
-                index_name=INDEX_NAME,
-                embedding=self.embeddings,
-                namespace=NAMESPACE
-            )
-            
-        except Exception as e:
-            logger.error(f"Error initializing Pinecone: {str(e)}", exc_info=True)
-            raise
-        
-        # Set up memory
-        self.memory = ConversationBufferMemory(
-            memory_key="chat_history",
-            return_messages=True,
-            output_key="answer"  # Explicitly tell memory to store the 'answer' output
-        )
-        
-        # Initialize the RAG chain
-        self.qa_chain = ConversationalRetrievalChain.from_llm(
-            llm=self.llm,
-            retriever=self.vectorstore.as_retriever(
-                search_kwargs={"k": 3}
-            ),
-            memory=self.memory,
+    def _create_chain(self, llm: ChatOpenAI) -> ConversationalRetrievalChain:
+        return ConversationalRetrievalChain.from_llm(
+            llm=llm,
+            # Rewriting follow-ups into standalone questions never streams
+            condense_question_llm=self.llm,
+            retriever=self.retriever,
             return_source_documents=True,
             verbose=True  # Add verbosity for better LangSmith tracing
         )
     
-    def query(self, question: str, chat_history: List = None) -> Dict:
+    def query(self, question: str, chat_history: List = None, session_id=None,
+              on_token: Optional[Callable[[str], None]] = None) -> Dict:
         """
         Process a question using the RAG system
+        
+        When session_id is given, the conversation history comes from (and the
+        exchange is recorded to) that session's bounded memory.
+        
+        When on_token is given, the answer is streamed to it token by token as
+        the LLM generates it (a cached answer arrives as a single token). The
+        returned dict, including sources, is the same either way.
+        
+        Questions asked without prior history are served from the answer cache
+        when the same (or, with the semantic tier enabled, a sufficiently
+        similar) question was answered since the last ingestion. Follow-ups
+        depend on their conversation, so they always go to the chain.
         """
         if chat_history is None:
-            chat_history = []
+            chat_history = self.memory_store.history(session_id) if session_id is not None else []
             
         try:
+            question_embedding = None
+            # Read before retrieval, so an ingest finishing mid-query keeps its answer out of the cache
+            cache_generation = self.answer_cache.generation
+            if not chat_history:
+                if self.answer_cache.semantic:
+                    question_embedding = self.embeddings.embed_query(question)
+                cached = self.answer_cache.get(question, question_embedding)
+                if cached is not None:
+                    logger.info(f"Answer cache hit for question: {question[:50]}")
+                    if session_id is not None:
+                        self.memory_store.record(session_id, question, cached["answer"])
+                    if on_token:
+                        on_token(cached["answer"])
+                    return cached
+
+            chain = self.qa_chain
+            if on_token:
+                chain = self._create_chain(
+                    self._create_llm(streaming=True, callbacks=[TokenStreamHandler(on_token)])
+                )
+
             # Get response from the chain
-            response = self.qa_chain(
+            response = chain(
                 {"question": question, "chat_history": chat_history},
                 run_name=f"TeamFlow RAG Query - {question[:50]}..."  # Add run name for LangSmith
             )
@@ -130,10 +218,15 @@ class RAGManager:
                         "content": doc.page_content
                     })
             
-            return {
+            result = {
                 "answer": response["answer"],
                 "sources": sources
             }
+            if not chat_history:
+                self.answer_cache.put(question, result, question_embedding, cache_generation)
+            if session_id is not None:
+                self.memory_store.record(session_id, question, result["answer"])
+            return result
             
         except Exception as e:
             logger.error(f"Error in query: {str(e)}", exc_info=True)
@@ -142,65 +235,269 @@ class RAGManager:
                 "answer": "Sorry, I encountered an error while processing your question."
             }
     
-    def add_documents(self, texts: List[str], metadatas: List[Dict] = None):
+    def iter_document_chunks(self, texts: Iterable[str], metadatas: Iterable[Dict] = None) -> Iterator[Tuple[int, str, Dict]]:
+        """
+        Lazily split documents into chunks, yielding (document_index,
+        chunk_text, metadata) tuples. Each chunk gets its own copy of the
+        document metadata plus its position in the document.
         """
-        Add new documents to the vector store by upserting them to the Pinecone index
+        if metadatas is None:
+            metadatas = itertools.repeat({})
+        for document_index, (text, metadata) in enumerate(zip(texts, metadatas)):
+            for chunk_index, chunk in enumerate(iter_chunks(text, self.encoding)):
+                chunk_metadata = dict(metadata)
+                chunk_metadata["chunk"] = chunk_index
+                chunk_metadata["text"] = chunk
+                yield document_index, chunk, chunk_metadata
+
+    def add_documents(self, texts: Iterable[str], metadatas: Iterable[Dict] = None):
+        """
+        Add new documents to the vector store
         
         Args:
-            texts: List of text content to be embedded and stored
-            metadatas: Optional list of metadata dictionaries for each text
+            texts: Text content to be embedded and stored (any iterable, including a generator)
+            metadatas: Optional metadata dictionaries, one per text
         
         Returns:
-            bool: True if successful, False otherwise
+            bool: True if every document was stored, False otherwise
         """
         try:
-            logger.info(f"Starting document ingestion for {len(texts)} texts")
-            
-            # Generate embeddings for the texts
-            embeddings = self.embeddings.embed_documents(texts)
-            logger.info(f"Generated embeddings of dimension {len(embeddings[0])}")
-            
-            # Prepare vectors for upsertion
-            vectors = []
-            for i, (text, embedding) in enumerate(zip(texts, embeddings)):
-                # Generate a unique ID for each vector
-                vector_id = str(uuid.uuid4())
-                
-                # Prepare metadata
-                metadata = metadatas[i] if metadatas else {}
-                # Truncate text if it's too long (Pinecone has metadata size limits)
-                truncated_text = text[:3500] if len(text) > 3500 else text
-                metadata["text"] = truncated_text
-                
-                vector = {
-                    "id": vector_id,
-                    "values": embedding,
-                    "metadata": metadata
-                }
-                vectors.append(vector)
-            
-            logger.info(f"Prepared {len(vectors)} vectors for upsertion")
-            
-            # Upsert vectors in batches of 100
-            batch_size = 100
-            for i in range(0, len(vectors), batch_size):
-                batch = vectors[i:i + batch_size]
-                logger.info(f"Upserting batch {i//batch_size + 1} of {(len(vectors)-1)//batch_size + 1}")
-                try:
-                    response = self.index.upsert(
-                        vectors=batch,
-                        namespace=NAMESPACE
-                    )
-                    logger.info(f"Upsert response: {response}")
-                except Exception as batch_error:
-                    logger.error(f"Error upserting batch: {str(batch_error)}", exc_info=True)
-                    return False
-            
-            return True
-            
+            return all(self.ingest_documents(texts, metadatas))
         except Exception as e:
             logger.error(f"Error upserting documents: {str(e)}", exc_info=True)
             return False
 
-# Create a singleton instance
-rag_manager = RAGManager()
\ No newline at end of file
+    def ingest_documents(self, texts: Iterable[str], metadatas: Iterable[Dict] = None) -> List[bool]:
+        """
+        Embed and store documents, returning one success flag per document.
+        
+        Documents are split into overlapping token-bounded chunks, and chunks
+        from all documents share embedding batches of EMBED_BATCH_SIZE. Up to
+        EMBED_CONCURRENCY batches are embedded at once, and their vectors go
+        through the shared retrying upsert pool. Chunks are produced lazily
+        and only a bounded number of batches is in flight, so memory stays
+        flat however large the input is. A document succeeds only if every
+        one of its chunks was committed.
+        """
+        outcomes = []
+
+        def chunks():
+            for document_index, text, metadata in self.iter_document_chunks(texts, metadatas):
+                while len(outcomes) <= document_index:
+                    outcomes.append(True)
+                # Tokenizing large documents is CPU-bound; let sockets be served between chunks
+                cooperative_yield()
+                yield document_index, text, metadata
+
+        def settle(finished):
+            for future in finished:
+                batch = in_flight.pop(future)
+                try:
+                    failed_documents = future.result()
+                except Exception as e:
+                    logger.error(f"Error ingesting batch: {str(e)}", exc_info=True)
+                    failed_documents = {document_index for document_index, _, _ in batch}
+                for document_index in failed_documents:
+                    outcomes[document_index] = False
+
+        logger.info("Starting document ingestion")
+        total_chunks = 0
+        in_flight = {}
+        try:
+            with ThreadPoolExecutor(max_workers=EMBED_CONCURRENCY, thread_name_prefix="rag-ingest") as executor:
+                chunk_iter = chunks()
+                while True:
+                    batch = list(itertools.islice(chunk_iter, EMBED_BATCH_SIZE))
+                    if not batch:
+                        break
+                    if len(in_flight) >= EMBED_CONCURRENCY * 2:
+                        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                        settle(done)
+                    in_flight[executor.submit(self._embed_and_upsert, batch)] = batch
+                    total_chunks += len(batch)
+                settle(wait(in_flight).done)
+        finally:
+            # Cached answers may be stale once new content is searchable, even after a partial ingest
+            self.answer_cache.invalidate()
+
+        # Documents that produced no chunks (empty text) trivially succeed
+        if isinstance(texts, list):
+            outcomes.extend([True] * (len(texts) - len(outcomes)))
+        logger.info(f"Ingested {total_chunks} chunks from {len(outcomes)} documents "
+                    f"({outcomes.count(False)} failed)")
+        return outcomes
+
+    def embed_chunks(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed texts, reusing cached vectors for content seen before. Only
+        distinct texts missing from the cache are sent to the embedding API.
+        """
+        hashes = [content_hash(text) for text in texts]
+        vectors = self.embedding_cache.get_many(EMBEDDING_MODEL, hashes)
+
+        missing = {}
+        for digest, text in zip(hashes, texts):
+            if digest not in vectors:
+                missing.setdefault(digest, text)
+        logger.info(f"Embedding cache: {len(texts) - len(missing)} hits, {len(missing)} to embed")
+
+        if missing:
+            new_vectors = dict(zip(missing, self.embeddings.embed_documents(list(missing.values()))))
+            self.embedding_cache.put_many(EMBEDDING_MODEL, new_vectors)
+            vectors.update(new_vectors)
+        return [vectors[digest] for digest in hashes]
+
+    def _embed_and_upsert(self, chunks: List[Tuple[int, str, Dict]]) -> Set[int]:
+        """Embed one batch of chunks and upsert the vectors; returns the indices of documents that failed"""
+        texts = [text for _, text, _ in chunks]
+        embeddings = self.embed_chunks(texts)
+
+        # IDs derived from the document and content make re-ingesting (or retrying) it an idempotent overwrite
+        vectors = {}
+        documents_by_id = {}
+        for text, (document_index, _, metadata), embedding in zip(texts, chunks, embeddings):
+            vector_id = chunk_id(text, metadata)
+            vectors[vector_id] = {
+                "id": vector_id,
+                "values": embedding,
+                "metadata": metadata
+            }
+            documents_by_id.setdefault(vector_id, set()).add(document_index)
+
+        failed_documents = set()
+        for vector_id in self.upsert_vectors(list(vectors.values())):
+            failed_documents |= documents_by_id[vector_id]
+        return failed_documents
+
+    def upsert_vectors(self, vectors: List[Dict]) -> Set[str]:
+        """
+        Upsert vectors through the shared worker pool, returning the IDs that
+        could not be committed.
+        
+        Vectors are packed into requests of at most UPSERT_BATCH_SIZE vectors
+        and UPSERT_MAX_BYTES of estimated payload. Each request is retried with
+        exponential backoff and jitter.
+        """
+        futures = {
+            self.upsert_executor.submit(self._upsert_with_retry, batch): batch
+            for batch in self._size_batches(vectors)
+        }
+        failed_ids = set()
+        for future in as_completed(futures):
+            if not future.result():
+                failed_ids.update(vector["id"] for vector in futures[future])
+        return failed_ids
+
+    @staticmethod
+    def _size_batches(vectors: List[Dict]) -> Iterator[List[Dict]]:
+        batch = []
+        batch_bytes = 0
+        for vector in vectors:
+            vector_bytes = len(json.dumps(vector))
+            if batch and (len(batch) >= UPSERT_BATCH_SIZE or batch_bytes + vector_bytes > UPSERT_MAX_BYTES):
+                yield batch
+                batch = []
+                batch_bytes = 0
+            batch.append(vector)
+            batch_bytes += vector_bytes
+        if batch:
+            yield batch
+
+    def _upsert_with_retry(self, batch: List[Dict]) -> bool:
+        for attempt in range(1, UPSERT_MAX_ATTEMPTS + 1):
+            try:
+                response = self.vector_store.upsert(batch)
+                logger.info(f"Upserted {len(batch)} vectors: {response}")
+                return True
+            except Exception as batch_error:
+                if attempt == UPSERT_MAX_ATTEMPTS:
+                    logger.error(f"Giving up upserting {len(batch)} vectors after {attempt} attempts: "
+                                 f"{str(batch_error)}", exc_info=True)
+                    return False
+                # Full jitter keeps concurrent retries from hitting the service in lockstep
+                delay = random.uniform(0, min(UPSERT_BACKOFF_MAX, UPSERT_BACKOFF_BASE * 2 ** attempt))
+                logger.warning(f"Upsert of {len(batch)} vectors failed (attempt {attempt}), "
+                               f"retrying in {delay:.1f}s: {str(batch_error)}")
+                time.sleep(delay)
+        return False
+
+class LazyRAGManager:
+    """
+    Stand-in for the RAGManager singleton that builds it off the import path.
+    
+    Building a RAGManager talks to OpenAI and the vector store, so
+    warm_up() does it on a background thread and the app can serve chat in
+    the meantime. Attribute access is delegated to the real manager once it
+    is ready. Until then, or if it failed to start, it raises
+    RAGUnavailableError, which routes turn into a degraded response. A
+    failed start is retried on next use after WARMUP_RETRY_INTERVAL seconds.
+    """
+
+    def __init__(self):
+        self._manager = None
+        self._error = None
+        self._failed_at = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    @property
+    def ready(self) -> bool:
+        return self._manager is not None
+
+    @property
+    def status(self) -> str:
+        if self._manager is not None:
+            return "ready"
+        if self._error is not None:
+            return "unavailable"
+        if self._thread is not None:
+            return "starting"
+        return "not_started"
+
+    def warm_up(self):
+        """Start building the RAGManager in the background (no-op if already started)"""
+        with self._lock:
+            if self._manager is not None or (self._thread is not None and self._thread.is_alive()):
+                return
+            self._done.clear()
+            self._thread = threading.Thread(target=self._build, name="rag-warmup", daemon=True)
+            self._thread.start()
+
+    def _build(self):
+        started = time.monotonic()
+        try:
+            manager = RAGManager()
+            self._manager = manager
+            self._error = None
+            logger.info(f"RAG system ready after {time.monotonic() - started:.1f}s")
+        except Exception as e:
+            self._error = e
+            self._failed_at = time.monotonic()
+            logger.error(f"RAG system unavailable: {str(e)}", exc_info=True)
+        finally:
+            self._done.set()
+
+    def get(self, timeout: float = 0) -> RAGManager:
+        """Return the RAGManager, waiting up to timeout seconds for warm-up to finish"""
+        if self._manager is not None:
+            return self._manager
+
+        if self._thread is None or (self._failed_at is not None
+                                    and time.monotonic() - self._failed_at > WARMUP_RETRY_INTERVAL):
+            self._failed_at = None
+            self.warm_up()
+        if timeout:
+            self._done.wait(timeout)
+
+        if self._manager is None:
+            if self._error is not None:
+                raise RAGUnavailableError(f"RAG system unavailable: {self._error}")
+            raise RAGUnavailableError("RAG system is still starting")
+        return self._manager
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+# Create a singleton instance; call warm_up() to start it
+rag_manager = LazyRAGManager()
\ No newline at end of file
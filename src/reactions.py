@@ -0,0 +1,174 @@
+"""
+Reaction toggles, per-emoji counts and batched count broadcasts.
+
+A reaction is unique per (message_id, user_id, emoji). toggle() first
+tries to delete it. If nothing was deleted it inserts with ON CONFLICT DO
+NOTHING, so two quick clicks cannot create a duplicate. Only a statement
+that actually changed a row moves the ReactionCount aggregate and the
+user's activity stats, all in the same transaction.
+
+Clients are not told about every click. Count deltas are summed per
+message and emoji and sent to each channel as one reaction_counts event
+every REACTION_BROADCAST_INTERVAL seconds, so a burst on a popular message
+costs one frame per interval.
+"""
+import logging
+import threading
+import time
+from sqlalchemy import event, text
+
+from activity_stats import dialect_insert, insert_ignore
+
+class ReactionService:
+    def __init__(self):
+        self.app = None
+        self.db = None
+        self.socketio = None
+        self._pending = {}  # channel_id -> {(message_id, is_thread, emoji): [delta, count]}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def init_app(self, app, db, socketio):
+        from models import Reaction, ReactionCount
+
+        self.app = app
+        self.db = db
+        self.socketio = socketio
+        app.config.setdefault('REACTION_BROADCAST_INTERVAL', 0.25)  # seconds between reaction_counts frames
+
+        if ReactionCount.query.first() is None and Reaction.query.first() is not None:
+            logging.info(f"Backfilled {self.rebuild_counts()} reaction counts")
+
+        # Reactions deleted through the ORM (e.g. with their message) keep counts in step too
+        event.listen(Reaction, 'after_insert', self._on_reaction_insert)
+        event.listen(Reaction, 'after_delete', self._on_reaction_delete)
+
+        @app.cli.command('rebuild-reaction-counts')
+        def rebuild_reaction_counts_command():
+            """Recompute per-message emoji counts from the reaction table."""
+            print(f"Rebuilt {self.rebuild_counts()} reaction counts")
+
+        self._thread = threading.Thread(target=self._run, name='reaction-broadcast', daemon=True)
+        self._thread.start()
+
+    def _adjust_count(self, connection, message_id, emoji, delta):
+        """Apply ``delta`` to the (message, emoji) count and return the new count"""
+        from models import ReactionCount
+
+        table = ReactionCount.__table__
+        insert = dialect_insert(connection)
+        if insert is not None:
+            statement = insert(table)\
+                .values(message_id=message_id, emoji=emoji, count=delta)\
+                .on_conflict_do_update(index_elements=['message_id', 'emoji'],
+                                       set_={'count': table.c.count + delta})\
+                .returning(table.c.count)
+            return connection.execute(statement).scalar()
+
+        params = {'message_id': message_id, 'emoji': emoji}
+        insert_ignore(connection, table, {**params, 'count': 0}, ['message_id', 'emoji'])
+        connection.execute(
+            text("UPDATE reaction_count SET count = count + :delta "
+                 "WHERE message_id = :message_id AND emoji = :emoji"),
+            {**params, 'delta': delta}
+        )
+        return connection.execute(
+            text("SELECT count FROM reaction_count WHERE message_id = :message_id AND emoji = :emoji"),
+            params
+        ).scalar()
+
+    def toggle(self, user_id, message_id, emoji, is_thread=False):
+        """
+        Add the reaction if the user has not made it, otherwise remove it.
+        Returns ``(channel_id, reacted, count)``, or None if the message does not exist.
+        """
+        from activity_stats import activity_stats
+        from models import Reaction
+
+        if is_thread:
+            channel_query = "SELECT m.channel_id FROM thread t JOIN message m ON m.id = t.message_id WHERE t.id = :id"
+        else:
+            channel_query = "SELECT channel_id FROM message WHERE id = :id"
+
+        connection = self.db.session.connection()
+        try:
+            channel_id = connection.execute(text(channel_query), {'id': message_id}).scalar()
+            if channel_id is None:
+                return None
+
+            params = {'message_id': message_id, 'user_id': user_id, 'emoji': emoji}
+            removed = connection.execute(
+                text("DELETE FROM reaction WHERE message_id = :message_id AND user_id = :user_id AND emoji = :emoji"),
+                params
+            ).rowcount
+            if removed:
+                delta = -removed
+            else:
+                delta = insert_ignore(connection, Reaction.__table__, params,
+                                            ['message_id', 'user_id', 'emoji'])
+
+            count = None
+            if delta:
+                count = self._adjust_count(connection, message_id, emoji, delta)
+                activity_stats.record_reaction(connection, user_id, delta)
+            self.db.session.commit()
+        except Exception:
+            self.db.session.rollback()
+            raise
+
+        if delta:
+            self._queue_delta(channel_id, message_id, is_thread, emoji, delta, count)
+        # delta == 0: a concurrent click already added it; the reaction exists either way
+        return channel_id, not removed, count
+
+    def _on_reaction_insert(self, mapper, connection, target):
+        self._adjust_count(connection, target.message_id, target.emoji, 1)
+
+    def _on_reaction_delete(self, mapper, connection, target):
+        self._adjust_count(connection, target.message_id, target.emoji, -1)
+
+    def rebuild_counts(self):
+        try:
+            self.db.session.execute(text("DELETE FROM reaction_count"))
+            result = self.db.session.execute(text(
+                "INSERT INTO reaction_count (message_id, emoji, count) "
+                "SELECT message_id, emoji, COUNT(*) FROM reaction "
+                "WHERE message_id IS NOT NULL GROUP BY message_id, emoji"
+            ))
+            self.db.session.commit()
+            return result.rowcount
+        except Exception as e:
+            logging.error(f"Error rebuilding reaction counts: {str(e)}")
+            self.db.session.rollback()
+            raise
+
+    def _queue_delta(self, channel_id, message_id, is_thread, emoji, delta, count):
+        with self._lock:
+            pending = self._pending.setdefault(channel_id, {}).setdefault((message_id, is_thread, emoji), [0, count])
+            pending[0] += delta
+            pending[1] = count
+
+    def _run(self):
+        while True:
+            time.sleep(self.app.config['REACTION_BROADCAST_INTERVAL'])
+            try:
+                self.broadcast_counts()
+            except Exception as e:
+                logging.error(f"Error broadcasting reaction counts: {str(e)}", exc_info=True)
+
+    def broadcast_counts(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for channel_id, changes in pending.items():
+            # Add-then-remove within one interval cancels out
+            changes = [{
+                'message_id': message_id,
+                'is_thread': is_thread,
+                'emoji': emoji,
+                'delta': delta,
+                'count': count
+            } for (message_id, is_thread, emoji), (delta, count) in changes.items() if delta]
+            if changes:
+                self.socketio.emit('reaction_counts', {'channel_id': channel_id, 'changes': changes}, to=channel_id)
+
+reactions = ReactionService()
@@ -0,0 +1,231 @@
+"""
+Full-text search over messages and thread replies.
+
+The backend is chosen from the database dialect, or forced with the
+SEARCH_BACKEND config value:
+
+- fts5:     an SQLite FTS5 table kept in sync by mapper events on Message and Thread
+- postgres: GIN expression indexes over to_tsvector(content), maintained by Postgres
+- like:     an ILIKE scan, used when neither of the above is available
+
+All three match the same way: the keyword is split into words, and a
+message (or one of its thread replies) matches when every word starts a
+word in it. "flow" finds "flow control" but not "TeamFlow", which the
+substring search used before the indexes did. The like backend treats a
+word as starting at the beginning of the text or after a space.
+"""
+import logging
+import re
+from sqlalchemy import Float, Integer, and_, event, func, inspect, literal_column, or_, select, text, union_all
+
+# Postgres text search configuration; must match the expression indexes below
+TS_CONFIG = literal_column("'english'")
+
+FTS_TABLE = 'search_fts'
+
+def _tokens(keyword):
+    return re.findall(r'\w+', keyword)
+
+def _like_all_prefixes(column, tokens):
+    """ILIKE condition: every token starts a word of ``column``, as a prefix query does in FTS"""
+    conditions = []
+    for token in tokens:
+        token = token.replace('_', '\\_')  # Tokens are \w+, so '_' is the only LIKE wildcard in them
+        conditions.append(or_(column.ilike(f'{token}%', escape='\\'), column.ilike(f'% {token}%', escape='\\')))
+    return and_(*conditions)
+
+def _fts_rowid(kind, row_id):
+    # Messages and threads share the FTS table; interleave rowids so each row
+    # can be updated or deleted by rowid instead of scanning UNINDEXED columns
+    return row_id * 2 if kind == 'message' else row_id * 2 + 1
+
+class SearchIndex:
+    def __init__(self):
+        self.backend = None
+        self.db = None
+
+    def init_app(self, app, db):
+        """Pick a backend and make sure its index exists. Call inside an app context."""
+        self.db = db
+        backend = app.config.get('SEARCH_BACKEND')
+        if not backend:
+            dialect = db.engine.dialect.name
+            backend = {'sqlite': 'fts5', 'postgresql': 'postgres'}.get(dialect, 'like')
+
+        try:
+            if backend == 'fts5':
+                self._setup_fts5()
+            elif backend == 'postgres':
+                self._setup_postgres()
+        except Exception as e:
+            logging.error(f"Could not set up {backend} search index, falling back to LIKE: {str(e)}")
+            db.session.rollback()
+            backend = 'like'
+
+        self.backend = backend
+        logging.info(f"Message search backend: {backend}")
+
+        @app.cli.command('rebuild-search-index')
+        def rebuild_search_index_command():
+            """Rebuild the full-text search index from the message and thread tables."""
+            self.rebuild()
+            print(f"Search index rebuilt ({self.backend})")
+
+    def _setup_fts5(self):
+        from models import Message, Thread
+
+        with self.db.engine.begin() as conn:
+            exists = conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                {'name': FTS_TABLE}
+            ).first()
+            if not exists:
+                conn.execute(text(
+                    f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+                    "body, message_id UNINDEXED, thread_id UNINDEXED, tokenize = 'unicode61')"
+                ))
+                self._backfill_fts5(conn)
+
+        event.listen(Message, 'after_insert', self._on_message_write)
+        event.listen(Message, 'after_update', self._on_message_update)
+        event.listen(Message, 'after_delete', self._on_message_delete)
+        event.listen(Thread, 'after_insert', self._on_thread_write)
+        event.listen(Thread, 'after_update', self._on_thread_update)
+        event.listen(Thread, 'after_delete', self._on_thread_delete)
+
+    def _backfill_fts5(self, conn):
+        conn.execute(text(f"DELETE FROM {FTS_TABLE}"))
+        conn.execute(text(
+            f"INSERT INTO {FTS_TABLE} (rowid, body, message_id, thread_id) "
+            "SELECT id * 2, content, id, NULL FROM message"
+        ))
+        conn.execute(text(
+            f"INSERT INTO {FTS_TABLE} (rowid, body, message_id, thread_id) "
+            "SELECT id * 2 + 1, content, message_id, id FROM thread"
+        ))
+
+    def _fts5_upsert(self, connection, rowid, body, message_id, thread_id):
+        connection.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid = :rowid"), {'rowid': rowid})
+        connection.execute(
+            text(f"INSERT INTO {FTS_TABLE} (rowid, body, message_id, thread_id) "
+                 "VALUES (:rowid, :body, :message_id, :thread_id)"),
+            {'rowid': rowid, 'body': body, 'message_id': message_id, 'thread_id': thread_id}
+        )
+
+    def _on_message_write(self, mapper, connection, target):
+        self._fts5_upsert(connection, _fts_rowid('message', target.id), target.content, target.id, None)
+
+    def _on_message_update(self, mapper, connection, target):
+        # Pins and embedding status updates don't touch the indexed text
+        if inspect(target).attrs.content.history.has_changes():
+            self._on_message_write(mapper, connection, target)
+
+    def _on_message_delete(self, mapper, connection, target):
+        connection.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid = :rowid"),
+                           {'rowid': _fts_rowid('message', target.id)})
+
+    def _on_thread_write(self, mapper, connection, target):
+        self._fts5_upsert(connection, _fts_rowid('thread', target.id), target.content,
+                          target.message_id, target.id)
+
+    def _on_thread_update(self, mapper, connection, target):
+        if inspect(target).attrs.content.history.has_changes():
+            self._on_thread_write(mapper, connection, target)
+
+    def _on_thread_delete(self, mapper, connection, target):
+        connection.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid = :rowid"),
+                           {'rowid': _fts_rowid('thread', target.id)})
+
+    def _fts5_ranked(self, tokens, include_threads):
+        match = ' '.join(f'"{token}"*' for token in tokens)
+        thread_clause = '' if include_threads else ' AND thread_id IS NULL'
+        # bm25 rank is negative, lower is better; keep the best hit per message
+        return text(
+            f"SELECT message_id, min(rank) AS rank FROM ("
+            f"SELECT message_id, rank FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match{thread_clause}"
+            f") GROUP BY message_id"
+        ).bindparams(match=match).columns(message_id=Integer, rank=Float).subquery('ranked')
+
+    def _setup_postgres(self):
+        with self.db.engine.begin() as conn:
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_message_content_tsv "
+                "ON message USING GIN (to_tsvector('english', content))"
+            ))
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_thread_content_tsv "
+                "ON thread USING GIN (to_tsvector('english', content))"
+            ))
+
+    def _postgres_ranked(self, tokens, include_threads):
+        from models import Message, Thread
+
+        tsquery = func.to_tsquery(TS_CONFIG, ' & '.join(f'{token}:*' for token in tokens))
+        message_vector = func.to_tsvector(TS_CONFIG, Message.content)
+        matches = [
+            select(Message.id.label('message_id'), (-func.ts_rank(message_vector, tsquery)).label('rank'))
+            .where(message_vector.op('@@')(tsquery))
+        ]
+        if include_threads:
+            thread_vector = func.to_tsvector(TS_CONFIG, Thread.content)
+            matches.append(
+                select(Thread.message_id.label('message_id'), (-func.ts_rank(thread_vector, tsquery)).label('rank'))
+                .where(thread_vector.op('@@')(tsquery))
+            )
+        hits = union_all(*matches).subquery('hits')
+        return select(hits.c.message_id, func.min(hits.c.rank).label('rank'))\
+            .group_by(hits.c.message_id)\
+            .subquery('ranked')
+
+    def rebuild(self):
+        """Rebuild the index from scratch (only the FTS5 backend keeps its own copy)"""
+        if self.backend == 'fts5':
+            with self.db.engine.begin() as conn:
+                self._backfill_fts5(conn)
+
+    def search(self, keyword, user_filter=None, channel_filter=None, date_from=None, date_to=None,
+               include_threads=True, limit=50):
+        """Return messages whose content or a thread reply has a word starting with each word
+        of ``keyword``, best match first"""
+        from models import Message, Thread, User
+
+        tokens = _tokens(keyword)
+        if not tokens:
+            return []
+
+        query = Message.query
+        if self.backend == 'fts5':
+            ranked = self._fts5_ranked(tokens, include_threads)
+        elif self.backend == 'postgres':
+            ranked = self._postgres_ranked(tokens, include_threads)
+        else:
+            ranked = None
+            conditions = [_like_all_prefixes(Message.content, tokens)]
+            if include_threads:
+                conditions.append(Message.id.in_(
+                    select(Thread.message_id).where(_like_all_prefixes(Thread.content, tokens))
+                ))
+            query = query.filter(or_(*conditions))
+
+        if ranked is not None:
+            query = query.join(ranked, ranked.c.message_id == Message.id)
+
+        if user_filter:
+            query = query.join(User, User.id == Message.user_id).filter(User.username.ilike(f'%{user_filter}%'))
+
+        if channel_filter:
+            query = query.filter(Message.channel_id == channel_filter)
+
+        if date_from:
+            query = query.filter(Message.timestamp >= date_from)
+
+        if date_to:
+            query = query.filter(Message.timestamp <= date_to)
+
+        if ranked is not None:
+            query = query.order_by(ranked.c.rank, Message.timestamp.desc())
+        else:
+            query = query.order_by(Message.timestamp.desc())
+        return query.limit(limit).all()
+
+search_index = SearchIndex()
@@ -0,0 +1,27 @@
+"""
+Production entry point.
+
+    SOCKETIO_ASYNC_MODE=gevent python serve.py
+
+or, through gunicorn (see gunicorn.conf.py):
+
+    gunicorn -c gunicorn.conf.py serve:app
+
+Patching has to happen before app (and with it SQLAlchemy, requests and
+the RAG clients) is imported, which is why this module exists next to main.py.
+"""
+import os
+
+os.environ.setdefault("SOCKETIO_ASYNC_MODE", "gevent")
+
+from cooperative import monkey_patch
+monkey_patch()
+
+from app import app, socketio, start_background_services
+import socket_events  # noqa: F401  Register socket events
+
+# Module level, since gunicorn workers import this module rather than run it
+start_background_services()
+
+if __name__ == "__main__":
+    socketio.run(app, host=os.environ.get("HOST", "0.0.0.0"), port=int(os.environ.get("PORT", 5001)))
@@ -2,6 +2,14 @@ from flask_socketio import emit, join_room, leave_room
 from flask_login import current_user
 from app import socketio, db, app
 from models import Message, Channel, Thread, Reaction, UserBookmark, User
+from search_index import search_index
+from blob_store import blob_store
+from presence import presence
+from channel_stats import channel_stats
+from group_commit import message_writer, message_payload
+from reactions import reactions
+from chunked_upload import chunked_uploads, UploadError
+from rag_utils import rag_manager, RAGUnavailableError
 from datetime import datetime
 from sqlalchemy import and_, or_
 import logging
@@ -12,16 +20,17 @@ import base64
 
 ALLOWED_EXTENSIONS = {'txt', 'pdf', 'png', 'jpg', 'jpeg', 'gif', 'doc', 'docx'}
 
+def file_extension(filename):
+    return filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+
 def allowed_file(filename):
-    return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+    return file_extension(filename) in ALLOWED_EXTENSIONS
 
 @socketio.on('connect')
 def handle_connect():
     if current_user.is_authenticated:
         try:
-            current_user.is_online = True
-            db.session.commit()
+            presence.connect(current_user.id, request.sid)
 
             # Send channel list for search filter
             channels = Channel.query.all()
@@ -29,10 +38,10 @@ def handle_connect():
                 'channels': [{'id': channel.id, 'name': channel.name} for channel in channels]
             })
 
-            emit('status_change', {
-                'user_id': current_user.id,
-                'status': 'online'
-            }, broadcast=True)
+            # Everyone else hears about this user in the next status_changes diff
+            emit('presence_snapshot', {
+                'online': sorted(presence.online_user_ids())
+            })
             # Send current user information
             emit('current_user', {
                 'user_id': current_user.id
@@ -41,28 +50,88 @@ def handle_connect():
             logging.error(f"Error in handle_connect: {str(e)}")
             db.session.rollback()
 
+def history_page_limit(limit):
+    """Page size for a client-supplied ``limit``, clamped to 1..HISTORY_MAX_PAGE_SIZE.
+    Raises ValueError for anything that is not an integer."""
+    if limit is None:
+        return app.config['HISTORY_PAGE_SIZE']
+    if isinstance(limit, bool) or not isinstance(limit, (int, str)):
+        raise ValueError(f"History limit must be an integer, got {limit!r}")
+    # int() rejects strings like "10.5"; a negative LIMIT would mean "no limit" in SQLite
+    return max(1, min(int(limit), app.config['HISTORY_MAX_PAGE_SIZE']))
+
+def load_history_page(channel_id, cursor=None, limit=None):
+    """Load one page of channel history, returned oldest first.
+
+    Pages backward from ``cursor`` (the ``{'timestamp', 'id'}`` of the oldest
+    message already sent) using a (timestamp, id) keyset, so the cost of a page
+    does not depend on how many messages the channel holds.
+    Returns ``(messages, next_cursor)``; ``next_cursor`` is None once the start
+    of the channel has been reached.
+    """
+    limit = history_page_limit(limit)
+
+    query = Message.query.filter_by(channel_id=channel_id)
+    if cursor:
+        cursor_timestamp = datetime.fromisoformat(cursor['timestamp'])
+        cursor_id = int(cursor['id'])
+        query = query.filter(
+            or_(
+                Message.timestamp < cursor_timestamp,
+                and_(Message.timestamp == cursor_timestamp, Message.id < cursor_id)
+            )
+        )
+
+    # Fetch one extra row to know whether an older page exists
+    messages = query.order_by(Message.timestamp.desc(), Message.id.desc())\
+        .limit(limit + 1)\
+        .all()
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    messages.reverse()
+
+    next_cursor = None
+    if has_more:
+        oldest = messages[0]
+        next_cursor = {'timestamp': oldest.timestamp.isoformat(), 'id': oldest.id}
+    return messages, next_cursor
+
+def emit_history_page(room, messages, next_cursor, supports_batch=False):
+    """Send a page of history followed by the cursor for the next (older) page.
+
+    Clients that set ``supports_batch`` receive the page as a single
+    ``message_batch`` frame; older clients get one ``message`` event each.
+    """
+    page = [message_data for message_data in create_messages_data(messages) if message_data]
+    if supports_batch:
+        emit('message_batch', {
+            'channel': room,
+            'messages': page
+        })
+    else:
+        for message_data in page:
+            emit('message', message_data)
+
+    emit('history_cursor', {
+        'channel': room,
+        'cursor': next_cursor,
+        'has_more': next_cursor is not None
+    })
+
 @socketio.on('join')
 def handle_join(data):
     try:
         room = data['channel']
         join_room(room)
 
-        # Load messages from database with proper error handling
+        # Only the newest page is sent on join; older history is fetched with load_history
         try:
-            # Get all messages for the channel, ordered by timestamp
-            messages = Message.query.filter_by(channel_id=room)\
-                .order_by(Message.timestamp.asc())\
-                .all()
-
-            # Send messages in batches to avoid overwhelming the socket
-            batch_size = 100
-            for i in range(0, len(messages), batch_size):
-                batch = messages[i:i + batch_size]
-                for message in batch:
-                    message_data = create_message_data(message)
-                    if message_data:
-                        emit('message', message_data)
+            messages, next_cursor = load_history_page(room, limit=data.get('limit'))
+            emit_history_page(room, messages, next_cursor, data.get('supports_batch', False))
 
+        except ValueError as e:
+            logging.error(f"Invalid join request: {str(e)}")
+            emit('error', {'message': 'Invalid history limit'})
         except Exception as e:
             logging.error(f"Error loading messages for channel {room}: {str(e)}")
             db.session.rollback()
@@ -71,6 +140,25 @@ def handle_join(data):
         logging.error(f"Error in handle_join: {str(e)}")
         db.session.rollback()
 
+@socketio.on('load_history')
+def handle_load_history(data):
+    if current_user.is_authenticated:
+        try:
+            room = data['channel']
+            cursor = data.get('cursor')
+            if not cursor:
+                return
+
+            messages, next_cursor = load_history_page(room, cursor=cursor, limit=data.get('limit'))
+            emit_history_page(room, messages, next_cursor, data.get('supports_batch', False))
+
+        except (KeyError, TypeError, ValueError) as e:
+            logging.error(f"Invalid load_history request: {str(e)}")
+            emit('error', {'message': 'Invalid history cursor or limit'})
+        except Exception as e:
+            logging.error(f"Error in handle_load_history: {str(e)}")
+            db.session.rollback()
+
 @socketio.on('leave')
 def handle_leave(data):
     if 'channel' in data:
@@ -78,57 +166,129 @@ def handle_leave(data):
 
 def create_message_data(message):
     """Helper function to create message data dictionary with proper error handling"""
+    return create_messages_data([message])[0]
+
+def create_messages_data(messages):
+    """Create message data dictionaries for a list of messages.
+
+    Reactions, threads, replies and usernames for the whole list are loaded
+    with a fixed number of IN (...) queries instead of lazy-loading them per
+    message. Returns a list aligned with ``messages``; an entry is None if that
+    message could not be serialized.
+    """
+    if not messages:
+        return []
+
+    message_ids = [message.id for message in messages]
     try:
-        # Get reactions for the message
-        reactions = [{
-            'emoji': reaction.emoji,
-            'user_id': reaction.user_id,
-            'user': reaction.user.username if reaction.user else 'Unknown'
-        } for reaction in message.reactions]
-
-        # Get thread messages
-        threads = []
-        thread_messages = Thread.query.filter_by(message_id=message.id)\
-            .order_by(Thread.timestamp)\
+        reaction_rows = db.session.query(Reaction.message_id, Reaction.emoji, Reaction.user_id)\
+            .filter(Reaction.message_id.in_(message_ids))\
+            .order_by(Reaction.id)\
+            .all()
+        thread_rows = db.session.query(Thread.id, Thread.message_id, Thread.content, Thread.user_id, Thread.timestamp)\
+            .filter(Thread.message_id.in_(message_ids))\
+            .order_by(Thread.timestamp, Thread.id)\
+            .all()
+        reply_rows = db.session.query(Message.id, Message.parent_id, Message.content, Message.user_id, Message.timestamp)\
+            .filter(Message.parent_id.in_(message_ids))\
+            .order_by(Message.timestamp, Message.id)\
             .all()
 
-        for thread in thread_messages:
-            thread_data = {
-                'id': thread.id,
-                'content': thread.content,
-                'user': thread.user.username if thread.user else 'Unknown',
-                'timestamp': thread.timestamp.isoformat()
-            }
-            threads.append(thread_data)
-
-        # Get replies (nested messages)
-        replies = []
-        if message.replies:
-            for reply in message.replies:
-                reply_data = {
-                    'id': reply.id,
-                    'content': reply.content,
-                    'user': reply.user.username if reply.user else 'Unknown',
-                    'timestamp': reply.timestamp.isoformat()
-                }
-                replies.append(reply_data)
-
-        return {
-            'id': message.id,
-            'content': message.content,
-            'user': message.user.username if message.user else 'Unknown',
-            'timestamp': message.timestamp.isoformat(),
-            'is_pinned': message.is_pinned,
-            'pinned_by': message.pinned_by.username if message.pinned_by else None,
-            'pinned_at': message.pinned_at.isoformat() if message.pinned_at else None,
-            'reactions': reactions,
-            'threads': threads,
-            'replies': replies,
-            'parent_id': message.parent_id
-        }
+        user_ids = set()
+        for message in messages:
+            user_ids.add(message.user_id)
+            if message.pinned_by_id:
+                user_ids.add(message.pinned_by_id)
+        user_ids.update(row.user_id for row in reaction_rows)
+        user_ids.update(row.user_id for row in thread_rows)
+        user_ids.update(row.user_id for row in reply_rows)
+        user_ids.discard(None)
+
+        usernames = {}
+        if user_ids:
+            usernames = dict(
+                db.session.query(User.id, User.username).filter(User.id.in_(user_ids)).all()
+            )
     except Exception as e:
-        logging.error(f"Error creating message data for message {message.id}: {str(e)}")
-        return None
+        logging.error(f"Error loading message data for {len(messages)} messages: {str(e)}")
+        db.session.rollback()
+        return [None] * len(messages)
+
+    reactions_by_message = {}
+    for row in reaction_rows:
+        reactions_by_message.setdefault(row.message_id, []).append({
+            'emoji': row.emoji,
+            'user_id': row.user_id,
+            'user': usernames.get(row.user_id, 'Unknown')
+        })
+
+    threads_by_message = {}
+    for row in thread_rows:
+        threads_by_message.setdefault(row.message_id, []).append({
+            'id': row.id,
+            'content': row.content,
+            'user': usernames.get(row.user_id, 'Unknown'),
+            'timestamp': row.timestamp.isoformat()
+        })
+
+    replies_by_message = {}
+    for row in reply_rows:
+        replies_by_message.setdefault(row.parent_id, []).append({
+            'id': row.id,
+            'content': row.content,
+            'user': usernames.get(row.user_id, 'Unknown'),
+            'timestamp': row.timestamp.isoformat()
+        })
+
+    results = []
+    for message in messages:
+        try:
+            results.append({
+                'id': message.id,
+                'content': message.content,
+                'user': usernames.get(message.user_id, 'Unknown'),
+                'timestamp': message.timestamp.isoformat(),
+                'is_pinned': message.is_pinned,
+                'pinned_by': usernames.get(message.pinned_by_id) if message.pinned_by_id else None,
+                'pinned_at': message.pinned_at.isoformat() if message.pinned_at else None,
+                'reactions': reactions_by_message.get(message.id, []),
+                'threads': threads_by_message.get(message.id, []),
+                'replies': replies_by_message.get(message.id, []),
+                'parent_id': message.parent_id
+            })
+        except Exception as e:
+            logging.error(f"Error creating message data for message {message.id}: {str(e)}")
+            results.append(None)
+    return results
+
+def save_and_broadcast_message(data, file_data=None):
+    """Store a new message from ``data``, send it to everyone in its channel and
+    return the broadcast payload"""
+    fields = dict(
+        content=data.get('content', ''),
+        user_id=current_user.id,
+        channel_id=data['channel_id'],
+        parent_id=data.get('parent_id'),
+        file_name=file_data['filename'] if file_data else None,
+        file_path=file_data['filepath'] if file_data else None,
+        file_digest=file_data['digest'] if file_data else None,
+        file_type=file_data['filetype'] if file_data else None
+    )
+
+    if message_writer.enabled:
+        # Committed and broadcast by the writer thread together with other senders' messages
+        return message_writer.write(fields, current_user.username, file_data)
+
+    if file_data:
+        blob_store.register(file_data['digest'], file_data['size'])
+    message = Message(**fields)
+    db.session.add(message)
+    db.session.commit()
+
+    # Emit message to the specific channel room only
+    message_data = message_payload(message, current_user.username)
+    emit('message', message_data, to=data['channel_id'])
+    return message_data
 
 @socketio.on('message')
 def handle_message(data):
@@ -144,20 +304,19 @@ def handle_message(data):
                         return
                         
                     filename = secure_filename(file_info['name'])
-                    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
                     
                     try:
                         # Save the file from base64 data
                         file_content = file_info['data'].split('base64,')[1]
                         file_bytes = base64.b64decode(file_content)
-                        
-                        with open(filepath, 'wb') as f:
-                            f.write(file_bytes)
+                        digest, size = blob_store.save_bytes(file_bytes)
                         
                         file_data = {
                             'filename': filename,
-                            'filepath': f'/uploads/{filename}',
-                            'filetype': filename.rsplit('.', 1)[1].lower()
+                            'filepath': f'/uploads/{digest}/{filename}',
+                            'filetype': filename.rsplit('.', 1)[1].lower(),
+                            'digest': digest,
+                            'size': size
                         }
                     except Exception as e:
                         logging.error(f"File processing error: {str(e)}")
@@ -169,36 +328,8 @@ def handle_message(data):
                     emit('error', {'message': 'File upload failed'})
                     return
 
-            # Create and save new message to database
-            message = Message(
-                content=data.get('content', ''),
-                user_id=current_user.id,
-                channel_id=data['channel_id'],
-                parent_id=data.get('parent_id'),
-                file_name=file_data['filename'] if file_data else None,
-                file_path=file_data['filepath'] if file_data else None,
-                file_type=file_data['filetype'] if file_data else None
-            )
-            db.session.add(message)
-            db.session.commit()
-
-            # Create message data for broadcast
-            message_data = {
-                'id': message.id,
-                'content': message.content,
-                'user': current_user.username,
-                'timestamp': message.timestamp.isoformat(),
-                'channel_id': message.channel_id,
-                'parent_id': message.parent_id,
-                'file': {
-                    'name': message.file_name,
-                    'path': message.file_path,
-                    'type': message.file_type
-                } if message.file_name else None
-            }
-            
-            # Emit message to the specific channel room only
-            emit('message', message_data, to=data['channel_id'])
+            message_data = save_and_broadcast_message(data, file_data)
+            return {'message_id': message_data['id']}
 
         except Exception as e:
             logging.error(f"Error in handle_message: {str(e)}")
@@ -207,61 +338,16 @@ def handle_message(data):
 
 @socketio.on('reaction')
 def handle_reaction(data):
+    """Toggle a reaction. Ack: {reacted, count}; the channel gets a batched reaction_counts update."""
     if current_user.is_authenticated:
         try:
-            message_id = data['message_id']
-            emoji = data['emoji']
-            is_thread = data.get('is_thread', False)
-
-            # Check if user already reacted with this emoji
-            existing_reaction = Reaction.query.filter(
-                and_(
-                    Reaction.message_id == message_id,
-                    Reaction.user_id == current_user.id,
-                    Reaction.emoji == emoji
-                )
-            ).first()
-
-            if is_thread:
-                message = Thread.query.get(message_id)
-            else:
-                message = Message.query.get(message_id)
-
-            if not message:
+            result = reactions.toggle(current_user.id, data['message_id'], data['emoji'],
+                                      data.get('is_thread', False))
+            if result is None:
                 return
 
-            if existing_reaction:
-                # Remove reaction if it exists
-                db.session.delete(existing_reaction)
-            else:
-                # Add new reaction
-                reaction = Reaction(
-                    emoji=emoji,
-                    message_id=message_id,
-                    user_id=current_user.id
-                )
-                db.session.add(reaction)
-
-            db.session.commit()
-
-            # Get channel ID to broadcast to all clients
-            channel_id = None
-            if is_thread:
-                parent_message = Message.query.get(message.message_id)
-                if parent_message:
-                    channel_id = parent_message.channel_id
-            else:
-                channel_id = message.channel_id
-
-            if channel_id:
-                # Broadcast the reaction update
-                emit('reaction_added', {
-                    'message_id': message_id,
-                    'emoji': emoji,
-                    'user_id': current_user.id,
-                    'user': current_user.username,
-                    'is_thread': is_thread
-                }, broadcast=True, room=channel_id)
+            _, reacted, count = result
+            return {'message_id': data['message_id'], 'emoji': data['emoji'], 'reacted': reacted, 'count': count}
 
         except Exception as e:
             logging.error(f"Error in handle_reaction: {str(e)}")
@@ -272,15 +358,12 @@ def handle_thread_reply(data):
     if current_user.is_authenticated:
         try:
             parent_id = data['parent_id']
-            replied_to_id = data.get('replied_to_id')
-            is_thread_reply = data.get('is_thread_reply', False)
-            
+
             # Always use top-level message as parent
             thread = Thread(
                 message_id=parent_id,
                 content=data['content'],
-                user_id=current_user.id,
-                replied_to_id=replied_to_id if is_thread_reply else None
+                user_id=current_user.id
             )
             db.session.add(thread)
             db.session.commit()
@@ -307,16 +390,9 @@ def handle_thread_reply(data):
 def handle_disconnect():
     if current_user.is_authenticated:
         try:
-            current_user.is_online = False
-            current_user.last_seen = datetime.utcnow()
-            db.session.commit()
-            emit('status_change', {
-                'user_id': current_user.id,
-                'status': 'offline'
-            }, broadcast=True)
+            presence.disconnect(current_user.id, request.sid)
         except Exception as e:
             logging.error(f"Error in handle_disconnect: {str(e)}")
-            db.session.rollback()
 
 @socketio.on('create_channel')
 def handle_create_channel(data):
@@ -360,7 +436,7 @@ def handle_get_user_status(data):
 
                 emit('user_status', {
                     'username': user.username,
-                    'is_online': user.is_online,
+                    'is_online': presence.is_online(user.id),
                     'custom_status': user.custom_status,
                     'status_emoji': user.status_emoji,
                     'last_seen': user.last_seen.isoformat() if user.last_seen else None,
@@ -398,7 +474,7 @@ def handle_update_custom_status(data):
                 emit('user_status_updated', {
                     'user_id': current_user.id,
                     'username': current_user.username,
-                    'is_online': current_user.is_online,
+                    'is_online': presence.is_online(current_user.id),
                     'custom_status': current_user.custom_status,
                     'status_emoji': current_user.status_emoji,
                     'stats': stats,
@@ -425,41 +501,30 @@ def handle_search(data):
             date_to = data.get('date_to')
             include_threads = data.get('include_threads', True)  # Default to True
 
-            # Build base query
-            query = Message.query
-
-            # Apply filters
-            if user_filter:
-                query = query.join(User).filter(User.username.ilike(f'%{user_filter}%'))
-
-            if channel_filter:
-                query = query.filter(Message.channel_id == channel_filter)
-
-            if date_from:
-                query = query.filter(Message.timestamp >= date_from)
-
-            if date_to:
-                query = query.filter(Message.timestamp <= date_to)
-
-            # Search in messages and threads (now always included by default)
-            query = query.filter(
-                or_(
-                    Message.content.ilike(f'%{keyword}%'),
-                    Thread.content.ilike(f'%{keyword}%')
-                )
-            ).join(Message.threads, isouter=True)
-
-            messages = query.order_by(Message.timestamp.desc()).limit(50).all()
+            messages = search_index.search(
+                keyword,
+                user_filter=user_filter,
+                channel_filter=channel_filter,
+                date_from=date_from,
+                date_to=date_to,
+                include_threads=include_threads
+            )
 
             logging.info(f"Found {len(messages)} messages matching the search")
 
             # Format results
+            channel_names = {}
+            channel_ids = {message.channel_id for message in messages}
+            if channel_ids:
+                channel_names = dict(
+                    db.session.query(Channel.id, Channel.name).filter(Channel.id.in_(channel_ids)).all()
+                )
+
             results = []
             for message in messages:
                 try:
                     # Get channel name
-                    channel = Channel.query.get(message.channel_id)
-                    channel_name = channel.name if channel else 'Unknown Channel'
+                    channel_name = channel_names.get(message.channel_id, 'Unknown Channel')
 
                     # Highlight the keyword in content
                     content = message.content
@@ -501,22 +566,10 @@ def handle_search(data):
 def handle_channel_info(data):
     if current_user.is_authenticated:
         try:
-            channel_id = data['channel_id']
-            channel = Channel.query.get(channel_id)
-            
-            if channel:
-                creator = User.query.get(channel.created_by_id)
-                message_count = Message.query.filter_by(channel_id=channel_id, parent_id=None).count()
-                reply_count = Message.query.filter_by(channel_id=channel_id).filter(Message.parent_id.isnot(None)).count()
-
-                emit('channel_info', {
-                    'name': channel.name,
-                    'description': channel.description,
-                    'creator': creator.username if creator else 'Unknown',
-                    'created_at': channel.created_at.isoformat(),
-                    'message_count': message_count,
-                    'reply_count': reply_count
-                })
+            # Served from the per-channel stats row and process cache
+            info = channel_stats.get_info(data['channel_id'])
+            if info:
+                emit('channel_info', info)
 
         except Exception as e:
             logging.error(f"Error in handle_channel_info: {str(e)}")
@@ -530,12 +583,16 @@ def handle_delete_message(data):
             message = Message.query.get(message_id)
 
             if message and message.user_id == current_user.id:
+                channel_id = message.channel_id
                 db.session.delete(message)
                 db.session.commit()
 
+                # Drop stored files no other message shares
+                blob_store.collect_garbage()
+
                 emit('message_deleted', {
                     'message_id': message_id
-                }, room=message.channel_id)
+                }, room=channel_id)
 
         except Exception as e:
             logging.error(f"Error in handle_delete_message: {str(e)}")
@@ -563,4 +620,118 @@ def handle_file_upload(data):
         })
         return {'status': 'success', 'message': 'File uploaded successfully'}
     
-    return {'status': 'error', 'message': 'File type not allowed'}
\ No newline at end of file
+    return {'status': 'error', 'message': 'File type not allowed'}
+
+@socketio.on('rag_query')
+def handle_rag_query(data):
+    """Answer a RAG question, streaming rag_token frames then a final rag_answer with sources"""
+    if current_user.is_authenticated:
+        request_id = data.get('request_id')
+        try:
+            question = (data.get('query') or '').strip()
+            if not question:
+                emit('rag_answer', {
+                    'request_id': request_id,
+                    'error': 'No query provided',
+                    'answer': 'Please provide a query.',
+                    'sources': []
+                })
+                return
+
+            sid = request.sid
+
+            def send_token(token):
+                socketio.emit('rag_token', {'request_id': request_id, 'token': token}, to=sid)
+
+            result = rag_manager.query(question, session_id=current_user.id, on_token=send_token)
+            emit('rag_answer', {
+                'request_id': request_id,
+                'answer': result['answer'],
+                'sources': result.get('sources', []),
+                'error': result.get('error')
+            })
+
+        except RAGUnavailableError as e:
+            emit('rag_answer', {
+                'request_id': request_id,
+                'error': str(e),
+                'answer': 'The knowledge base is not available right now. Please try again shortly.',
+                'sources': []
+            })
+        except Exception as e:
+            logging.error(f"Error in handle_rag_query: {str(e)}")
+            emit('rag_answer', {
+                'request_id': request_id,
+                'error': str(e),
+                'answer': 'An error occurred while processing your query.',
+                'sources': []
+            })
+
+@socketio.on('upload_init')
+def handle_upload_init(data):
+    """Start or resume a chunked upload. Ack: {upload_id, offset, chunk_size, window} or {error}"""
+    if not current_user.is_authenticated:
+        return {'error': 'Not authenticated'}
+    try:
+        if not allowed_file(data['name']):
+            return {'error': f'File type not allowed. Allowed types: {", ".join(ALLOWED_EXTENSIONS)}'}
+        upload = chunked_uploads.start(current_user.id, data['name'], data['size'], data.get('upload_id'))
+        return {'upload_id': upload.upload_id, 'offset': upload.received, 'chunk_size': chunked_uploads.chunk_size,
+                'window': chunked_uploads.window_chunks}
+    except UploadError as e:
+        return {'error': str(e)}
+    except Exception as e:
+        logging.error(f"Error in handle_upload_init: {str(e)}")
+        return {'error': 'Failed to start upload'}
+
+@socketio.on('upload_chunk')
+def handle_upload_chunk(data):
+    """
+    Append one binary chunk. Ack: {offset} with the next offset to send.
+
+    Clients send the next chunk only after the previous ack. The server
+    itself rejects more than UPLOAD_WINDOW_CHUNKS concurrent chunks per
+    upload, and chunks starting more than one window past the written offset.
+    """
+    if not current_user.is_authenticated:
+        return {'error': 'Not authenticated'}
+    try:
+        offset = chunked_uploads.write_chunk(current_user.id, data['upload_id'], data['offset'], data['data'])
+        return {'offset': offset}
+    except UploadError as e:
+        return {'error': str(e)}
+    except Exception as e:
+        logging.error(f"Error in handle_upload_chunk: {str(e)}")
+        return {'error': 'Failed to write chunk'}
+
+@socketio.on('upload_commit')
+def handle_upload_commit(data):
+    """Finish an upload and post it as a message. Ack: {message_id} or {error}"""
+    if not current_user.is_authenticated:
+        return {'error': 'Not authenticated'}
+    try:
+        # Validate before commit(), which ends the session; a rejected commit can then be retried
+        filename = secure_filename(chunked_uploads.get(current_user.id, data['upload_id']).name)
+        if not allowed_file(filename):
+            return {'error': f'File type not allowed. Allowed types: {", ".join(ALLOWED_EXTENSIONS)}'}
+        channel_id = data.get('channel_id')
+        if channel_id is None or Channel.query.get(channel_id) is None:
+            return {'error': 'Unknown channel'}
+
+        part_path, _, digest = chunked_uploads.commit(current_user.id, data['upload_id'], data.get('sha256'))
+        digest, size = blob_store.adopt(part_path, digest)
+
+        message_data = save_and_broadcast_message(data, {
+            'filename': filename,
+            'filepath': f'/uploads/{digest}/{filename}',
+            'filetype': file_extension(filename),
+            'digest': digest,
+            'size': size
+        })
+        return {'message_id': message_data['id'], 'sha256': digest}
+    except UploadError as e:
+        return {'error': str(e)}
+    except Exception as e:
+        logging.error(f"Error in handle_upload_commit: {str(e)}")
+        db.session.rollback()
+        return {'error': 'Failed to send message'}
@@ -10,12 +10,7 @@ let processedMessageIds = new Set(); // Track processed message IDs
 fileInput.addEventListener('change', async (e) => {
     const file = e.target.files[0];
     if (file) {
-        if (file.size > 16 * 1024 * 1024) { // 16MB limit
-            alert('File size must be less than 16MB');
-            fileInput.value = '';
-            selectedFile = null;
-            return;
-        }
+        // Size and type limits are checked by the server when the upload starts
         selectedFile = file;
         
         // If a file is selected without a message, send it immediately
@@ -58,49 +53,104 @@ async function sendMessage(content, channelId) {
     };
 
     if (selectedFile) {
+        const file = selectedFile;
+        fileInput.value = '';
+        selectedFile = null;
         try {
-            // Convert file to base64
-            const base64Data = await new Promise((resolve, reject) => {
-                const reader = new FileReader();
-                reader.onload = () => resolve(reader.result);
-                reader.onerror = () => reject(reader.error);
-                reader.readAsDataURL(selectedFile);
-            });
-
-            messageData.file = {
-                name: selectedFile.name,
-                type: selectedFile.type,
-                data: base64Data
-            };
+            const result = await uploadFile(file, messageData);
+            if (result.error) {
+                alert(result.error);
+            }
         } catch (error) {
-            console.error('Error processing file:', error);
-            alert('Failed to process file');
-            return;
+            console.error('Error uploading file:', error);
+            alert('Failed to upload file');
         }
+        return;
     }
 
     try {
         // Emit the message through socket.io
         socket.emit('message', messageData);
-        
-        // Clear the file input and selected file
-        if (selectedFile) {
-            fileInput.value = '';
-            selectedFile = null;
-        }
     } catch (error) {
         console.error('Error sending message:', error);
         alert('Failed to send message');
     }
 }
 
+// Emit an event and resolve with the server's ack. Rejects if the socket
+// drops or the server does not answer in time, so the caller can resume.
+function emitWithAck(event, data, timeoutMs = 30000) {
+    return new Promise((resolve, reject) => {
+        const timer = setTimeout(() => reject(new Error(`${event} timed out`)), timeoutMs);
+        socket.emit(event, data, (response) => {
+            clearTimeout(timer);
+            resolve(response);
+        });
+    });
+}
+
+function waitForConnection() {
+    if (socket.connected) {
+        return Promise.resolve();
+    }
+    return new Promise((resolve) => socket.once('connect', resolve));
+}
+
+// Upload a file with the chunked upload protocol and post it as a message.
+// Each chunk waits for the previous ack, and after a reconnect upload_init is
+// repeated with the same upload_id to resume at the offset the server has.
+async function uploadFile(file, messageData, maxRetries = 5) {
+    let uploadId = null;
+    let retries = 0;
+
+    while (true) {
+        try {
+            await waitForConnection();
+            const init = await emitWithAck('upload_init', {
+                name: file.name,
+                size: file.size,
+                upload_id: uploadId
+            });
+            if (init.error) {
+                return init;
+            }
+            uploadId = init.upload_id;
+
+            let offset = init.offset;
+            while (offset < file.size) {
+                const chunk = await file.slice(offset, offset + init.chunk_size).arrayBuffer();
+                const ack = await emitWithAck('upload_chunk', {
+                    upload_id: uploadId,
+                    offset: offset,
+                    data: chunk
+                });
+                if (ack.error) {
+                    return ack;
+                }
+                offset = ack.offset;
+            }
+
+            return await emitWithAck('upload_commit', {
+                ...messageData,
+                upload_id: uploadId
+            });
+        } catch (error) {
+            if (++retries > maxRetries) {
+                throw error;
+            }
+            console.warn(`Upload interrupted, resuming (${error.message})`);
+        }
+    }
+}
+
 // Update the channel switching function to store current channel
 function switchChannel(channelId) {
     if (currentChannelId) {
         socket.emit('leave', { channel: currentChannelId });
     }
     currentChannelId = channelId;
-    socket.emit('join', { channel: channelId });
+    // Ask for history as message_batch frames instead of one event per message
+    socket.emit('join', { channel: channelId, supports_batch: true });
     // Clear processed message IDs when switching channels
     processedMessageIds.clear();
 }
@@ -180,6 +230,32 @@ function formatTimestamp(timestamp) {
     return date.toLocaleString();
 }
 
+// Unpack a history page and hand each message to the regular 'message' handlers
+socket.on('message_batch', (batch) => {
+    const handlers = socket.listeners('message');
+    batch.messages.forEach((message) => {
+        handlers.forEach((handler) => handler(message));
+    });
+});
+
+// Presence arrives as periodic diffs (and a snapshot on connect); hand each
+// entry to the regular 'status_change' handlers
+function dispatchStatusChanges(userIds, status) {
+    const handlers = socket.listeners('status_change');
+    userIds.forEach((userId) => {
+        handlers.forEach((handler) => handler({ user_id: userId, status: status }));
+    });
+}
+
+socket.on('presence_snapshot', (snapshot) => {
+    dispatchStatusChanges(snapshot.online, 'online');
+});
+
+socket.on('status_changes', (changes) => {
+    dispatchStatusChanges(changes.online, 'online');
+    dispatchStatusChanges(changes.offline, 'offline');
+});
+
 // Add socket error handler
 socket.on('error', (error) => {
     console.error('Socket error:', error);
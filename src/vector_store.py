@@ -0,0 +1,361 @@
+"""
+Vector store backends for the RAG system.
+
+Both backends accept Pinecone-style vectors ({"id", "values", "metadata"})
+through upsert() and expose a LangChain retriever through as_retriever(), so
+RAGManager does not care which one is configured:
+
+- pinecone: the hosted Pinecone index (default)
+- local:    an in-process store backed by a memory-mapped NumPy matrix, for
+            small deployments, offline development and CI
+"""
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from cooperative import run_blocking
+
+logger = logging.getLogger(__name__)
+
+VECTOR_STORE = os.getenv("VECTOR_STORE", "pinecone")
+LOCAL_VECTOR_STORE_PATH = os.getenv(
+    "LOCAL_VECTOR_STORE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "vector_store")
+)
+# Switch from brute force to an HNSW index (if hnswlib is installed) above this many vectors
+ANN_THRESHOLD = int(os.getenv("LOCAL_VECTOR_ANN_THRESHOLD", 50000))
+
+class PineconeBackend:
+    """Vectors stored in a hosted Pinecone index"""
+
+    def __init__(self, embeddings: Embeddings, index_name: str, namespace: str):
+        from langchain_community.vectorstores import Pinecone
+        from pinecone import Pinecone as PineconeClient, ServerlessSpec
+
+        api_key = os.getenv("PINECONE_API_KEY")
+        if not api_key:
+            raise ValueError("PINECONE_API_KEY environment variable is not set")
+        pc = PineconeClient(api_key=api_key)
+        self.namespace = namespace
+
+        try:
+            # Get list of existing indexes
+            existing_indexes = [index_info['name'] for index_info in pc.list_indexes()]
+            logger.info(f"Existing Pinecone indexes: {existing_indexes}")
+
+            # Create index if it doesn't exist
+            if index_name not in existing_indexes:
+                logger.info(f"Creating new Pinecone index: {index_name}")
+                pc.create_index(
+                    name=index_name,
+                    dimension=1536,  # OpenAI embedding dimension
+                    metric='cosine',
+                    spec=ServerlessSpec(
+                        cloud='aws',
+                        region='us-west-2'
+                    )
+                )
+                # Wait for index to be ready
+                while not pc.describe_index(index_name).status['ready']:
+                    time.sleep(1)
+
+            self.index = pc.Index(index_name)
+            logger.info(f"Successfully connected to Pinecone index: {index_name}")
+
+            self.vectorstore = Pinecone.from_existing_index(
+                index_name=index_name,
+                embedding=embeddings,
+                namespace=namespace
+            )
+
+        except Exception as e:
+            logger.error(f"Error initializing Pinecone: {str(e)}", exc_info=True)
+            raise
+
+    def upsert(self, vectors: List[Dict]):
+        return self.index.upsert(vectors=vectors, namespace=self.namespace)
+
+    def as_retriever(self, **kwargs):
+        return self.vectorstore.as_retriever(**kwargs)
+
+class LocalVectorStore(VectorStore):
+    """
+    In-process vector store for cosine similarity search.
+
+    Vectors are L2-normalized and appended to a float32 file that is
+    memory-mapped for queries, so search is a single matrix-vector product.
+    IDs and metadata go to an append-only JSON-lines log, one record per
+    upserted vector, so a batch costs only its own rows. The log is compacted
+    (rewritten and swapped in with os.replace) once it has grown to twice the
+    number of live vectors.
+
+    Rows are fsynced to the matrix before their records reach the log, so the
+    log is the commit record. On load, matrix rows past the last logged
+    position, and a torn last log line, are left over from a crash and are cut
+    off. Upserting an existing ID overwrites its row in place. Once the store
+    holds ANN_THRESHOLD vectors and hnswlib is installed, queries go through
+    an HNSW index, built on load and kept up to date by upserts.
+    """
+
+    def __init__(self, embedding: Embeddings, path: str = LOCAL_VECTOR_STORE_PATH, text_key: str = "text"):
+        self._embedding = embedding
+        self.path = path
+        self.text_key = text_key
+        self._lock = threading.Lock()
+        self._matrix_path = os.path.join(path, "vectors.f32")
+        self._log_path = os.path.join(path, "metadata.jsonl")
+        self._legacy_index_path = os.path.join(path, "index.json")  # Whole-store sidecar used before the log
+        os.makedirs(path, exist_ok=True)
+
+        self.dim = None
+        self.ids: List[str] = []
+        self.metadatas: List[Dict] = []
+        self._positions: Dict[str, int] = {}
+        self._log_records = 0
+        self._matrix = None
+        self._ann = None
+        self._load()
+        logger.info(f"Local vector store at {path} holds {len(self.ids)} vectors")
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    def _load(self):
+        """Replay the metadata log, drop uncommitted matrix rows and build the ANN index"""
+        if os.path.exists(self._log_path):
+            self._replay_log()
+        elif os.path.exists(self._legacy_index_path):
+            with open(self._legacy_index_path) as f:
+                state = json.load(f)
+            self.dim = state["dim"]
+            self.ids = state["ids"]
+            self.metadatas = state["metadatas"]
+            self._compact_log()
+            os.remove(self._legacy_index_path)
+        self._positions = {vector_id: i for i, vector_id in enumerate(self.ids)}
+
+        committed_bytes = len(self.ids) * (self.dim or 0) * np.dtype(np.float32).itemsize
+        if os.path.exists(self._matrix_path) and os.path.getsize(self._matrix_path) > committed_bytes:
+            logger.warning(f"Dropping {os.path.getsize(self._matrix_path) - committed_bytes} bytes of "
+                           f"uncommitted vectors from {self._matrix_path}")
+            with open(self._matrix_path, "r+b") as f:
+                f.truncate(committed_bytes)
+
+        self._remap()
+        self._update_ann([], len(self.ids))
+
+    def _replay_log(self):
+        valid_bytes = 0
+        with open(self._log_path, "rb") as f:
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("missing newline")
+                    record = json.loads(line)
+                except ValueError:
+                    logger.warning(f"Ignoring a torn record at the end of {self._log_path}")
+                    break
+                valid_bytes += len(line)
+                self._log_records += 1
+                if "dim" in record:
+                    self.dim = record["dim"]
+                elif record["position"] == len(self.ids):
+                    self.ids.append(record["id"])
+                    self.metadatas.append(record["metadata"])
+                else:
+                    self.metadatas[record["position"]] = record["metadata"]
+
+        if valid_bytes < os.path.getsize(self._log_path):
+            # Appending after a partial line would corrupt the next record
+            with open(self._log_path, "r+b") as f:
+                f.truncate(valid_bytes)
+
+    @staticmethod
+    def _write_records(f, records: List[Dict]):
+        f.write("".join(json.dumps(record) + "\n" for record in records))
+        f.flush()
+        os.fsync(f.fileno())
+
+    def _append_log(self, records: List[Dict]):
+        if self._log_records == 0:
+            records = [{"dim": self.dim}] + records
+        with open(self._log_path, "a") as f:
+            self._write_records(f, records)
+        self._log_records += len(records)
+
+    def _compact_log(self):
+        records = [{"dim": self.dim}] + [
+            {"id": vector_id, "position": position, "metadata": metadata}
+            for position, (vector_id, metadata) in enumerate(zip(self.ids, self.metadatas))
+        ]
+        tmp_path = self._log_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            self._write_records(f, records)
+        os.replace(tmp_path, self._log_path)
+        self._log_records = len(records)
+
+    def _remap(self):
+        if self.ids:
+            self._matrix = np.memmap(self._matrix_path, dtype=np.float32, mode="r", shape=(len(self.ids), self.dim))
+        else:
+            self._matrix = None
+
+    def upsert(self, vectors: List[Dict]):
+        """Insert or overwrite Pinecone-style vectors"""
+        if not vectors:
+            return {"upserted_count": 0}
+
+        values = np.asarray([vector["values"] for vector in vectors], dtype=np.float32)
+        norms = np.linalg.norm(values, axis=1, keepdims=True)
+        values = values / np.where(norms == 0, 1, norms)
+
+        with self._lock:
+            if self.dim is None:
+                self.dim = values.shape[1]
+            elif values.shape[1] != self.dim:
+                raise ValueError(f"Vector dimension {values.shape[1]} does not match store dimension {self.dim}")
+
+            first_new = len(self.ids)
+            updates = []
+            appended = []
+            pending = {}  # Positions given to new IDs in this call
+            records = {}
+            for row, vector in zip(values, vectors):
+                vector_id = vector["id"]
+                position = self._positions.get(vector_id, pending.get(vector_id))
+                if position is None:
+                    position = pending[vector_id] = first_new + len(appended)
+                    appended.append(row)
+                elif position >= first_new:
+                    # A new ID repeated within one call: last write wins
+                    appended[position - first_new] = row
+                else:
+                    updates.append((position, row))
+                records[vector_id] = {"id": vector_id, "position": position, "metadata": vector.get("metadata", {})}
+            records = list(records.values())
+
+            if updates:
+                matrix = np.memmap(self._matrix_path, dtype=np.float32, mode="r+", shape=(first_new, self.dim))
+                for position, row in updates:
+                    matrix[position] = row
+                matrix.flush()
+                del matrix
+            if appended:
+                with open(self._matrix_path, "ab") as f:
+                    f.write(np.asarray(appended, dtype=np.float32).tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+
+            # The rows are durable; logging their records commits them
+            self._append_log(records)
+            for record in records:
+                if record["position"] == len(self.ids):
+                    self._positions[record["id"]] = record["position"]
+                    self.ids.append(record["id"])
+                    self.metadatas.append(record["metadata"])
+                else:
+                    self.metadatas[record["position"]] = record["metadata"]
+            # Overwritten IDs leave superseded records behind; rewrite once they dominate
+            if self._log_records > 2 * len(self.ids) + 1000:
+                self._compact_log()
+
+            self._remap()
+            self._update_ann(updates, first_new)
+        return {"upserted_count": len(vectors)}
+
+    def _update_ann(self, updates: List[Tuple[int, np.ndarray]], first_new: int):
+        if len(self.ids) < ANN_THRESHOLD:
+            return
+        try:
+            import hnswlib
+        except ImportError:
+            return
+
+        if self._ann is None:
+            self._ann = hnswlib.Index(space="ip", dim=self.dim)
+            self._ann.init_index(max_elements=max(len(self.ids) * 2, 1024), ef_construction=200, M=16)
+            self._ann.add_items(np.asarray(self._matrix), np.arange(len(self.ids)))
+            self._ann.set_ef(64)
+            logger.info(f"Built HNSW index over {len(self.ids)} vectors")
+            return
+
+        if len(self.ids) > self._ann.get_max_elements():
+            self._ann.resize_index(len(self.ids) * 2)
+        if updates:
+            positions = [position for position, _ in updates]
+            self._ann.add_items(np.asarray([row for _, row in updates]), positions)
+        if first_new < len(self.ids):
+            self._ann.add_items(np.asarray(self._matrix[first_new:]), np.arange(first_new, len(self.ids)))
+
+    def query_vector(self, embedding: List[float], k: int = 4) -> List[Tuple[int, float]]:
+        """Return (position, cosine similarity) of the k nearest stored vectors"""
+        with self._lock:
+            if self._matrix is None:
+                return []
+            query = np.asarray(embedding, dtype=np.float32)
+            query = query / (np.linalg.norm(query) or 1)
+            k = min(k, len(self.ids))
+
+            if self._ann is not None:
+                labels, distances = self._ann.knn_query(query, k=k)
+                return [(int(label), 1.0 - float(distance)) for label, distance in zip(labels[0], distances[0])]
+
+            # A full scan is pure NumPy; keep it off the event loop in greenlet modes
+            scores = run_blocking(np.dot, self._matrix, query)
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [(int(position), float(scores[position])) for position in top]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        results = []
+        for position, score in self.query_vector(self._embedding.embed_query(query), k):
+            metadata = dict(self.metadatas[position])
+            text = metadata.pop(self.text_key, "")
+            results.append((Document(page_content=text, metadata=metadata), score))
+        return results
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [document for document, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def _select_relevance_score_fn(self):
+        return lambda score: score
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[Dict]] = None,
+                  ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        from embedding_cache import chunk_id
+
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [chunk_id(text, metadata) for text, metadata in zip(texts, metadatas)]
+        embeddings = self._embedding.embed_documents(texts)
+        self.upsert([{
+            "id": vector_id,
+            "values": embedding,
+            "metadata": {**metadata, self.text_key: text}
+        } for vector_id, text, metadata, embedding in zip(ids, texts, metadatas, embeddings)])
+        return ids
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[Dict]] = None,
+                   **kwargs: Any) -> "LocalVectorStore":
+        store = cls(embedding, **kwargs)
+        store.add_texts(texts, metadatas)
+        return store
+
+def create_vector_store(embeddings: Embeddings, index_name: str, namespace: str):
+    """Build the backend selected by the VECTOR_STORE environment variable"""
+    logger.info(f"Using {VECTOR_STORE} vector store")
+    if VECTOR_STORE == "local":
+        return LocalVectorStore(embeddings)
+    if VECTOR_STORE == "pinecone":
+        return PineconeBackend(embeddings, index_name, namespace)
+    raise ValueError(f"Unknown VECTOR_STORE: {VECTOR_STORE}")
@@ -0,0 +1,17 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+# app reads its configuration from the environment when it is first imported
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='teamflow-tests-'), 'test.db')
+os.environ['SOCKETIO_ASYNC_MODE'] = 'threading'
+os.environ['RAG_WARMUP'] = 'false'
+
+@pytest.fixture(scope='session')
+def db():
+    from app import db
+    return db
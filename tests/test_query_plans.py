@@ -0,0 +1,31 @@
+import os
+
+import pytest
+from sqlalchemy import create_engine
+
+from query_plans import _is_full_scan, check_query_plans
+
+@pytest.mark.parametrize('detail, full_scan', [
+    ('SCAN message', True),
+    ('SCAN TABLE message', True),  # SQLite before 3.36
+    ('SCAN message USING INDEX ix_message_user_timestamp', False),
+    ('SCAN TABLE message USING COVERING INDEX ix_message_channel_user', False),
+    ('SEARCH message USING INDEX ix_message_channel_timestamp (channel_id=?)', False),
+    ('SCAN message_archive', False),
+    ('USE TEMP B-TREE FOR ORDER BY', False),
+])
+def test_is_full_scan(detail, full_scan):
+    assert _is_full_scan(detail, 'message') == full_scan
+
+def test_hot_queries_use_an_index_on_sqlite(db):
+    assert check_query_plans(db.engine) == []
+
+@pytest.mark.skipif(not os.environ.get('TEST_DATABASE_URL'),
+                    reason='set TEST_DATABASE_URL to a scratch PostgreSQL database')
+def test_hot_queries_use_an_index_on_postgres(db):
+    engine = create_engine(os.environ['TEST_DATABASE_URL'])
+    try:
+        db.metadata.create_all(engine)
+        assert check_query_plans(engine) == []
+    finally:
+        engine.dispose()